@@ -0,0 +1,53 @@
+"""Drop export_jobs
+
+La table export_jobs des exports groupés a été remplacée par la table
+générique jobs (app.jobs) ; les bases qui l'ont créée entre-temps la gardent
+sans qu'elle soit plus lue ni écrite. Supprimée si elle existe.
+
+Revision ID: a4d8c2e61b37
+Revises: b2f4e8a91c63
+Create Date: 2026-10-19 18:21:05.613920
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4d8c2e61b37'
+down_revision: Union[str, Sequence[str], None] = 'b2f4e8a91c63'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if "export_jobs" in sa.inspect(op.get_bind()).get_table_names():
+        op.drop_index("ix_export_jobs_status", table_name="export_jobs", if_exists=True)
+        op.drop_index("ix_export_jobs_user_id", table_name="export_jobs", if_exists=True)
+        op.drop_index("ix_export_jobs_id", table_name="export_jobs", if_exists=True)
+        op.drop_table("export_jobs")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_table(
+        "export_jobs",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("status", sa.String(), nullable=False),
+        sa.Column("total", sa.Integer(), nullable=True),
+        sa.Column("completed", sa.Integer(), nullable=True),
+        sa.Column("file_path", sa.String(), nullable=True),
+        sa.Column("error", sa.Text(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=True),
+        sa.Column("updated_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_export_jobs_id", "export_jobs", ["id"])
+    op.create_index("ix_export_jobs_user_id", "export_jobs", ["user_id"])
+    op.create_index("ix_export_jobs_status", "export_jobs", ["status"])
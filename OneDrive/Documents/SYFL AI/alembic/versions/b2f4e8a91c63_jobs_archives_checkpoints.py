@@ -0,0 +1,90 @@
+"""Jobs, conversation archives and write-behind checkpoints
+
+Tables ajoutées avec les jobs d'arrière-plan (app.jobs), l'archivage des
+conversations inactives (app.archive) et les écritures différées
+(app.write_behind). Les bases créées par create_all les ont déjà : seules
+les tables absentes sont créées.
+
+Revision ID: b2f4e8a91c63
+Revises: e7a2b94c1f05
+Create Date: 2026-10-19 20:02:11.408137
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2f4e8a91c63'
+down_revision: Union[str, Sequence[str], None] = 'e7a2b94c1f05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+JOB_INDEXES = ("id", "kind", "user_id", "status", "run_after")
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    existing_tables = set(sa.inspect(op.get_bind()).get_table_names())
+
+    if "jobs" not in existing_tables:
+        op.create_table(
+            "jobs",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("kind", sa.String(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=True),
+            sa.Column("status", sa.String(), nullable=False),
+            sa.Column("priority", sa.Integer(), nullable=False),
+            sa.Column("payload", sa.JSON(), nullable=True),
+            sa.Column("result", sa.JSON(), nullable=True),
+            sa.Column("attempts", sa.Integer(), nullable=False),
+            sa.Column("max_attempts", sa.Integer(), nullable=False),
+            sa.Column("last_error", sa.Text(), nullable=True),
+            sa.Column("progress_current", sa.Integer(), nullable=True),
+            sa.Column("progress_total", sa.Integer(), nullable=True),
+            sa.Column("run_after", sa.DateTime(), nullable=True),
+            sa.Column("locked_by", sa.String(), nullable=True),
+            sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("started_at", sa.DateTime(), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+        for column in JOB_INDEXES:
+            op.create_index(f"ix_jobs_{column}", "jobs", [column])
+
+    if "conversation_archives" not in existing_tables:
+        op.create_table(
+            "conversation_archives",
+            sa.Column("conversation_id", sa.Integer(), nullable=False),
+            sa.Column("codec", sa.String(), nullable=False),
+            sa.Column("payload", sa.LargeBinary(), nullable=False),
+            sa.Column("message_count", sa.Integer(), nullable=False),
+            sa.Column("role_counts", sa.JSON(), nullable=False),
+            sa.Column("last_message_id", sa.Integer(), nullable=True),
+            sa.Column("raw_size", sa.Integer(), nullable=False),
+            sa.Column("archived_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["conversation_id"], ["conversations.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("conversation_id"),
+        )
+
+    if "write_behind_checkpoints" not in existing_tables:
+        op.create_table(
+            "write_behind_checkpoints",
+            sa.Column("slot", sa.String(), nullable=False),
+            sa.Column("seq", sa.Integer(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("slot"),
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("write_behind_checkpoints")
+    op.drop_table("conversation_archives")
+    for column in reversed(JOB_INDEXES):
+        op.drop_index(f"ix_jobs_{column}", table_name="jobs")
+    op.drop_table("jobs")
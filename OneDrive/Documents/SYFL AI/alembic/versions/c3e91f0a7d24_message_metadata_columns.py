@@ -0,0 +1,148 @@
+"""Message metadata columns
+
+Colonnes typées et indexées sur messages (cas détecté, confiance, origine,
+modèle, tokens, latence) à la place des clés de extra_data. Les lignes
+existantes sont reprises par lots de MIGRATION_BATCH_SIZE messages
+(pagination sur l'id) : mémoire et taille des requêtes bornées quelle que
+soit la taille de la table.
+
+Revision ID: c3e91f0a7d24
+Revises: 5b79a3bf50e5
+Create Date: 2026-10-19 09:12:44.518203
+
+"""
+import os
+from typing import Dict, Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3e91f0a7d24'
+down_revision: Union[str, Sequence[str], None] = '5b79a3bf50e5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Messages lus et mis à jour par requête pendant la reprise
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+
+COLUMNS = [
+    ("case_id", sa.String()),
+    ("confidence", sa.Float()),
+    ("source", sa.String()),
+    ("model", sa.String()),
+    ("prompt_tokens", sa.Integer()),
+    ("completion_tokens", sa.Integer()),
+    ("latency_ms", sa.Integer()),
+]
+INDEXED_COLUMNS = ("case_id", "source", "model")
+
+# Clé de extra_data -> colonne (seules clés écrites par send_message jusqu'ici)
+EXTRA_DATA_KEYS: Dict[str, str] = {
+    "case_detected": "case_id",
+    "confidence": "confidence",
+    "source": "source",
+}
+
+messages = sa.table(
+    "messages",
+    sa.column("id", sa.Integer),
+    sa.column("extra_data", sa.JSON(none_as_null=True)),
+    sa.column("case_id", sa.String),
+    sa.column("confidence", sa.Float),
+    sa.column("source", sa.String),
+)
+
+
+def _batches(bind, condition):
+    """Messages (id, extra_data, case_id, confidence, source) par lots, dans l'ordre des id"""
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(messages).where(messages.c.id > last_id, condition)
+            .order_by(messages.c.id).limit(MIGRATION_BATCH_SIZE)
+        ).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1].id
+
+
+def _update(bind, values):
+    if values:
+        bind.execute(
+            messages.update().where(messages.c.id == sa.bindparam("_id")).values(
+                extra_data=sa.bindparam("extra_data"),
+                case_id=sa.bindparam("case_id"),
+                confidence=sa.bindparam("confidence"),
+                source=sa.bindparam("source"),
+            ),
+            values
+        )
+
+
+def backfill(bind):
+    """Déplace les clés de extra_data dans leurs colonnes"""
+    for rows in _batches(bind, messages.c.extra_data.isnot(None)):
+        values = []
+        for row in rows:
+            extra_data = row.extra_data
+            if not isinstance(extra_data, dict) or not EXTRA_DATA_KEYS.keys() & extra_data.keys():
+                continue
+            remaining = {key: value for key, value in extra_data.items() if key not in EXTRA_DATA_KEYS}
+            moved = {column: extra_data.get(key) for key, column in EXTRA_DATA_KEYS.items()}
+            values.append({"_id": row.id, "extra_data": remaining or None, **moved})
+        _update(bind, values)
+
+
+def restore_extra_data(bind):
+    """Inverse de backfill : remet les colonnes dans extra_data"""
+    condition = sa.or_(*(messages.c[column].isnot(None) for column in EXTRA_DATA_KEYS.values()))
+    for rows in _batches(bind, condition):
+        values = [
+            {
+                "_id": row.id,
+                "extra_data": {
+                    **(row.extra_data or {}),
+                    **{
+                        key: row._mapping[column]
+                        for key, column in EXTRA_DATA_KEYS.items() if row._mapping[column] is not None
+                    },
+                },
+                "case_id": None,
+                "confidence": None,
+                "source": None,
+            }
+            for row in rows
+        ]
+        _update(bind, values)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    # Bases créées par create_all avec le modèle à jour : colonnes et index déjà présents
+    existing_columns = {column["name"] for column in inspector.get_columns("messages")}
+    existing_indexes = {index["name"] for index in inspector.get_indexes("messages")}
+
+    with op.batch_alter_table("messages") as batch_op:
+        for name, type_ in COLUMNS:
+            if name not in existing_columns:
+                batch_op.add_column(sa.Column(name, type_, nullable=True))
+    for name in INDEXED_COLUMNS:
+        if f"ix_messages_{name}" not in existing_indexes:
+            op.create_index(f"ix_messages_{name}", "messages", [name])
+
+    backfill(bind)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    restore_extra_data(op.get_bind())
+    for name in INDEXED_COLUMNS:
+        op.drop_index(f"ix_messages_{name}", table_name="messages")
+    with op.batch_alter_table("messages") as batch_op:
+        for name, _ in reversed(COLUMNS):
+            batch_op.drop_column(name)
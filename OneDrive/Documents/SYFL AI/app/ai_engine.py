@@ -1,51 +1,314 @@
 """
 Moteur IA avec Mistral pour SYFL AI
+
+Les appels au LLM passent par un disjoncteur et une limite de concurrence :
+quand Mistral échoue en série ou que trop de requêtes attendent, la réponse
+est construite localement à partir de la base de connaissances (voir
+app.fallback) au lieu d'échouer.
 """
-from mistralai import Mistral
+import os
+import threading
+import time
 from loguru import logger
-from typing import List, Dict, Optional
-import json
+from typing import Dict, Generator, List, NamedTuple, Optional, Tuple
+
+from app.fallback import FallbackEngine
+from app.knowledge_base import EMPTY_SNAPSHOT, KnowledgeSnapshot, build_snapshot, normalize_cases
+from app.metrics import LLM_LATENCY, LLM_TOKENS, LLM_UNAVAILABLE
+from app.timing import record_span, span
+
+# Appels simultanés au LLM, au-delà les requêtes attendent un créneau
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Attente maximale d'un créneau avant de répondre depuis la base de connaissances (secondes)
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "2"))
+# Échecs consécutifs qui ouvrent le disjoncteur
+LLM_CIRCUIT_FAILURES = int(os.getenv("LLM_CIRCUIT_FAILURES", "5"))
+# Durée d'ouverture du disjoncteur avant un nouvel essai (secondes)
+LLM_CIRCUIT_RESET = float(os.getenv("LLM_CIRCUIT_RESET", "30"))
+
+# Origine d'une réponse
+SOURCE_LLM = "llm"
+SOURCE_KNOWLEDGE_BASE = "knowledge_base"
+
+
+class LLMUnavailable(Exception):
+    """Le LLM n'est pas appelé (disjoncteur ouvert ou file saturée)"""
+
+
+class CircuitBreaker:
+    """
+    Disjoncteur : après `failure_threshold` échecs consécutifs, les appels
+    sont refusés pendant `reset_timeout` secondes, puis un seul appel
+    d'essai est autorisé (semi-ouvert) ; son succès referme le circuit.
+    """
+
+    def __init__(self, failure_threshold: int = LLM_CIRCUIT_FAILURES, reset_timeout: float = LLM_CIRCUIT_RESET):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """"closed", "open" ou "half_open" """
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half_open"
+
+    def allow(self) -> bool:
+        """Indique si un appel peut être tenté"""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def cancel_trial(self):
+        """Libère l'appel d'essai autorisé par allow() sans l'avoir effectué"""
+        with self._lock:
+            self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                if self.opened_at is None:
+                    logger.warning(f"⚠️ Disjoncteur LLM ouvert après {self.failures} échecs")
+                self.opened_at = time.monotonic()
+
+
+class Completion(NamedTuple):
+    """Réponse brute du LLM et sa consommation"""
+    content: str
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    latency_ms: Optional[int] = None
+
+
+class AIReply(NamedTuple):
+    """
+    Réponse générée et son origine (SOURCE_LLM ou SOURCE_KNOWLEDGE_BASE)
+
+    Le modèle, les tokens et la latence ne sont renseignés que pour les
+    réponses du LLM.
+    """
+    content: str
+    source: str
+    model: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    latency_ms: Optional[int] = None
 
 
 class AIEngine:
     """Moteur IA pour détecter les cas juridiques et générer des réponses"""
     
-    def __init__(self, api_key: str, model: str = "mistral-small-latest"):
+    def __init__(self, api_key: str, model: str = "mistral-small-latest", client=None):
         """
         Initialise le moteur IA
         
         Args:
             api_key: Clé API Mistral
             model: Modèle à utiliser
+            client: Client compatible Mistral (ex: app.fake_llm.FakeMistral), optionnel
         """
-        self.client = Mistral(api_key=api_key)
+        # Le SDK Mistral (long à importer) n'est chargé qu'au premier appel
+        self.api_key = api_key
+        self._client = client
+        self._client_lock = threading.Lock()
         self.model = model
-        self.knowledge_base = {}
+        self.snapshot = EMPTY_SNAPSHOT
+        self.fallback = FallbackEngine(EMPTY_SNAPSHOT)
+        self.circuit = CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
         logger.info(f"AIEngine initialisé avec {model}")
     
+    @property
+    def client(self):
+        """Client Mistral, créé au premier appel au LLM"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from mistralai import Mistral
+                    self._client = Mistral(api_key=self.api_key)
+        return self._client
+    
+    @client.setter
+    def client(self, client):
+        self._client = client
+    
+    @property
+    def knowledge_base(self):
+        """Cas juridiques de l'instantané courant"""
+        return self.snapshot.cases
+    
     def load_knowledge_base(self, cases: Dict[str, Dict]):
         """Charge la base de connaissances des cas juridiques"""
-        self.knowledge_base = cases
-        logger.info(f"Base de connaissances chargée: {len(cases)} cas")
+        cases, aliases = normalize_cases(cases)
+        self.use_snapshot(build_snapshot(cases, version=self.snapshot.version + 1, aliases=aliases))
+    
+    def use_snapshot(self, snapshot: KnowledgeSnapshot):
+        """Remplace atomiquement la base de connaissances (rechargement à chaud)"""
+        # Index de secours construit avant la bascule : jamais d'instantané sans index
+        fallback = FallbackEngine.for_snapshot(snapshot)
+        self.snapshot, self.fallback = snapshot, fallback
+        logger.info(f"Base de connaissances chargée: {len(snapshot)} cas (v{snapshot.version})")
+    
+    def _acquire_slot(self, task: str):
+        """
+        Réserve un créneau d'appel au LLM (à libérer par self._slots.release())
+
+        Raises:
+            LLMUnavailable: Circuit ouvert ou aucun créneau libre à temps
+        """
+        if not self.circuit.allow():
+            LLM_UNAVAILABLE.labels(task, "circuit_open").inc()
+            raise LLMUnavailable("disjoncteur ouvert")
+        with span("llm_wait"):
+            acquired = self._slots.acquire(timeout=LLM_QUEUE_TIMEOUT)
+        if not acquired:
+            # Pas un échec de Mistral : le circuit n'est pas pénalisé
+            self.circuit.cancel_trial()
+            LLM_UNAVAILABLE.labels(task, "saturated").inc()
+            raise LLMUnavailable("file d'attente saturée")
     
-    def detect_case(self, user_message: str) -> Optional[str]:
+    def _record_usage(self, task: str, usage) -> Tuple[Optional[int], Optional[int]]:
+        prompt_tokens = getattr(usage, "prompt_tokens", None)
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        if usage is not None:
+            LLM_TOKENS.labels(task, self.model, "prompt").inc(prompt_tokens or 0)
+            LLM_TOKENS.labels(task, self.model, "completion").inc(completion_tokens or 0)
+        return prompt_tokens, completion_tokens
+    
+    def _complete(self, task: str, messages: List[Dict], temperature: float, max_tokens: int) -> Completion:
+        """
+        Appelle le LLM à travers le disjoncteur et la limite de concurrence
+
+        Args:
+            task: Nom de la tâche pour les métriques (detect_case, generate_response)
+
+        Raises:
+            LLMUnavailable: Circuit ouvert ou aucun créneau libre à temps
+            Exception: Erreur de l'API (comptée comme un échec)
+        """
+        self._acquire_slot(task)
+        start = time.perf_counter()
+        try:
+            response = self.client.chat.complete(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+            content = response.choices[0].message.content
+        except Exception:
+            record_span(f"llm_{task}", time.perf_counter() - start)
+            LLM_LATENCY.labels(task, self.model, "error").observe(time.perf_counter() - start)
+            self.circuit.record_failure()
+            raise
+        finally:
+            self._slots.release()
+        elapsed = time.perf_counter() - start
+        record_span(f"llm_{task}", elapsed)
+        LLM_LATENCY.labels(task, self.model, "success").observe(elapsed)
+        prompt_tokens, completion_tokens = self._record_usage(task, getattr(response, "usage", None))
+        self.circuit.record_success()
+        return Completion(content, prompt_tokens, completion_tokens, round(elapsed * 1000))
+    
+    def _stream(
+        self,
+        task: str,
+        messages: List[Dict],
+        temperature: float,
+        max_tokens: int,
+        cancel: Optional[threading.Event] = None
+    ) -> Generator[str, None, Completion]:
+        """
+        Comme _complete, mais produit le texte au fil de l'eau
+
+        Si `cancel` est positionné, la lecture s'arrête au fragment suivant ;
+        fermer le générateur (close()) l'arrête aussitôt. Dans les deux cas la
+        connexion à Mistral est fermée et le créneau libéré.
+
+        Returns:
+            Completion du texte produit (partiel si annulé)
+        """
+        self._acquire_slot(task)
+        start = time.perf_counter()
+        parts: List[str] = []
+        usage = None
+        outcome = "success"
+        try:
+            with self.client.chat.stream(
+                model=self.model,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens
+            ) as events:
+                for event in events:
+                    if cancel is not None and cancel.is_set():
+                        outcome = "cancelled"
+                        break
+                    chunk = event.data
+                    usage = getattr(chunk, "usage", None) or usage
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if isinstance(delta, str) and delta:
+                        parts.append(delta)
+                        yield delta
+        except GeneratorExit:
+            outcome = "cancelled"
+            raise
+        except Exception:
+            outcome = "error"
+            raise
+        finally:
+            self._slots.release()
+            elapsed = time.perf_counter() - start
+            record_span(f"llm_{task}", elapsed)
+            LLM_LATENCY.labels(task, self.model, outcome).observe(elapsed)
+            # Une génération interrompue par l'utilisateur n'est pas un échec de Mistral
+            if outcome == "error":
+                self.circuit.record_failure()
+            else:
+                self.circuit.record_success()
+        prompt_tokens, completion_tokens = self._record_usage(task, usage)
+        return Completion("".join(parts), prompt_tokens, completion_tokens, round(elapsed * 1000))
+    
+    def detect_case(self, user_message: str, fast_mode: bool = False) -> Optional[str]:
         """
         Détecte le type de cas juridique depuis le message
         
         Args:
             user_message: Message de l'utilisateur
+            fast_mode: Détection locale par mots-clés, sans appel au LLM
             
         Returns:
             ID du cas détecté ou None
         """
-        if not self.knowledge_base:
+        # Un seul instantané pour toute la requête, même en cas de rechargement
+        snapshot, fallback = self.snapshot, self.fallback
+        if not snapshot.cases:
             return None
         
-        # Créer une liste des cas disponibles
-        cases_list = "\n".join([
-            f"- {case_id}: {data.get('titre', '')}"
-            for case_id, data in self.knowledge_base.items()
-        ])
+        if fast_mode:
+            return fallback.detect_case(user_message)[0]
+        
+        # Liste des cas disponibles (précalculée dans l'instantané)
+        cases_list = snapshot.cases_prompt
         
         prompt = f"""Tu es un expert en droit du travail togolais. Analyse le message de l'utilisateur et identifie quel cas juridique correspond le mieux.
 
@@ -58,25 +321,26 @@ Réponds UNIQUEMENT avec l'ID du cas (ex: licenciement_abusif), ou "aucun" si au
 Pas d'explication, juste l'ID."""
         
         try:
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+            raw_id = self._complete(
+                "detect_case",
+                [{"role": "user", "content": prompt}],
                 temperature=0.2,
                 max_tokens=50
-            )
-            
-            detected_id = response.choices[0].message.content.strip().lower()
+            ).content.strip().strip("\"'`.").lower()
             
-            # Vérifier que l'ID existe
-            if detected_id in self.knowledge_base:
+            # Vérifier que l'ID existe (les anciens identifiants sont acceptés)
+            detected_id = snapshot.resolve(raw_id)
+            if detected_id:
                 logger.info(f"Cas détecté: {detected_id}")
                 return detected_id
             
             return None
             
+        except LLMUnavailable as e:
+            logger.info(f"Détection locale du cas ({e})")
         except Exception as e:
             logger.error(f"Erreur détection cas: {e}")
-            return None
+        return fallback.detect_case(user_message)[0]
     
     def generate_response(
         self,
@@ -95,6 +359,110 @@ Pas d'explication, juste l'ID."""
         Returns:
             Réponse générée par l'IA
         """
+        return self.generate_reply(user_message, case_id, conversation_history).content
+    
+    def generate_reply(
+        self,
+        user_message: str,
+        case_id: Optional[str] = None,
+        conversation_history: List[Dict] = None,
+        fast_mode: bool = False
+    ) -> AIReply:
+        """
+        Génère une réponse et indique son origine
+        
+        Si le LLM est indisponible (disjoncteur ouvert, file saturée, erreur)
+        ou en mode rapide, la réponse est construite depuis la base de
+        connaissances.
+        
+        Args:
+            user_message: Message de l'utilisateur
+            case_id: ID du cas juridique détecté (optionnel)
+            conversation_history: Historique de conversation (optionnel)
+            fast_mode: Réponse immédiate depuis la base de connaissances
+            
+        Returns:
+            AIReply (contenu, origine, puis modèle, tokens et latence pour le LLM)
+        """
+        snapshot, fallback = self.snapshot, self.fallback
+        if fast_mode:
+            return AIReply(fallback.answer(user_message, case_id), SOURCE_KNOWLEDGE_BASE)
+        
+        messages, case_id = self._build_messages(snapshot, user_message, case_id, conversation_history)
+        try:
+            completion = self._complete("generate_response", messages, temperature=0.7, max_tokens=800)
+            return AIReply(
+                completion.content, SOURCE_LLM, self.model,
+                completion.prompt_tokens, completion.completion_tokens, completion.latency_ms
+            )
+            
+        except LLMUnavailable as e:
+            logger.info(f"Réponse depuis la base de connaissances ({e})")
+        except Exception as e:
+            logger.error(f"Erreur génération réponse: {e}")
+        return AIReply(fallback.answer(user_message, case_id), SOURCE_KNOWLEDGE_BASE)
+    
+    def stream_reply(
+        self,
+        user_message: str,
+        case_id: Optional[str] = None,
+        conversation_history: List[Dict] = None,
+        fast_mode: bool = False,
+        cancel: Optional[threading.Event] = None
+    ) -> Generator[str, None, AIReply]:
+        """
+        Comme generate_reply, mais produit la réponse fragment par fragment
+        
+        Les réponses de la base de connaissances (mode rapide, LLM
+        indisponible) sont produites en un seul fragment. Une erreur du LLM
+        après les premiers fragments est propagée (pas de réponse mêlée).
+        
+        Args:
+            cancel: Positionné pour interrompre la génération (créneau du LLM libéré)
+            
+        Returns:
+            AIReply de la réponse produite (partielle si annulée)
+        """
+        snapshot, fallback = self.snapshot, self.fallback
+        if not fast_mode:
+            messages, case_id = self._build_messages(snapshot, user_message, case_id, conversation_history)
+            produced = False
+            try:
+                stream = self._stream("generate_response", messages, temperature=0.7, max_tokens=800, cancel=cancel)
+                try:
+                    while True:
+                        try:
+                            delta = next(stream)
+                        except StopIteration as stop:
+                            completion = stop.value
+                            break
+                        produced = True
+                        yield delta
+                finally:
+                    # Fermé en cours de route : créneau libéré sans attendre le ramasse-miettes
+                    stream.close()
+                return AIReply(
+                    completion.content, SOURCE_LLM, self.model,
+                    completion.prompt_tokens, completion.completion_tokens, completion.latency_ms
+                )
+            except LLMUnavailable as e:
+                logger.info(f"Réponse depuis la base de connaissances ({e})")
+            except Exception as e:
+                if produced:
+                    raise
+                logger.error(f"Erreur génération réponse: {e}")
+        content = fallback.answer(user_message, case_id)
+        yield content
+        return AIReply(content, SOURCE_KNOWLEDGE_BASE)
+    
+    def _build_messages(
+        self,
+        snapshot: KnowledgeSnapshot,
+        user_message: str,
+        case_id: Optional[str],
+        conversation_history: Optional[List[Dict]]
+    ) -> Tuple[List[Dict], Optional[str]]:
+        """Messages envoyés au LLM et identifiant canonique du cas"""
         # Construire le contexte
         system_prompt = """Tu es SYFL AI, un assistant juridique spécialisé en droit du travail togolais.
 Tu es empathique, professionnel et tu donnes des conseils pratiques et clairs.
@@ -106,11 +474,10 @@ RÈGLES:
 4. Propose des actions concrètes
 5. Reste dans le cadre du droit du travail togolais"""
         
-        # Ajouter les informations du cas si disponible
-        if case_id and case_id in self.knowledge_base:
-            case_data = self.knowledge_base[case_id]
-            system_prompt += f"\n\nCAS IDENTIFIÉ: {case_data.get('titre', '')}\n"
-            system_prompt += f"INFORMATIONS: {json.dumps(case_data, ensure_ascii=False, indent=2)}"
+        # Ajouter les informations du cas si disponible (bloc précalculé)
+        case_id = snapshot.resolve(case_id)
+        if case_id:
+            system_prompt += snapshot.case_contexts[case_id]
         
         # Construire les messages
         messages = [{"role": "system", "content": system_prompt}]
@@ -122,17 +489,4 @@ RÈGLES:
         
         # Ajouter le message actuel
         messages.append({"role": "user", "content": user_message})
-        
-        try:
-            response = self.client.chat.complete(
-                model=self.model,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=800
-            )
-            
-            return response.choices[0].message.content
-            
-        except Exception as e:
-            logger.error(f"Erreur génération réponse: {e}")
-            return "Désolé, je rencontre un problème technique. Pouvez-vous reformuler votre question ?"
+        return messages, case_id
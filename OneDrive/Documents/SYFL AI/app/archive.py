@@ -0,0 +1,294 @@
+"""
+Archivage des conversations inactives (stockage froid)
+
+Les messages d'une conversation sans activité depuis ARCHIVE_AFTER_DAYS
+jours sont déplacés dans la table conversation_archives : un seul blob
+compressé (zstd si le module `zstandard` est installé, zlib sinon) par
+conversation. La table messages et ses index ne gardent que les
+conversations actives.
+
+La conversation elle-même reste en place (liste, titre, propriétaire) :
+- le détail, les exports et les statistiques relisent l'archive de façon
+  transparente ;
+- un nouveau message restaure d'abord la conversation dans la table
+  messages (`restore_conversation`).
+
+Usage:
+    python -m app.archive                  # enregistre le job (exécuté par les workers de l'application)
+    python -m app.archive --now --days 90  # archive immédiatement, dans ce processus
+"""
+import argparse
+import importlib.util
+import json
+import os
+import sys
+import zlib
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.export_formats import MessageRow
+from app.jobs import JobContext, job_handler
+from app.models import ConversationArchive, Message
+
+# Conversations sans nouveau message depuis ce nombre de jours
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "180"))
+# Conversations archivées par transaction
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "100"))
+ZSTD_AVAILABLE = importlib.util.find_spec("zstandard") is not None
+ARCHIVE_CODEC = os.getenv("ARCHIVE_CODEC", "zstd" if ZSTD_AVAILABLE else "zlib")
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "9"))
+
+ARCHIVE_JOB = "archive_conversations"
+
+# Colonnes de métadonnées des messages conservées dans l'archive
+METADATA_COLUMNS = ("case_id", "confidence", "source", "model", "prompt_tokens", "completion_tokens", "latency_ms")
+
+# (id, role, contenu, données supplémentaires, date de création, métadonnées non nulles)
+ArchivedMessage = Tuple[int, str, str, Optional[Dict[str, Any]], datetime, Dict[str, Any]]
+
+
+def _zstd_compress(data: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdCompressor(level=ARCHIVE_COMPRESSION_LEVEL).compress(data)
+
+
+def _zstd_decompress(data: bytes) -> bytes:
+    import zstandard
+    return zstandard.ZstdDecompressor().decompress(data)
+
+
+# codec -> (compression, décompression)
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (lambda data: zlib.compress(data, ARCHIVE_COMPRESSION_LEVEL), zlib.decompress),
+    "zstd": (_zstd_compress, _zstd_decompress),
+}
+
+
+# === Format du blob ===
+
+def pack_messages(messages: List[ArchivedMessage], codec: str = ARCHIVE_CODEC) -> Tuple[bytes, int]:
+    """
+    Sérialise et compresse les messages d'une conversation
+
+    Returns:
+        (blob compressé, taille avant compression)
+    """
+    raw = json.dumps(
+        [[message_id, role, content, extra_data, created_at.isoformat(), metadata]
+         for message_id, role, content, extra_data, created_at, metadata in messages],
+        ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+    compress, _ = CODECS[codec]
+    return compress(raw), len(raw)
+
+
+def unpack_messages(archive: ConversationArchive) -> List[ArchivedMessage]:
+    """Messages d'une archive, dans l'ordre chronologique"""
+    _, decompress = CODECS[archive.codec]
+    # Les archives antérieures aux colonnes de métadonnées n'ont que 5 champs par message
+    return [
+        (message_id, role, content, extra_data, datetime.fromisoformat(created_at), metadata[0] if metadata else {})
+        for message_id, role, content, extra_data, created_at, *metadata in json.loads(decompress(archive.payload))
+    ]
+
+
+def message_rows(archive: ConversationArchive) -> List[MessageRow]:
+    """Messages d'une archive au format des exports (id, role, contenu, date)"""
+    return [
+        (message_id, role, content, created_at)
+        for message_id, role, content, _, created_at, _ in unpack_messages(archive)
+    ]
+
+
+# === Archivage (job, session synchrone) ===
+
+def archive_conversation(db: Session, conversation_id: int, codec: str = ARCHIVE_CODEC) -> Optional[ConversationArchive]:
+    """
+    Déplace les messages d'une conversation dans son archive (une transaction)
+
+    Returns:
+        L'archive, ou None si la conversation n'a pas de message ou a reçu
+        un message pendant l'archivage
+    """
+    messages = [
+        (*row[:5], {name: value for name, value in zip(METADATA_COLUMNS, row[5:]) if value is not None})
+        for row in db.execute(
+            select(
+                Message.id, Message.role, Message.content, Message.extra_data, Message.created_at,
+                *(getattr(Message, name) for name in METADATA_COLUMNS)
+            ).where(
+                Message.conversation_id == conversation_id
+            ).order_by(Message.created_at.asc(), Message.id.asc())
+        )
+    ]
+    if not messages:
+        return None
+
+    payload, raw_size = pack_messages(messages, codec)
+    archive = ConversationArchive(
+        conversation_id=conversation_id,
+        codec=codec,
+        payload=payload,
+        message_count=len(messages),
+        role_counts=dict(Counter(message[1] for message in messages)),
+        last_message_id=max(message[0] for message in messages),
+        raw_size=raw_size,
+    )
+    db.add(archive)
+    db.execute(delete(Message).where(
+        Message.conversation_id == conversation_id,
+        Message.id <= archive.last_message_id
+    ))
+    remaining = db.scalar(select(func.count(Message.id)).where(Message.conversation_id == conversation_id))
+    if remaining:
+        # Conversation redevenue active entre-temps : elle reste dans la table messages
+        db.rollback()
+        return None
+    # Détachée avant le commit : ses attributs restent lisibles sans recharger le blob
+    db.flush()
+    db.expunge(archive)
+    db.commit()
+    return archive
+
+
+def inactive_conversation_ids(
+    db: Session, days: int, limit: Optional[int] = None, exclude: Iterable[int] = ()
+) -> List[int]:
+    """Conversations dont le dernier message date de plus de `days` jours"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    query = select(Message.conversation_id).where(
+        Message.conversation_id.notin_(list(exclude))
+    ).group_by(
+        Message.conversation_id
+    ).having(
+        func.max(Message.created_at) < cutoff
+    ).order_by(Message.conversation_id)
+    if limit is not None:
+        query = query.limit(limit)
+    return list(db.scalars(query))
+
+
+def archive_inactive_conversations(
+    db: Session,
+    days: int = ARCHIVE_AFTER_DAYS,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, int]:
+    """
+    Archive toutes les conversations inactives, par lots
+
+    Args:
+        db: Session synchrone
+        days: Inactivité minimale (jours)
+        batch_size: Conversations lues par lot
+        progress: Appelée avec (traitées, total) après chaque lot
+    """
+    total = len(inactive_conversation_ids(db, days))
+    done = archived = messages = raw_bytes = stored_bytes = 0
+    skipped = set()
+    while True:
+        # Les conversations archivées n'ont plus de messages : elles sortent de la sélection
+        batch = inactive_conversation_ids(db, days, batch_size, exclude=skipped)
+        if not batch:
+            break
+        for conversation_id in batch:
+            archive = archive_conversation(db, conversation_id)
+            done += 1
+            if archive is None:
+                skipped.add(conversation_id)
+                continue
+            archived += 1
+            messages += archive.message_count
+            raw_bytes += archive.raw_size
+            stored_bytes += len(archive.payload)
+        if progress:
+            progress(done, total)
+
+    if archived:
+        logger.info(
+            f"🗄️ {archived} conversation(s) archivée(s), {messages} messages, "
+            f"{raw_bytes} -> {stored_bytes} octets"
+        )
+    return {
+        "conversations": archived,
+        "messages": messages,
+        "raw_bytes": raw_bytes,
+        "stored_bytes": stored_bytes,
+    }
+
+
+@job_handler(ARCHIVE_JOB)
+def run_archive_job(ctx: JobContext) -> Dict:
+    """Job d'archivage ; payload optionnel {"days": N}"""
+    days = int(ctx.payload.get("days", ARCHIVE_AFTER_DAYS))
+    return archive_inactive_conversations(ctx.db, days=days, progress=ctx.progress)
+
+
+# === Lecture et restauration (routes, session async) ===
+
+async def load_archive(db: AsyncSession, conversation_id: int) -> Optional[ConversationArchive]:
+    return await db.get(ConversationArchive, conversation_id)
+
+
+async def aiter_archive_batches(db: AsyncSession, conversation_id: int) -> AsyncIterator[List[MessageRow]]:
+    """Messages d'une conversation archivée, en un lot (même interface que aiter_message_batches)"""
+    archive = await load_archive(db, conversation_id)
+    if archive is not None:
+        yield message_rows(archive)
+
+
+async def restore_conversation(db: AsyncSession, conversation_id: int) -> bool:
+    """
+    Remet les messages archivés d'une conversation dans la table messages
+
+    Les identifiants d'origine sont conservés (clés du cache des exports).
+
+    Returns:
+        True si la conversation était archivée
+    """
+    archive = await load_archive(db, conversation_id)
+    if archive is None:
+        return False
+    db.add_all([
+        Message(
+            id=message_id,
+            conversation_id=conversation_id,
+            role=role,
+            content=content,
+            extra_data=extra_data,
+            created_at=created_at,
+            **metadata
+        )
+        for message_id, role, content, extra_data, created_at, metadata in unpack_messages(archive)
+    ])
+    await db.delete(archive)
+    await db.commit()
+    return True
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Archivage des conversations inactives")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Inactivité minimale (jours)")
+    parser.add_argument("--now", action="store_true", help="Archive dans ce processus au lieu d'enregistrer le job")
+    args = parser.parse_args(argv)
+
+    from app.database import SessionLocal
+    from app.jobs import job_runner
+
+    with SessionLocal() as db:
+        if args.now:
+            print(json.dumps(archive_inactive_conversations(db, days=args.days)))
+        else:
+            job = job_runner.enqueue(db, ARCHIVE_JOB, payload={"days": args.days})
+            print(f"Job d'archivage {job.id} enregistré")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
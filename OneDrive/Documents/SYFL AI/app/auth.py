@@ -7,10 +7,11 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 import os
 
-from app.database import get_db
+from app.database import get_async_db
 from app.models import User
 
 # Configuration
@@ -49,9 +50,28 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
-def get_current_user(
+def decode_access_token(token: str) -> Optional[dict]:
+    """Contenu d'un token JWT valide (None si invalide ou expiré)"""
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    if payload.get("sub") is None:
+        return None
+    return payload
+
+
+async def user_from_token(db: AsyncSession, token: str) -> Optional[User]:
+    """Utilisateur désigné par un token JWT valide"""
+    payload = decode_access_token(token)
+    if payload is None:
+        return None
+    return await db.scalar(select(User).where(User.email == payload["sub"]))
+
+
+async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ) -> User:
     """Récupère l'utilisateur actuel depuis le token JWT"""
     credentials_exception = HTTPException(
@@ -60,15 +80,7 @@ def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
-        raise credentials_exception
-    
-    user = db.query(User).filter(User.email == email).first()
+    user = await user_from_token(db, token)
     if user is None:
         raise credentials_exception
     
@@ -0,0 +1,167 @@
+"""
+Export groupé de toutes les consultations d'un utilisateur
+
+Exécuté comme job d'arrière-plan (voir app.jobs) : les PDF sont rendus en
+parallèle dans le pool de rendu et écrits au fil de l'eau dans un ZIP sur
+disque. L'état et la progression sont dans la table jobs, un export
+interrompu par un redémarrage est repris depuis le début.
+
+Les ZIP sont conservés EXPORT_JOB_RETENTION_HOURS heures : le job périodique
+de purge les supprime ensuite et passe leur job à l'état "expired".
+"""
+import os
+import re
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Optional
+
+from loguru import logger
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.archive import message_rows
+from app.export_formats import iter_message_rows
+from app.jobs import JobContext, job_handler
+from app.models import Conversation, ConversationArchive, Job, Message, User
+from app.pdf_export import PDF_STREAMING_THRESHOLD, render_pool, write_conversation_pdf
+
+EXPORT_JOBS_DIR = os.getenv("EXPORT_JOBS_DIR", "export_jobs")
+# Durée de conservation des ZIP terminés (heures)
+EXPORT_JOB_RETENTION_HOURS = float(os.getenv("EXPORT_JOB_RETENTION_HOURS", "24"))
+# Intervalle entre deux purges des ZIP expirés (secondes)
+EXPORT_JOB_PURGE_INTERVAL = float(os.getenv("EXPORT_JOB_PURGE_INTERVAL", "3600"))
+
+BULK_EXPORT_JOB = "bulk_export"
+PURGE_EXPORTS_JOB = "purge_bulk_exports"
+
+
+def _archive_name(conversation) -> str:
+    """Nom du PDF d'une conversation dans le ZIP"""
+    slug = re.sub(r"[^A-Za-z0-9]+", "_", conversation.title or "consultation").strip("_").lower()
+    return f"{conversation.created_at.strftime('%Y%m%d')}_{conversation.id}_{slug or 'consultation'}.pdf"
+
+
+@job_handler(BULK_EXPORT_JOB)
+def run_bulk_export(ctx: JobContext) -> Dict:
+    """Exporte toutes les conversations du propriétaire du job dans un ZIP"""
+    db, job = ctx.db, ctx.job
+    username = db.get(User, job.user_id).username
+    # Colonnes seules : pas d'objets ORM à recharger après chaque commit de progression
+    conversations = db.query(
+        Conversation.id, Conversation.title, Conversation.case_type, Conversation.created_at
+    ).filter(
+        Conversation.user_id == job.user_id
+    ).order_by(Conversation.created_at.asc()).all()
+    message_counts = dict(
+        db.query(Message.conversation_id, func.count(Message.id)).join(
+            Conversation, Message.conversation_id == Conversation.id
+        ).filter(
+            Conversation.user_id == job.user_id
+        ).group_by(Message.conversation_id).all()
+    )
+    # Conversations archivées : messages relus depuis leur archive
+    archived_counts = dict(
+        db.query(ConversationArchive.conversation_id, ConversationArchive.message_count).join(
+            Conversation, ConversationArchive.conversation_id == Conversation.id
+        ).filter(
+            Conversation.user_id == job.user_id
+        ).all()
+    )
+
+    # Reprise depuis zéro : le ZIP est reconstruit entièrement
+    total = len(conversations)
+    completed = 0
+    ctx.progress(completed, total)
+
+    directory = Path(EXPORT_JOBS_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"export_{job.id}.zip"
+    tmp_path = path.with_name(path.name + ".tmp")
+
+    # Fenêtre de rendus en vol : borne la mémoire occupée par les PDF terminés
+    # (submit attend une place parmi les job_concurrency réservées aux jobs)
+    window = max(2 * render_pool.job_concurrency, 2)
+    pending: Dict[Future, str] = {}
+
+    def drain(archive: zipfile.ZipFile, until: int):
+        nonlocal completed
+        while len(pending) > until:
+            done, _ = wait(set(pending), return_when=FIRST_COMPLETED)
+            for future in done:
+                archive.writestr(pending.pop(future), future.result())
+                completed += 1
+            ctx.progress(completed)
+
+    try:
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for conversation in conversations:
+                meta = {
+                    "id": conversation.id,
+                    "title": conversation.title,
+                    "case_type": conversation.case_type,
+                    "created_at": conversation.created_at,
+                    "username": username,
+                }
+                if conversation.id in archived_counts:
+                    message_count = archived_counts[conversation.id]
+                    rows = message_rows(db.get(ConversationArchive, conversation.id))
+                else:
+                    message_count = message_counts.get(conversation.id, 0)
+                    rows = iter_message_rows(db, conversation.id)
+
+                if message_count == 0:
+                    completed += 1
+                elif message_count > PDF_STREAMING_THRESHOLD:
+                    # Très longue conversation : rendue directement dans l'entrée du ZIP
+                    drain(archive, 0)
+                    messages = ((role, content, created_at) for _, role, content, created_at in rows)
+                    with archive.open(_archive_name(conversation), "w") as entry:
+                        write_conversation_pdf(entry, meta, messages, message_count)
+                    completed += 1
+                else:
+                    messages = [(role, content, created_at) for _, role, content, created_at in rows]
+                    pending[render_pool.submit(meta, messages)] = _archive_name(conversation)
+                    drain(archive, window - 1)
+                    continue
+                ctx.progress(completed)
+
+            drain(archive, 0)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(tmp_path, path)
+    logger.info(f"Export groupé {job.id} terminé ({total} conversations)")
+    return {"file_path": str(path)}
+
+
+def purge_expired_exports(db: Session, retention_hours: float = EXPORT_JOB_RETENTION_HOURS, now: Optional[datetime] = None) -> int:
+    """
+    Supprime les ZIP des exports terminés depuis plus de `retention_hours`
+
+    Returns:
+        Nombre d'exports expirés
+    """
+    expired_before = (now or datetime.utcnow()) - timedelta(hours=retention_hours)
+    jobs = db.query(Job).filter(
+        Job.kind == BULK_EXPORT_JOB,
+        Job.status == "completed",
+        Job.finished_at < expired_before
+    ).all()
+    for job in jobs:
+        file_path = (job.result or {}).get("file_path")
+        if file_path:
+            Path(file_path).unlink(missing_ok=True)
+        job.status = "expired"
+    db.commit()
+    if jobs:
+        logger.info(f"{len(jobs)} export(s) groupé(s) expiré(s) supprimé(s)")
+    return len(jobs)
+
+
+@job_handler(PURGE_EXPORTS_JOB, every=EXPORT_JOB_PURGE_INTERVAL)
+def run_purge_exports(ctx: JobContext) -> Dict:
+    """Job périodique de purge des exports groupés expirés"""
+    return {"expired": purge_expired_exports(ctx.db)}
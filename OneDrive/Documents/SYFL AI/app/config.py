@@ -0,0 +1,122 @@
+"""
+Configuration de l'application
+
+Les réglages propres à une instance de l'application (clés, backend LLM,
+origines CORS...) sont regroupés dans `Settings`, passé à `create_app`.
+Par défaut ils sont lus depuis l'environnement ; les tests et benchmarks
+peuvent construire leur propre configuration sans toucher à os.environ.
+
+`plan_workers` répartit les ressources entre les workers gunicorn
+(voir gunicorn.conf.py).
+"""
+import os
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+DEFAULT_CORS_ORIGINS = [
+    "http://localhost:3000",  # Next.js dev
+    "http://localhost:19006",  # Expo web
+    "http://localhost:8081",  # Expo mobile
+    "https://syfl-ai-frontend.vercel.app",  # Vercel production
+]
+
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off", "")
+
+
+@dataclass
+class Settings:
+    """Réglages d'une instance de l'application"""
+
+    # "mistral" en production, "fake" pour les benchmarks (aucun appel réseau)
+    llm_backend: str = "mistral"
+    mistral_api_key: Optional[str] = None
+    mistral_model: str = "mistral-small-latest"
+    # Rate limiting (désactivable pour les benchmarks de charge)
+    rate_limit_enabled: bool = True
+    # Jeton requis pour /metrics (vide = accès libre, à protéger au niveau réseau)
+    metrics_token: str = ""
+    # Crée les tables manquantes au démarrage (désactiver quand alembic gère le schéma)
+    create_tables: bool = True
+    # Surveille la base de connaissances et la recharge à chaud
+    watch_knowledge_base: bool = True
+    # Démarre les workers des jobs et le thread des écritures différées
+    background_workers: bool = True
+    cors_origins: List[str] = field(default_factory=lambda: list(DEFAULT_CORS_ORIGINS))
+    cors_origin_regex: Optional[str] = r"https://.*\.vercel\.app"  # Tous les déploiements Vercel
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Réglages lus depuis les variables d'environnement (et .env)"""
+        extra_origins = [o.strip() for o in os.getenv("CORS_ORIGINS", "").split(",") if o.strip()]
+        return cls(
+            llm_backend=os.getenv("LLM_BACKEND", "mistral"),
+            mistral_api_key=os.getenv("MISTRAL_API_KEY"),
+            mistral_model=os.getenv("MISTRAL_MODEL", "mistral-small-latest"),
+            rate_limit_enabled=_env_bool("RATE_LIMIT_ENABLED", True),
+            metrics_token=os.getenv("METRICS_TOKEN", ""),
+            create_tables=_env_bool("DB_CREATE_TABLES", True),
+            watch_knowledge_base=_env_bool("KNOWLEDGE_BASE_WATCH", True),
+            background_workers=_env_bool("BACKGROUND_WORKERS", True),
+            cors_origins=DEFAULT_CORS_ORIGINS + extra_origins,
+        )
+
+    def validate(self):
+        """Vérifie la cohérence des réglages (appelée au démarrage)"""
+        if self.llm_backend not in ("mistral", "fake"):
+            raise ValueError(f"LLM_BACKEND inconnu: {self.llm_backend}")
+        if self.llm_backend == "mistral" and not self.mistral_api_key:
+            raise ValueError("MISTRAL_API_KEY manquante")
+
+
+@dataclass(frozen=True)
+class WorkerPlan:
+    """Répartition des ressources entre les workers"""
+    workers: int
+    # Appels LLM simultanés par worker (LLM_MAX_CONCURRENCY)
+    llm_concurrency: int
+    # Processus de rendu PDF par worker (PDF_EXPORT_WORKERS)
+    pdf_workers: int
+    # Connexions à la base par worker (DB_POOL_SIZE, sans débordement)
+    db_pool_size: int
+
+
+def available_cpus() -> int:
+    """Cœurs utilisables par le processus (affinité comprise)"""
+    if hasattr(os, "sched_getaffinity"):
+        return max(1, len(os.sched_getaffinity(0)))
+    return max(1, os.cpu_count() or 1)
+
+
+def plan_workers(
+    cpu_count: int,
+    llm_budget: int,
+    workers: Optional[int] = None,
+    db_budget: int = 20
+) -> WorkerPlan:
+    """
+    Nombre de workers et concurrence par worker
+
+    Les workers uvicorn sont asynchrones : un par cœur suffit, et pas plus
+    que d'appels LLM autorisés au total (un worker sans créneau LLM ne
+    servirait que des réponses dégradées).
+
+    Args:
+        cpu_count: Cœurs disponibles
+        llm_budget: Appels LLM simultanés autorisés pour tout le service
+        workers: Nombre imposé (WEB_CONCURRENCY), sinon déduit
+        db_budget: Connexions à la base autorisées pour tout le service
+    """
+    if not workers:
+        workers = min(cpu_count, llm_budget)
+    workers = max(1, workers)
+    return WorkerPlan(
+        workers=workers,
+        llm_concurrency=max(1, llm_budget // workers),
+        pdf_workers=max(1, cpu_count // workers),
+        db_pool_size=max(1, db_budget // workers),
+    )
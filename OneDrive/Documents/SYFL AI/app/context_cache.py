@@ -0,0 +1,142 @@
+"""
+Cache mémoire du contexte des conversations en cours
+
+Chaque échange envoie au LLM les derniers messages de la conversation
+(CONTEXT_HISTORY_MESSAGES). Pour une consultation active, ils sont gardés
+en mémoire et complétés à chaque message enregistré : l'échange suivant ne
+relit pas l'historique en base.
+
+Une entrée est marquée par le `updated_at` de la conversation, mis à jour à
+chaque message de l'utilisateur. La conversation est de toute façon relue à
+chaque échange (contrôle du propriétaire) : si un autre worker y a écrit
+entre-temps, la marque ne correspond plus et l'historique est relu en base.
+
+Le cache est plafonné en octets (CONTEXT_CACHE_MAX_BYTES), les conversations
+les moins récemment utilisées sortent en premier.
+"""
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from app.metrics import record_cache
+
+CONTEXT_CACHE_MAX_BYTES = int(os.getenv("CONTEXT_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+# Messages précédents envoyés au LLM avec chaque question
+CONTEXT_HISTORY_MESSAGES = int(os.getenv("CONTEXT_HISTORY_MESSAGES", "20"))
+
+# Estimation de la mémoire occupée hors contenu des messages (octets)
+_ENTRY_OVERHEAD = 200
+_MESSAGE_OVERHEAD = 64
+
+HistoryMessage = Tuple[str, str]  # (rôle, contenu)
+
+
+class ConversationContext(NamedTuple):
+    """Derniers messages d'une conversation, valables pour une valeur de updated_at"""
+    updated_at: datetime
+    messages: Tuple[HistoryMessage, ...]
+    size: int
+
+
+def _context(updated_at: datetime, messages: Sequence[HistoryMessage]) -> ConversationContext:
+    messages = tuple(messages)
+    size = _ENTRY_OVERHEAD + sum(sys.getsizeof(content) + _MESSAGE_OVERHEAD for _, content in messages)
+    return ConversationContext(updated_at, messages, size)
+
+
+class ConversationContextCache:
+    """Cache LRU des contextes de conversation plafonné en octets"""
+
+    def __init__(self, max_bytes: int = CONTEXT_CACHE_MAX_BYTES, window: int = CONTEXT_HISTORY_MESSAGES):
+        self.max_bytes = max_bytes
+        self.window = window
+        self._entries: "OrderedDict[int, ConversationContext]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, conversation_id: int, updated_at: datetime) -> Optional[List[Dict]]:
+        """
+        Historique en mémoire de la conversation (messages les plus anciens d'abord)
+
+        Returns:
+            None si absent, ou écrit depuis par un autre processus
+        """
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is not None and entry.updated_at != updated_at:
+                self._remove(conversation_id)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(conversation_id)
+        record_cache("conversation_context", entry is not None)
+        if entry is None:
+            return None
+        return [{"role": role, "content": content} for role, content in entry.messages]
+
+    def put(self, conversation_id: int, updated_at: datetime, messages: Sequence[HistoryMessage]):
+        """Enregistre les derniers messages de la conversation, lus en base"""
+        with self._lock:
+            self._store(conversation_id, _context(updated_at, messages[-self.window:] if self.window else ()))
+
+    def append(
+        self,
+        conversation_id: int,
+        expected_updated_at: datetime,
+        role: str,
+        content: str,
+        updated_at: Optional[datetime] = None
+    ):
+        """
+        Ajoute un message enregistré à l'entrée de la conversation
+
+        Args:
+            expected_updated_at: Marque lue avant l'écriture ; si l'entrée en a
+                une autre (échange concurrent), elle est supprimée
+            updated_at: Nouvelle marque de la conversation (inchangée par défaut)
+        """
+        with self._lock:
+            entry = self._entries.get(conversation_id)
+            if entry is None:
+                return
+            if entry.updated_at != expected_updated_at:
+                self._remove(conversation_id)
+                return
+            messages = (entry.messages + ((role, content),))[-self.window:] if self.window else ()
+            self._store(conversation_id, _context(updated_at or entry.updated_at, messages))
+
+    def invalidate(self, conversation_id: int):
+        """Supprime l'entrée d'une conversation (suppression, réécriture)"""
+        with self._lock:
+            self._remove(conversation_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _remove(self, conversation_id: int):
+        entry = self._entries.pop(conversation_id, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _store(self, conversation_id: int, entry: ConversationContext):
+        self._remove(conversation_id)
+        # Une conversation plus grande que le cache n'y entre pas
+        if entry.size > self.max_bytes:
+            return
+        self._entries[conversation_id] = entry
+        self._bytes += entry.size
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+
+# Instance partagée par les routes du chat (une par processus)
+context_cache = ConversationContextCache()
@@ -1,23 +1,218 @@
 """
 Configuration de la base de données SQLAlchemy
+
+Le moteur est créé avec un profil propre au backend :
+- SQLite (fichier) : journal WAL, synchronous=NORMAL, busy_timeout et
+  mmap_size appliqués à chaque connexion ; les lecteurs ne bloquent plus
+  les écritures et un écrivain concurrent attend au lieu d'échouer
+  ("database is locked")
+- SQLite en mémoire : une seule connexion partagée (StaticPool)
+- SQLite (les deux) : clés étrangères appliquées (PRAGMA foreign_keys),
+  les suppressions en cascade sont faites par la base (ON DELETE CASCADE)
+- PostgreSQL : pool dimensionné (taille, débordement, recyclage),
+  vérification des connexions (pre_ping) et statement_timeout
+
+Un moteur asynchrone (aiosqlite / asyncpg) avec les mêmes profils sert les
+routes async (`get_async_db`) : leurs requêtes n'occupent pas de thread.
 """
-from sqlalchemy import create_engine
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 import os
 
+from app.metrics import instrument_engine
+
 # URL de la base de données
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./syfl_ai.db")
+# URL du moteur asynchrone (déduite de DATABASE_URL par défaut)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")
+
+# Pool de connexions (par processus : gunicorn.conf.py répartit DB_CONNECTION_BUDGET)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+# Attente maximale d'une connexion libre (secondes)
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Âge maximal d'une connexion avant renouvellement (secondes)
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+# Durée maximale d'une requête PostgreSQL (millisecondes, 0 = illimitée)
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+
+# SQLite : attente d'un verrou d'écriture (millisecondes)
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+# SQLite : fichier projeté en mémoire (octets, 0 = désactivé)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(64 * 1024 * 1024)))
+# SQLite : NORMAL est sûr en WAL (seule la dernière transaction peut être perdue en cas de coupure)
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+
+
+@dataclass
+class EngineProfile:
+    """Réglages d'un moteur pour un backend donné"""
+    name: str
+    # Arguments de create_engine
+    options: Dict[str, Any] = field(default_factory=dict)
+    # PRAGMA exécutés à l'ouverture de chaque connexion SQLite
+    pragmas: List[str] = field(default_factory=list)
+
+
+def normalize_database_url(url: str) -> str:
+    """Accepte le schéma postgres:// fourni par Render/Heroku (refusé par SQLAlchemy 2)"""
+    if url.startswith("postgres://"):
+        return "postgresql://" + url[len("postgres://"):]
+    return url
+
+
+def async_database_url(url: str) -> str:
+    """URL du pilote asynchrone correspondant (sqlite -> aiosqlite, postgresql -> asyncpg)"""
+    parsed = make_url(normalize_database_url(url))
+    backend = parsed.get_backend_name()
+    if backend == "sqlite":
+        parsed = parsed.set(drivername="sqlite+aiosqlite")
+    elif backend == "postgresql":
+        parsed = parsed.set(drivername="postgresql+asyncpg")
+    else:
+        raise ValueError(f"Pas de pilote asynchrone connu pour {backend} (définir ASYNC_DATABASE_URL)")
+    return parsed.render_as_string(hide_password=False)
+
+
+def engine_profile(url: str) -> EngineProfile:
+    """Profil de moteur adapté au backend de l'URL"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+
+    if backend == "sqlite":
+        if parsed.database in (None, "", ":memory:"):
+            return EngineProfile(
+                name="sqlite_memory",
+                options={"connect_args": {"check_same_thread": False}, "poolclass": StaticPool},
+                pragmas=["PRAGMA foreign_keys=ON"],
+            )
+        options = {
+            "connect_args": {"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            "pool_size": DB_POOL_SIZE,
+            "max_overflow": DB_MAX_OVERFLOW,
+            "pool_timeout": DB_POOL_TIMEOUT,
+        }
+        if parsed.get_driver_name() == "aiosqlite":
+            # Sans pool, aiosqlite ouvrirait une connexion (et un thread) par session
+            options["poolclass"] = AsyncAdaptedQueuePool
+        return EngineProfile(
+            name="sqlite",
+            options=options,
+            pragmas=[
+                "PRAGMA journal_mode=WAL",
+                f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+                f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+                f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+                "PRAGMA foreign_keys=ON",
+            ],
+        )
+
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        # Connexions coupées par le serveur (redémarrage, inactivité) détectées avant usage
+        "pool_pre_ping": True,
+    }
+    if backend == "postgresql" and parsed.get_driver_name() == "asyncpg":
+        server_settings = {"application_name": "syfl-ai"}
+        if DB_STATEMENT_TIMEOUT_MS > 0:
+            server_settings["statement_timeout"] = str(DB_STATEMENT_TIMEOUT_MS)
+        options["connect_args"] = {"timeout": 10, "server_settings": server_settings}
+        return EngineProfile(name="postgresql", options=options)
+    if backend == "postgresql":
+        connect_args = {"connect_timeout": 10, "application_name": "syfl-ai"}
+        if DB_STATEMENT_TIMEOUT_MS > 0:
+            connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+        options["connect_args"] = connect_args
+        return EngineProfile(name="postgresql", options=options)
+    return EngineProfile(name=backend, options=options)
+
+
+def create_configured_engine(
+    url: str, profile: Optional[EngineProfile] = None, metrics_name: str = "primary"
+) -> Engine:
+    """
+    Crée un moteur avec le profil de son backend
+
+    Args:
+        url: URL de la base
+        profile: Profil imposé (par défaut celui déduit de l'URL)
+        metrics_name: Label engine de ses métriques
+    """
+    url = normalize_database_url(url)
+    profile = profile or engine_profile(url)
+    engine = create_engine(url, **profile.options)
+    _apply_profile(engine, profile)
+    # Durées des requêtes et état du pool exposés sur /metrics
+    instrument_engine(engine, metrics_name)
+    return engine
+
+
+def create_configured_async_engine(
+    url: str, profile: Optional[EngineProfile] = None, metrics_name: str = "async"
+) -> AsyncEngine:
+    """
+    Crée un moteur asynchrone avec le profil de son backend
+
+    Args:
+        url: URL avec un pilote asynchrone (voir async_database_url)
+        profile: Profil imposé (par défaut celui déduit de l'URL)
+        metrics_name: Label engine de ses métriques (hôte pour un réplica)
+    """
+    profile = profile or engine_profile(url)
+    engine = create_async_engine(url, **profile.options)
+    _apply_profile(engine.sync_engine, profile)
+    instrument_engine(engine.sync_engine, metrics_name)
+    return engine
+
+
+def _apply_profile(engine: Engine, profile: EngineProfile):
+    engine._syfl_profile = profile.name
+    if not profile.pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in profile.pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+
+def pool_status(engine) -> Dict[str, Any]:
+    """État du pool de connexions d'un moteur, synchrone ou async (exposé par /health)"""
+    if isinstance(engine, AsyncEngine):
+        engine = engine.sync_engine
+    pool = engine.pool
+    status = {"profile": getattr(engine, "_syfl_profile", None), "pool": type(pool).__name__}
+    for name in ("size", "checkedout", "overflow", "checkedin"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
+
 
 # Créer le moteur SQLAlchemy
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {}
-)
+engine = create_configured_engine(DATABASE_URL)
 
 # Session locale
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Moteur et sessions asynchrones (objets toujours lisibles après commit)
+async_engine = create_configured_async_engine(ASYNC_DATABASE_URL or async_database_url(DATABASE_URL))
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base pour les modèles
 Base = declarative_base()
 
@@ -29,3 +224,25 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def get_sessionmaker() -> sessionmaker:
+    """
+    Dependency pour le travail fait dans un thread qui peut survivre à la
+    requête (rendu PDF au timeout) : le thread ouvre et ferme sa propre session
+    """
+    return SessionLocal
+
+
+async def get_async_db():
+    """Dependency pour obtenir une session asynchrone"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def get_async_sessionmaker() -> async_sessionmaker:
+    """
+    Dependency pour les connexions longues (WebSocket) : une session par
+    échange plutôt qu'une session ouverte toute la durée de la connexion
+    """
+    return AsyncSessionLocal
@@ -0,0 +1,119 @@
+"""
+Cache disque des exports PDF
+
+Un export est identifié par (conversation, dernier message, version du
+gabarit) : tant qu'aucun message n'est ajouté, le même fichier est servi.
+La taille totale du dossier est plafonnée, les fichiers les moins
+récemment servis sont supprimés en premier (LRU sur la date de modification).
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+from loguru import logger
+
+from app.metrics import record_cache
+
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", "export_cache")
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+
+class ExportCache:
+    """Cache LRU de fichiers d'export plafonné en octets"""
+
+    def __init__(self, directory: str = EXPORT_CACHE_DIR, max_bytes: int = EXPORT_CACHE_MAX_BYTES):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(conversation_id: int, last_message_id: int, template_version: int) -> str:
+        """Clé de cache d'un export"""
+        return f"conversation_{conversation_id}_{last_message_id}_v{template_version}"
+
+    @staticmethod
+    def make_etag(key: str) -> str:
+        """ETag fort dérivé de la clé (aucune lecture disque nécessaire)"""
+        return f'"{key}"'
+
+    def _path(self, key: str, extension: str) -> Path:
+        return self.directory / f"{key}.{extension}"
+
+    def get(self, key: str, extension: str = "pdf") -> Optional[Path]:
+        """Retourne le fichier en cache et le marque comme récemment utilisé"""
+        path = self._path(key, extension)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            record_cache("pdf_export", False)
+            return None
+        record_cache("pdf_export", True)
+        return path
+
+    @contextmanager
+    def writer(self, key: str, extension: str = "pdf") -> Iterator[BinaryIO]:
+        """
+        Ouvre un fichier temporaire publié atomiquement sous la clé
+
+        Permet d'écrire un export volumineux directement sur le disque,
+        sans le garder en mémoire. Rien n'est publié en cas d'erreur.
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self._path(key, extension)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                yield f
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        self._evict()
+
+    def put(self, key: str, data: bytes, extension: str = "pdf") -> Path:
+        """Écrit un export de façon atomique puis applique le plafond de taille"""
+        with self.writer(key, extension) as f:
+            f.write(data)
+        return self._path(key, extension)
+
+    def invalidate(self, conversation_id: int):
+        """Supprime tous les exports d'une conversation"""
+        if not self.directory.exists():
+            return
+        for path in self.directory.glob(f"conversation_{conversation_id}_*"):
+            path.unlink(missing_ok=True)
+
+    def _evict(self):
+        """Supprime les fichiers les plus anciens au-delà de max_bytes"""
+        with self._lock:
+            entries = []
+            total = 0
+            for path in self.directory.iterdir():
+                if path.suffix == ".tmp":
+                    continue
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+            if total <= self.max_bytes:
+                return
+
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                logger.debug(f"Export évincé du cache: {path.name}")
+
+
+# Cache partagé par les routes d'export
+export_cache = ExportCache()
@@ -0,0 +1,231 @@
+"""
+Exports texte en streaming (JSONL, Markdown, HTML)
+
+Les messages sont lus par lots depuis le curseur de base de données et
+chaque format est produit au fil de l'eau : la mémoire utilisée ne dépend
+pas de la longueur de la conversation.
+"""
+import html
+import itertools
+import json
+import os
+from datetime import datetime
+from typing import (
+    AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+)
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Message
+
+# Nombre de messages lus par aller-retour avec la base
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "200"))
+
+# Taille approximative des morceaux envoyés au client
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# (id, role, contenu, date de création)
+MessageRow = Tuple[int, str, str, datetime]
+
+
+def iter_message_rows(db: Session, conversation_id: int, max_id: Optional[int] = None) -> Iterable[MessageRow]:
+    """
+    Itère sur les messages d'une conversation par lots de EXPORT_BATCH_SIZE
+
+    Args:
+        max_id: Dernier message exporté (version de l'export déjà identifiée)
+    """
+    query = db.query(
+        Message.id, Message.role, Message.content, Message.created_at
+    ).filter(
+        Message.conversation_id == conversation_id
+    )
+    if max_id is not None:
+        query = query.filter(Message.id <= max_id)
+    return query.order_by(Message.created_at.asc(), Message.id.asc()).yield_per(EXPORT_BATCH_SIZE)
+
+
+async def aiter_message_batches(db: AsyncSession, conversation_id: int) -> AsyncIterator[List[MessageRow]]:
+    """Lots de EXPORT_BATCH_SIZE messages lus depuis un curseur serveur (session async)"""
+    result = await db.stream(
+        select(Message.id, Message.role, Message.content, Message.created_at).where(
+            Message.conversation_id == conversation_id
+        ).order_by(
+            Message.created_at.asc(), Message.id.asc()
+        ).execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    async for partition in result.partitions():
+        yield [tuple(row) for row in partition]
+
+
+def _role_label(role: str) -> str:
+    return "👤 Vous" if role == "user" else "🤖 Assistant SYFL AI"
+
+
+class _Chunker:
+    """Regroupe de petites chaînes en morceaux d'environ STREAM_CHUNK_SIZE octets"""
+
+    def __init__(self):
+        self.buffer: List[bytes] = []
+        self.size = 0
+
+    def add(self, part: str) -> Optional[bytes]:
+        """Ajoute une chaîne ; renvoie un morceau complet s'il y en a un"""
+        data = part.encode("utf-8")
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= STREAM_CHUNK_SIZE:
+            return self.flush()
+        return None
+
+    def flush(self) -> Optional[bytes]:
+        if not self.buffer:
+            return None
+        chunk = b"".join(self.buffer)
+        self.buffer = []
+        self.size = 0
+        return chunk
+
+
+def _jsonl_header(meta: Dict) -> str:
+    header = {
+        "type": "conversation",
+        "id": meta["id"],
+        "title": meta["title"],
+        "case_type": meta["case_type"],
+        "created_at": meta["created_at"].isoformat(),
+    }
+    return json.dumps(header, ensure_ascii=False) + "\n"
+
+
+def _jsonl_row(row: MessageRow) -> str:
+    message_id, role, content, created_at = row
+    return json.dumps({
+        "type": "message",
+        "id": message_id,
+        "role": role,
+        "content": content,
+        "created_at": created_at.isoformat(),
+    }, ensure_ascii=False) + "\n"
+
+
+def _markdown_header(meta: Dict) -> str:
+    return (
+        "# SYFL AI - Consultation Juridique\n\n"
+        f"- **Type de cas :** {meta['case_type'] or 'Non spécifié'}\n"
+        f"- **Date :** {meta['created_at'].strftime('%d/%m/%Y à %H:%M')}\n"
+        f"- **Utilisateur :** {meta['username']}\n\n"
+        "## Conversation\n\n"
+    )
+
+
+def _markdown_row(row: MessageRow) -> str:
+    _, role, content, created_at = row
+    return f"### {_role_label(role)} - {created_at.strftime('%H:%M')}\n\n{content}\n\n"
+
+
+def _markdown_footer(meta: Dict) -> str:
+    return (
+        "---\n\n"
+        "*Ce document est fourni à titre informatif uniquement "
+        "et ne constitue pas un avis juridique.*\n"
+    )
+
+
+def _html_header(meta: Dict) -> str:
+    title = html.escape(meta["title"] or "Consultation")
+    return (
+        "<!DOCTYPE html>\n<html lang=\"fr\">\n<head>\n<meta charset=\"utf-8\">\n"
+        f"<title>SYFL AI - {title}</title>\n</head>\n<body>\n"
+        "<h1>SYFL AI - Consultation Juridique</h1>\n<ul>\n"
+        f"<li><b>Type de cas :</b> {html.escape(meta['case_type'] or 'Non spécifié')}</li>\n"
+        f"<li><b>Date :</b> {meta['created_at'].strftime('%d/%m/%Y à %H:%M')}</li>\n"
+        f"<li><b>Utilisateur :</b> {html.escape(meta['username'])}</li>\n"
+        "</ul>\n<h2>Conversation</h2>\n"
+    )
+
+
+def _html_row(row: MessageRow) -> str:
+    _, role, content, created_at = row
+    body = html.escape(content).replace("\n", "<br>\n")
+    return (
+        f"<section class=\"{role}\">\n"
+        f"<h3>{_role_label(role)} - {created_at.strftime('%H:%M')}</h3>\n"
+        f"<p>{body}</p>\n</section>\n"
+    )
+
+
+def _html_footer(meta: Dict) -> str:
+    return (
+        "<hr>\n<p><small>Ce document est fourni à titre informatif uniquement "
+        "et ne constitue pas un avis juridique.</small></p>\n</body>\n</html>\n"
+    )
+
+
+class StreamFormat(NamedTuple):
+    """Un format d'export texte : en-tête, une ligne par message, pied de page"""
+    header: Callable[[Dict], str]
+    row: Callable[[MessageRow], str]
+    footer: Callable[[Dict], str]
+    media_type: str
+    extension: str
+
+
+STREAM_FORMATS: Dict[str, StreamFormat] = {
+    "jsonl": StreamFormat(_jsonl_header, _jsonl_row, lambda meta: "", "application/x-ndjson", "jsonl"),
+    "md": StreamFormat(_markdown_header, _markdown_row, _markdown_footer, "text/markdown; charset=utf-8", "md"),
+    "html": StreamFormat(_html_header, _html_row, _html_footer, "text/html; charset=utf-8", "html"),
+}
+
+
+def stream_conversation(export_format: str, meta: Dict, rows: Iterable[MessageRow]) -> Iterator[bytes]:
+    """
+    Produit l'export d'une conversation morceau par morceau
+
+    Args:
+        export_format: Clé de STREAM_FORMATS
+        meta: id, title, case_type, created_at et username de la conversation
+        rows: Messages (id, role, content, created_at), idéalement depuis iter_message_rows
+
+    Returns:
+        Itérateur de morceaux UTF-8
+    """
+    fmt = STREAM_FORMATS[export_format]
+    chunker = _Chunker()
+    parts = itertools.chain([fmt.header(meta)], map(fmt.row, rows), [fmt.footer(meta)])
+    for part in parts:
+        chunk = chunker.add(part)
+        if chunk:
+            yield chunk
+    chunk = chunker.flush()
+    if chunk:
+        yield chunk
+
+
+async def astream_conversation(
+    export_format: str, meta: Dict, batches: AsyncIterable[Iterable[MessageRow]]
+) -> AsyncIterator[bytes]:
+    """
+    Variante asynchrone de stream_conversation
+
+    Args:
+        export_format: Clé de STREAM_FORMATS
+        meta: id, title, case_type, created_at et username de la conversation
+        batches: Lots de messages, idéalement depuis aiter_message_batches
+    """
+    fmt = STREAM_FORMATS[export_format]
+    chunker = _Chunker()
+    chunk = chunker.add(fmt.header(meta))
+    if chunk:
+        yield chunk
+    async for rows in batches:
+        for row in rows:
+            chunk = chunker.add(fmt.row(row))
+            if chunk:
+                yield chunk
+    chunker.add(fmt.footer(meta))
+    chunk = chunker.flush()
+    if chunk:
+        yield chunk
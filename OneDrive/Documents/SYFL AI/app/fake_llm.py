@@ -0,0 +1,115 @@
+"""
+Faux client Mistral pour les benchmarks et le développement hors ligne
+
+Activé avec LLM_BACKEND=fake : même interface que `Mistral().chat.complete`
+et `Mistral().chat.stream`, latence simulée, réponses déterministes et consommation de tokens estimée.
+Aucun appel réseau, aucune clé API nécessaire.
+"""
+import hashlib
+import os
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+# Latence simulée d'un appel (millisecondes) et variation aléatoire (+/- %)
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "800"))
+FAKE_LLM_JITTER = float(os.getenv("FAKE_LLM_JITTER", "0.25"))
+# Intervalle entre deux fragments d'une réponse en streaming (millisecondes)
+FAKE_LLM_TOKEN_MS = float(os.getenv("FAKE_LLM_TOKEN_MS", "20"))
+
+_CASE_LINE = re.compile(r"^- ([a-z0-9_]+):", re.MULTILINE)
+
+FAKE_ANSWER = (
+    "Merci pour votre message. D'après le Code du travail togolais, votre situation "
+    "mérite une vérification de votre contrat et de vos bulletins de paie.\n\n"
+    "1. Rassemblez vos documents (contrat, bulletins, échanges écrits)\n"
+    "2. Adressez une réclamation écrite à votre employeur\n"
+    "3. Saisissez l'inspection du travail si la situation persiste"
+)
+
+
+def _tokens(text: str) -> int:
+    """Estimation grossière : ~4 caractères par token"""
+    return max(1, len(text) // 4)
+
+
+def _usage(messages: List[Dict], content: str) -> SimpleNamespace:
+    prompt_tokens = sum(_tokens(message["content"]) for message in messages)
+    return SimpleNamespace(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=_tokens(content),
+        total_tokens=prompt_tokens + _tokens(content)
+    )
+
+
+class _FakeEventStream:
+    """Comme mistralai EventStream : itérable, à fermer (bloc with)"""
+
+    def __init__(self, chunks: List[str], usage: SimpleNamespace, token_ms: float):
+        self.chunks = chunks
+        self.usage = usage
+        self.token_ms = token_ms
+        self.closed = False
+
+    def __iter__(self):
+        for i, chunk in enumerate(self.chunks):
+            if self.closed:
+                return
+            if i:
+                time.sleep(self.token_ms / 1000)
+            last = i == len(self.chunks) - 1
+            yield SimpleNamespace(data=SimpleNamespace(
+                choices=[SimpleNamespace(delta=SimpleNamespace(content=chunk))],
+                usage=self.usage if last else None
+            ))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.closed = True
+
+
+class _FakeChat:
+    def __init__(self, latency_ms: float, jitter: float, token_ms: float):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.token_ms = token_ms
+
+    def _answer(self, messages: List[Dict]) -> str:
+        delay = self.latency_ms / 1000 * random.uniform(1 - self.jitter, 1 + self.jitter)
+        time.sleep(max(delay, 0))
+
+        prompt = messages[-1]["content"]
+        case_ids = _CASE_LINE.findall(prompt)
+        if case_ids:
+            # Prompt de détection : un cas stable pour un même message
+            digest = int(hashlib.md5(prompt.encode("utf-8")).hexdigest(), 16)
+            return case_ids[digest % len(case_ids)]
+        return FAKE_ANSWER
+
+    def complete(self, model: str, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 800, **kwargs):
+        content = self._answer(messages)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=_usage(messages, content)
+        )
+
+    def stream(self, model: str, messages: List[Dict], temperature: float = 0.7, max_tokens: int = 800, **kwargs):
+        # La latence simulée précède le premier fragment, puis un fragment par mot
+        content = self._answer(messages)
+        return _FakeEventStream(re.findall(r"\S+\s*", content), _usage(messages, content), self.token_ms)
+
+
+class FakeMistral:
+    """Remplaçant de mistralai.Mistral (seuls chat.complete et chat.stream sont fournis)"""
+
+    def __init__(
+        self,
+        latency_ms: float = FAKE_LLM_LATENCY_MS,
+        jitter: float = FAKE_LLM_JITTER,
+        token_ms: float = FAKE_LLM_TOKEN_MS
+    ):
+        self.chat = _FakeChat(latency_ms, jitter, token_ms)
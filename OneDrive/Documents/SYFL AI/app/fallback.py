@@ -0,0 +1,154 @@
+"""
+Réponses instantanées à partir de la base de connaissances
+
+Utilisées quand le LLM est indisponible (circuit ouvert, file saturée,
+erreur) ou quand le client demande le mode rapide. La détection du cas se
+fait par mots-clés et la réponse est un gabarit rempli avec les champs du
+cas : tout est précalculé une fois par instantané.
+"""
+import math
+from collections import defaultdict
+from typing import Dict, Optional, Set, Tuple
+
+from app.knowledge_base import KnowledgeSnapshot, slugify
+
+# Score minimal pour retenir un cas détecté par mots-clés
+KEYWORD_MIN_SCORE = 1.0
+
+# Longueur des préfixes comparés ("licencié", "licenciement" -> "licenc")
+STEM_LENGTH = 6
+
+STOPWORDS = {
+    "avec", "dans", "depuis", "elle", "elles", "entre", "est-ce", "etre", "fait", "faire",
+    "leur", "leurs", "mais", "mes", "moi", "mon", "nous", "notre", "pour", "quand", "quel",
+    "quelle", "sans", "sont", "suis", "tout", "tous", "tres", "vous", "votre", "avez",
+    "avoir", "cela", "cette", "comme", "donc", "encore", "aussi", "plus", "peut", "pouvez",
+    "travail", "travailleur", "employeur", "entreprise", "code", "togolais", "article", "articles",
+}
+
+# Poids d'un terme selon le champ du cas où il apparaît
+FIELD_WEIGHTS = (
+    ("titre", 3.0),
+    ("texte_simple", 1.0),
+    ("questions_clarification", 1.0),
+)
+
+GENERIC_ANSWER = (
+    "Notre assistant est momentanément très sollicité. Pour vous orienter rapidement, "
+    "décrivez votre situation en quelques mots. Voici les situations que nous traitons :\n\n"
+    "{cases}\n\n"
+    "_Réponse générée à partir de la base de connaissances SYFL AI._"
+)
+
+
+def _terms(text: str) -> Set[str]:
+    """Termes significatifs d'un texte, sans accents, tronqués à STEM_LENGTH"""
+    return {
+        word[:STEM_LENGTH]
+        for word in slugify(text).split("_")
+        if len(word) >= 4 and word not in STOPWORDS
+    }
+
+
+def _field_text(value) -> str:
+    if isinstance(value, str):
+        return value
+    return " ".join(value or ())
+
+
+def render_case_answer(case: Dict) -> str:
+    """Réponse structurée construite à partir des champs d'un cas"""
+    parts = [f"**{case.get('titre', '')}**"]
+    if case.get("texte_simple"):
+        parts.append(case["texte_simple"])
+    if case.get("articles_reference"):
+        parts.append("**Textes de référence :**\n" + "\n".join(
+            f"- {article}" for article in case["articles_reference"]
+        ))
+    if case.get("questions_clarification"):
+        parts.append("**Pour mieux vous orienter :**\n" + "\n".join(
+            f"- {question}" for question in case["questions_clarification"]
+        ))
+    if case.get("actions"):
+        parts.append("**Démarches possibles :**\n" + "\n".join(
+            f"{i}. {action}" for i, action in enumerate(case["actions"], 1)
+        ))
+    parts.append("_Réponse générée à partir de la base de connaissances SYFL AI._")
+    return "\n\n".join(parts)
+
+
+class FallbackEngine:
+    """Détection par mots-clés et réponses gabarits pour un instantané donné"""
+
+    def __init__(self, snapshot: KnowledgeSnapshot):
+        self.snapshot = snapshot
+        self.answers = {
+            case_id: render_case_answer(case)
+            for case_id, case in snapshot.cases.items()
+        }
+        self.generic_answer = GENERIC_ANSWER.format(cases="\n".join(
+            f"- {case.get('titre', '')}" for case in snapshot.cases.values()
+        ))
+
+        # terme -> {cas: poids}, pondéré par la rareté du terme (idf)
+        postings: Dict[str, Dict[str, float]] = defaultdict(dict)
+        for case_id, case in snapshot.cases.items():
+            for field_name, weight in FIELD_WEIGHTS:
+                for term in _terms(_field_text(case.get(field_name))):
+                    postings[term][case_id] = max(postings[term].get(case_id, 0.0), weight)
+        # Identifiants et anciens intitulés comptent comme des titres
+        names = [(case_id, case_id) for case_id in snapshot.cases]
+        names += snapshot.aliases.items()
+        for name, case_id in names:
+            for term in _terms(name):
+                postings[term][case_id] = max(postings[term].get(case_id, 0.0), FIELD_WEIGHTS[0][1])
+
+        total = max(len(snapshot.cases), 1)
+        self.index = {
+            term: {case_id: weight * math.log(1 + total / len(cases)) for case_id, weight in cases.items()}
+            for term, cases in postings.items()
+        }
+
+    @classmethod
+    def for_snapshot(cls, snapshot: KnowledgeSnapshot) -> "FallbackEngine":
+        """
+        Index de l'instantané, construit une seule fois par instantané
+
+        Les moteurs IA d'un même processus partagent l'index ; préchargé avant
+        le fork (gunicorn), il est partagé en copie sur écriture par les workers.
+        """
+        global _shared
+        cached = _shared
+        if cached is not None and cached.snapshot is snapshot:
+            return cached
+        _shared = cls(snapshot)
+        return _shared
+
+    def detect_case(self, message: str) -> Tuple[Optional[str], float]:
+        """
+        Détecte le cas le plus probable par mots-clés
+
+        Returns:
+            (identifiant du cas ou None, score)
+        """
+        scores: Dict[str, float] = defaultdict(float)
+        for term in _terms(message):
+            for case_id, weight in self.index.get(term, {}).items():
+                scores[case_id] += weight
+        if not scores:
+            return None, 0.0
+        case_id, score = max(scores.items(), key=lambda item: (item[1], item[0]))
+        if score < KEYWORD_MIN_SCORE:
+            return None, score
+        return case_id, score
+
+    def answer(self, message: str, case_id: Optional[str] = None) -> str:
+        """Réponse gabarit du cas (détecté localement si besoin)"""
+        case_id = self.snapshot.resolve(case_id)
+        if case_id is None:
+            case_id, _ = self.detect_case(message)
+        return self.answers.get(case_id, self.generic_answer)
+
+
+# Dernier index construit (voir FallbackEngine.for_snapshot)
+_shared: Optional[FallbackEngine] = None
@@ -0,0 +1,47 @@
+"""
+En-têtes HTTP de revalidation et de négociation du contenu
+
+Partagés par les routes qui servent des réponses pré-rendues (liste des
+cas, exports) : If-None-Match et Accept-Encoding (avec ses valeurs q).
+"""
+from fastapi import Request
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Compare l'en-tête If-None-Match à un ETag (comparaison faible)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in candidates or etag.removeprefix("W/") in candidates
+
+
+def _quality(params: str) -> float:
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() == "q":
+            try:
+                return float(value.strip())
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def accepts_encoding(request: Request, coding: str) -> bool:
+    """
+    Le client accepte-t-il ce codage (Accept-Encoding) ?
+
+    Une entrée du codage prime sur "*" ; q=0 le refuse.
+    """
+    header = request.headers.get("accept-encoding")
+    if not header:
+        return False
+    wildcard = None
+    for item in header.split(","):
+        name, _, params = item.partition(";")
+        name = name.strip().lower()
+        if name == coding:
+            return _quality(params) > 0
+        if name == "*":
+            wildcard = _quality(params)
+    return wildcard is not None and wildcard > 0
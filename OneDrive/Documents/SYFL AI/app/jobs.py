@@ -0,0 +1,384 @@
+"""
+Jobs d'arrière-plan persistants
+
+Les traitements lourds (exports, purges, recalculs...) sont enregistrés
+dans la table jobs puis exécutés par un pool de threads démarré avec
+l'application. Chaque job est réclamé de façon atomique en base, ce qui
+permet plusieurs workers (ou processus) sur la même table.
+
+Un job en cours a un bail (heartbeat_at) renouvelé toutes les
+JOB_HEARTBEAT_SECONDS par un thread dédié. Les workers remettent en attente,
+à la même fréquence, les jobs dont le bail a expiré (processus arrêté en
+cours de job).
+
+Usage:
+    @job_handler("mon_job")
+    def run_mon_job(ctx: JobContext):
+        ...
+        ctx.progress(1, 10)
+
+    job = job_runner.enqueue(db, "mon_job", payload={...})
+
+    # Job périodique : réenregistré `every` secondes après chaque exécution
+    @job_handler("ma_purge", every=3600)
+    def run_ma_purge(ctx: JobContext):
+        ...
+"""
+import os
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from loguru import logger
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Job
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))
+JOB_RETRY_MAX_DELAY = float(os.getenv("JOB_RETRY_MAX_DELAY", "600"))
+# Un job "running" sans heartbeat depuis ce délai est considéré abandonné
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600"))
+# Renouvellement du bail des jobs en cours et recherche des jobs abandonnés
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", str(JOB_LEASE_SECONDS / 3)))
+JOB_SHUTDOWN_TIMEOUT = float(os.getenv("JOB_SHUTDOWN_TIMEOUT", "30"))
+
+ACTIVE_STATUSES = ("pending", "running")
+
+_handlers: Dict[str, Callable] = {}
+# Type de job périodique -> intervalle entre deux exécutions (secondes)
+_recurring: Dict[str, float] = {}
+
+
+def job_handler(kind: str, every: Optional[float] = None):
+    """
+    Enregistre la fonction qui exécute les jobs de type `kind`
+
+    Args:
+        every: Job périodique : enregistré au démarrage des workers, puis à
+            nouveau `every` secondes après chaque exécution
+    """
+    def decorator(func: Callable) -> Callable:
+        _handlers[kind] = func
+        if every is not None:
+            _recurring[kind] = every
+        return func
+    return decorator
+
+
+class JobContext:
+    """Contexte passé aux handlers : session, job et suivi de progression"""
+
+    def __init__(self, db: Session, job: Job):
+        self.db = db
+        self.job = job
+
+    @property
+    def payload(self) -> Dict:
+        return self.job.payload or {}
+
+    def progress(self, current: int, total: Optional[int] = None):
+        """Enregistre la progression (et prolonge le bail du job)"""
+        self.job.progress_current = current
+        if total is not None:
+            self.job.progress_total = total
+        self.job.heartbeat_at = datetime.utcnow()
+        self.db.commit()
+
+
+class JobRunner:
+    """Pool de workers qui exécutent les jobs de la table jobs"""
+
+    def __init__(
+        self,
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        session_factory=SessionLocal,
+        lease_seconds: float = JOB_LEASE_SECONDS,
+        heartbeat_interval: float = JOB_HEARTBEAT_SECONDS
+    ):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+        self.lease_seconds = lease_seconds
+        self.heartbeat_interval = heartbeat_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads: List[threading.Thread] = []
+        self._stopping = threading.Event()
+        self._wakeup = threading.Event()
+        # Prochaine recherche des jobs abandonnés (horloge monotone), partagée par les workers
+        self._next_recovery = 0.0
+        self._recovery_lock = threading.Lock()
+
+    # === Producteurs ===
+
+    def enqueue(
+        self,
+        db: Session,
+        kind: str,
+        payload: Optional[Dict] = None,
+        user_id: Optional[int] = None,
+        priority: int = 0,
+        max_attempts: int = 3,
+        run_after: Optional[datetime] = None
+    ) -> Job:
+        """
+        Enregistre un job et réveille les workers
+
+        Args:
+            db: Session de la requête (le job est commité)
+            kind: Type de job, doit avoir un handler enregistré
+            payload: Paramètres JSON du handler
+            user_id: Propriétaire du job (optionnel)
+            priority: Les plus grandes valeurs passent en premier
+            max_attempts: Nombre d'essais avant l'échec définitif
+            run_after: Exécution différée (défaut : dès que possible)
+        """
+        if kind not in _handlers:
+            raise ValueError(f"Aucun handler pour les jobs '{kind}'")
+
+        job = Job(
+            kind=kind,
+            payload=payload or {},
+            user_id=user_id,
+            priority=priority,
+            max_attempts=max_attempts,
+            status="pending",
+            run_after=run_after or datetime.utcnow()
+        )
+        db.add(job)
+        db.commit()
+        db.refresh(job)
+        self._wakeup.set()
+        return job
+
+    # === Workers ===
+
+    def start(self):
+        """Démarre les workers (après avoir récupéré les jobs abandonnés)"""
+        if self._threads or self.workers <= 0:
+            return
+        self._recover_if_due()
+        self.schedule_recurring()
+        self._stopping.clear()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"{self.workers} worker(s) de jobs démarré(s)")
+
+    def shutdown(self, timeout: float = JOB_SHUTDOWN_TIMEOUT):
+        """
+        Arrêt gracieux : plus aucun job n'est réclamé, les jobs en cours
+        sont terminés dans la limite de `timeout` secondes. Un job encore
+        en cours sera repris après expiration de son bail.
+        """
+        if not self._threads:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        deadline = datetime.utcnow() + timedelta(seconds=timeout)
+        for thread in self._threads:
+            remaining = (deadline - datetime.utcnow()).total_seconds()
+            thread.join(timeout=max(remaining, 0))
+        still_running = [t.name for t in self._threads if t.is_alive()]
+        if still_running:
+            logger.warning(f"Jobs toujours en cours à l'arrêt: {', '.join(still_running)}")
+        self._threads = []
+
+    def recover_stale(self):
+        """Remet en attente les jobs "running" dont le bail a expiré"""
+        db = self.session_factory()
+        try:
+            stale_before = datetime.utcnow() - timedelta(seconds=self.lease_seconds)
+            recovered = db.execute(
+                update(Job).where(
+                    Job.status == "running",
+                    Job.heartbeat_at < stale_before
+                ).values(status="pending", locked_by=None)
+            ).rowcount
+            db.commit()
+        finally:
+            db.close()
+        if recovered:
+            logger.info(f"{recovered} job(s) abandonné(s) remis en attente")
+            self._wakeup.set()
+
+    def schedule_recurring(self):
+        """Enregistre les jobs périodiques qui n'ont pas d'exécution en attente"""
+        if not _recurring:
+            return
+        db = self.session_factory()
+        try:
+            scheduled = {
+                kind for (kind,) in db.query(Job.kind).filter(
+                    Job.kind.in_(_recurring),
+                    Job.status.in_(ACTIVE_STATUSES)
+                ).distinct()
+            }
+            for kind in sorted(_recurring.keys() - scheduled):
+                db.add(Job(kind=kind, payload={}, status="pending", run_after=datetime.utcnow()))
+            db.commit()
+        finally:
+            db.close()
+
+    def _schedule_next(self, db: Session, job: Job):
+        """Prochaine exécution d'un job périodique (commitée avec l'état du job)"""
+        every = _recurring.get(job.kind)
+        if every is not None:
+            db.add(Job(
+                kind=job.kind,
+                payload=job.payload,
+                priority=job.priority,
+                max_attempts=job.max_attempts,
+                status="pending",
+                run_after=datetime.utcnow() + timedelta(seconds=every)
+            ))
+
+    def _recover_if_due(self):
+        """recover_stale toutes les heartbeat_interval secondes, par un seul worker"""
+        now = time.monotonic()
+        with self._recovery_lock:
+            if now < self._next_recovery:
+                return
+            self._next_recovery = now + self.heartbeat_interval
+        self.recover_stale()
+
+    def _renew_lease(self, job_id: int, done: threading.Event):
+        """Prolonge le bail du job tant qu'il est exécuté par ce processus"""
+        while not done.wait(self.heartbeat_interval):
+            db = self.session_factory()
+            try:
+                db.execute(
+                    update(Job).where(
+                        Job.id == job_id,
+                        Job.status == "running",
+                        Job.locked_by == self.worker_id
+                    ).values(heartbeat_at=datetime.utcnow())
+                )
+                db.commit()
+            except Exception:
+                logger.exception(f"Renouvellement du bail du job {job_id} impossible")
+            finally:
+                db.close()
+
+    @contextmanager
+    def _lease(self, job: Job):
+        """Bail du job renouvelé par un thread pendant son exécution"""
+        done = threading.Event()
+        thread = threading.Thread(
+            target=self._renew_lease, args=(job.id, done), name=f"job-lease-{job.id}", daemon=True
+        )
+        thread.start()
+        try:
+            yield
+        finally:
+            done.set()
+            thread.join()
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                self._recover_if_due()
+                ran = self.run_next()
+            except Exception:
+                logger.exception("Erreur du worker de jobs")
+                ran = False
+            if not ran:
+                self._wakeup.wait(timeout=self.poll_interval)
+                self._wakeup.clear()
+
+    def _claim(self, db: Session) -> Optional[Job]:
+        """Réclame atomiquement le prochain job exécutable"""
+        now = datetime.utcnow()
+        candidates = db.query(Job.id).filter(
+            Job.status == "pending",
+            Job.run_after <= now
+        ).order_by(Job.priority.desc(), Job.id.asc()).limit(5).all()
+
+        for (job_id,) in candidates:
+            claimed = db.execute(
+                update(Job).where(
+                    Job.id == job_id,
+                    Job.status == "pending"
+                ).values(
+                    status="running",
+                    attempts=Job.attempts + 1,
+                    locked_by=self.worker_id,
+                    started_at=now,
+                    heartbeat_at=now
+                )
+            ).rowcount
+            db.commit()
+            if claimed:
+                return db.get(Job, job_id)
+        return None
+
+    def run_next(self) -> bool:
+        """
+        Exécute le prochain job exécutable dans le thread appelant
+
+        Returns:
+            True si un job a été exécuté
+        """
+        db = self.session_factory()
+        try:
+            job = self._claim(db)
+            if job is None:
+                return False
+            self._execute(db, job)
+            return True
+        finally:
+            db.close()
+
+    def _execute(self, db: Session, job: Job):
+        handler = _handlers.get(job.kind)
+        try:
+            if handler is None:
+                raise ValueError(f"Aucun handler pour les jobs '{job.kind}'")
+            with self._lease(job):
+                result = handler(JobContext(db, job))
+        except Exception as e:
+            db.rollback()
+            self._fail(db, job, e)
+            return
+
+        job.status = "completed"
+        job.result = result
+        job.last_error = None
+        job.locked_by = None
+        job.finished_at = datetime.utcnow()
+        self._schedule_next(db, job)
+        db.commit()
+        logger.info(f"Job {job.id} ({job.kind}) terminé")
+
+    def _fail(self, db: Session, job: Job, error: Exception):
+        """Replanifie le job avec un backoff exponentiel ou le marque en échec"""
+        job.last_error = str(error)[:500]
+        job.locked_by = None
+        if job.attempts < job.max_attempts:
+            delay = min(JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1), JOB_RETRY_MAX_DELAY)
+            delay *= random.uniform(0.8, 1.2)
+            job.status = "pending"
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+            logger.warning(
+                f"Job {job.id} ({job.kind}) en échec, essai {job.attempts}/{job.max_attempts}, "
+                f"nouvel essai dans {delay:.0f}s: {error}"
+            )
+        else:
+            job.status = "failed"
+            job.finished_at = datetime.utcnow()
+            self._schedule_next(db, job)
+            logger.error(f"Job {job.id} ({job.kind}) abandonné après {job.attempts} essais: {error}")
+        db.commit()
+
+
+# Runner partagé par l'application
+job_runner = JobRunner()
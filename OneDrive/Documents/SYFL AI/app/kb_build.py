@@ -0,0 +1,243 @@
+"""
+Compilation de la base de connaissances
+
+Fusionne les fichiers JSON de bases_connaissances/ et le classeur Excel des
+cas, valide le tout et écrit un instantané compilé (voir
+app.knowledge_base.dump_compiled_snapshot) chargé au démarrage via
+KNOWLEDGE_BASE_SNAPSHOT.
+
+Usage:
+    python -m app.kb_build
+    python -m app.kb_build --xlsx cas_injustice_droit_travail_togo.xlsx --output kb.snapshot
+    python -m app.kb_build --check   # validation seule, rien n'est écrit
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from xml.etree import ElementTree
+
+from loguru import logger
+
+from app.knowledge_base import (
+    KNOWLEDGE_BASE_DIR,
+    KnowledgeBaseError,
+    KnowledgeSnapshot,
+    build_snapshot,
+    dump_compiled_snapshot,
+    load_compiled_snapshot,
+    normalize_cases,
+    slugify,
+    validate_case,
+)
+
+DEFAULT_XLSX = "cas_injustice_droit_travail_togo.xlsx"
+DEFAULT_OUTPUT = "knowledge_base.snapshot"
+
+_XLSX_NS = {"m": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+
+# Lignes du classeur qui décrivent un cas existant sous un autre intitulé
+XLSX_CASE_MATCHES = {
+    "licenciement_sans_motif": "licenciement_abusif",
+    "harcelement_moral_ou_sexuel": "harcelement_travail",
+    "non_paiement_du_salaire": "salaire_impaye",
+}
+
+
+def _column(cell_ref: str) -> str:
+    """Lettres de colonne d'une référence de cellule ("B12" -> "B")"""
+    return re.match(r"[A-Z]+", cell_ref).group(0)
+
+
+def read_xlsx_rows(path: Path) -> List[Dict[str, str]]:
+    """
+    Lit la première feuille d'un classeur .xlsx (sans dépendance externe)
+
+    Returns:
+        Une ligne par dict, indexée par les en-têtes de la première ligne
+    """
+    with zipfile.ZipFile(path) as archive:
+        shared: List[str] = []
+        if "xl/sharedStrings.xml" in archive.namelist():
+            root = ElementTree.fromstring(archive.read("xl/sharedStrings.xml"))
+            for item in root.findall("m:si", _XLSX_NS):
+                shared.append("".join(t.text or "" for t in item.iter(f"{{{_XLSX_NS['m']}}}t")))
+        sheet = ElementTree.fromstring(archive.read("xl/worksheets/sheet1.xml"))
+
+    table: List[Dict[str, str]] = []
+    for row in sheet.iter(f"{{{_XLSX_NS['m']}}}row"):
+        values = {}
+        for cell in row.findall("m:c", _XLSX_NS):
+            kind = cell.get("t")
+            if kind == "inlineStr":
+                value = "".join(t.text or "" for t in cell.iter(f"{{{_XLSX_NS['m']}}}t"))
+            else:
+                raw = cell.findtext("m:v", default="", namespaces=_XLSX_NS)
+                value = shared[int(raw)] if kind == "s" and raw else raw
+            values[_column(cell.get("r"))] = value.strip()
+        table.append(values)
+
+    if not table:
+        return []
+    headers = table[0]
+    return [
+        {headers[col]: value for col, value in row.items() if col in headers}
+        for row in table[1:]
+        if any(row.values())
+    ]
+
+
+def _split_questions(text: str) -> List[str]:
+    """"Question 1 ? Question 2 ?" -> ["Question 1 ?", "Question 2 ?"]"""
+    return [part.strip() + " ?" for part in text.split("?") if part.strip()]
+
+
+def _split_actions(text: str) -> List[str]:
+    """"Faire A, faire B." -> ["Faire A", "Faire B"]"""
+    actions = []
+    for part in text.rstrip(". ").split(","):
+        part = part.strip()
+        if part:
+            actions.append(part[0].upper() + part[1:])
+    return actions
+
+
+def xlsx_cases(path: Path) -> Dict[str, Dict]:
+    """Convertit les lignes du classeur en cas (identifiant = intitulé normalisé)"""
+    cases = {}
+    for row in read_xlsx_rows(path):
+        title = row.get("problème", "")
+        if not title:
+            continue
+        case_id = slugify(title)
+        cases[case_id] = {
+            "id": case_id,
+            "titre": title,
+            "articles_reference": [],
+            "texte_simple": row.get("description courte", ""),
+            "questions_clarification": _split_questions(row.get("questions à poser", "")),
+            "actions": _split_actions(row.get("actions possibles", "")),
+        }
+    return cases
+
+
+def load_sources(directory: Path, xlsx: Optional[Path]) -> Tuple[Dict[str, Dict], Dict[str, str], List[str]]:
+    """
+    Charge et fusionne les sources de la base de connaissances
+
+    Les fichiers JSON font foi. Une ligne du classeur qui correspond à un
+    cas existant (même intitulé ou XLSX_CASE_MATCHES) ne fait que compléter
+    ses champs vides ; les autres lignes deviennent de nouveaux cas.
+
+    Returns:
+        (cas, alias, erreurs)
+    """
+    errors: List[str] = []
+    raw: Dict[str, Dict] = {}
+    for json_file in sorted(directory.glob("*.json")):
+        try:
+            with open(json_file, "r", encoding="utf-8") as f:
+                raw[json_file.stem] = validate_case(json_file.stem, json.load(f))
+        except Exception as e:
+            errors.append(f"{json_file.name}: {e}")
+    cases, aliases = normalize_cases(raw)
+
+    if xlsx is None:
+        return cases, aliases, errors
+
+    by_title = {slugify(data["titre"]): case_id for case_id, data in cases.items()}
+    for row_id, data in xlsx_cases(xlsx).items():
+        target = (
+            XLSX_CASE_MATCHES.get(row_id)
+            or by_title.get(row_id)
+            or (row_id if row_id in cases else None)
+            or aliases.get(row_id)
+        )
+        if target is None:
+            try:
+                cases[row_id] = validate_case(row_id, data)
+            except KnowledgeBaseError as e:
+                errors.append(f"{xlsx.name}: {e}")
+            continue
+
+        merged = dict(cases[target])
+        for name, value in data.items():
+            if name != "id" and value and not merged.get(name):
+                merged[name] = value
+        cases[target] = merged
+        if row_id != target:
+            aliases[row_id] = target
+
+    return cases, aliases, errors
+
+
+def compile_knowledge_base(
+    directory: Path,
+    xlsx: Optional[Path],
+    output: Optional[Path]
+) -> KnowledgeSnapshot:
+    """
+    Construit l'instantané et l'écrit de façon atomique dans `output`
+
+    Raises:
+        KnowledgeBaseError: Une source est invalide
+    """
+    cases, aliases, errors = load_sources(directory, xlsx)
+    if errors:
+        raise KnowledgeBaseError("\n".join(errors))
+    if not cases:
+        raise KnowledgeBaseError(f"Aucun cas trouvé dans {directory}")
+
+    snapshot = build_snapshot(cases, aliases=aliases)
+    if output is None:
+        return snapshot
+
+    data = dump_compiled_snapshot(snapshot)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=output.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp_path, 0o644)
+        # Relecture avant publication : un instantané illisible n'est jamais servi
+        load_compiled_snapshot(Path(tmp_path))
+        os.replace(tmp_path, output)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+    return snapshot
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compile la base de connaissances SYFL AI")
+    parser.add_argument("--source", default=KNOWLEDGE_BASE_DIR, help="Dossier des cas JSON")
+    parser.add_argument("--xlsx", default=DEFAULT_XLSX, help="Classeur Excel des cas ('' pour l'ignorer)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="Fichier d'instantané à écrire")
+    parser.add_argument("--check", action="store_true", help="Valide les sources sans rien écrire")
+    args = parser.parse_args(argv)
+
+    xlsx = Path(args.xlsx) if args.xlsx else None
+    if xlsx is not None and not xlsx.exists():
+        logger.warning(f"Classeur {xlsx} introuvable, ignoré")
+        xlsx = None
+
+    try:
+        snapshot = compile_knowledge_base(
+            Path(args.source), xlsx, None if args.check else Path(args.output)
+        )
+    except KnowledgeBaseError as e:
+        logger.error(f"❌ Base de connaissances invalide:\n{e}")
+        return 1
+
+    target = "validée" if args.check else f"écrite dans {args.output}"
+    logger.info(f"✅ {len(snapshot)} cas, {len(snapshot.aliases)} alias, checksum {snapshot.checksum[:12]} ({target})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,411 @@
+"""
+Base de connaissances juridiques rechargeable à chaud
+
+Les cas sont chargés dans un instantané immuable et versionné
+(KnowledgeSnapshot) qui contient aussi les index et morceaux de prompt
+dérivés. Le gestionnaire surveille le dossier par scrutation des dates de
+modification : un fichier modifié est relu et validé en arrière-plan, puis
+un nouvel instantané remplace l'ancien d'un seul coup. Une requête en cours
+garde l'instantané qu'elle a lu, sans mélange de versions.
+
+En production, l'instantané peut être compilé à l'avance
+(python -m app.kb_build) : il est alors chargé en une seule lecture, index
+compris, au lieu de relire et valider chaque fichier au démarrage.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import unicodedata
+import zlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Tuple
+
+from loguru import logger
+
+KNOWLEDGE_BASE_DIR = os.getenv("KNOWLEDGE_BASE_DIR", "bases_connaissances")
+# Instantané compilé (python -m app.kb_build), utilisé à la place du dossier s'il est défini
+KNOWLEDGE_BASE_SNAPSHOT = os.getenv("KNOWLEDGE_BASE_SNAPSHOT", "")
+# Intervalle de scrutation du dossier (secondes), 0 = pas de rechargement à chaud
+KNOWLEDGE_BASE_POLL_INTERVAL = float(os.getenv("KNOWLEDGE_BASE_POLL_INTERVAL", "5"))
+
+# Champs de liste attendus dans un cas
+LIST_FIELDS = ("articles_reference", "questions_clarification", "actions")
+
+# Identifiant canonique d'un cas : snake_case ASCII
+CASE_ID_PATTERN = re.compile(r"^[a-z0-9]+(?:_[a-z0-9]+)*$")
+
+# En-tête du format compilé : magie + sha256 du corps compressé
+SNAPSHOT_MAGIC = b"SYFLKB01"
+SNAPSHOT_FORMAT = 1
+
+
+class KnowledgeBaseError(ValueError):
+    """Cas juridique invalide"""
+
+
+def validate_case(case_id: str, data) -> Dict:
+    """
+    Vérifie la structure d'un cas juridique
+
+    Raises:
+        KnowledgeBaseError: Le cas est inutilisable
+    """
+    if not isinstance(data, dict):
+        raise KnowledgeBaseError(f"{case_id}: un objet JSON est attendu")
+    if not isinstance(data.get("titre"), str) or not data["titre"].strip():
+        raise KnowledgeBaseError(f"{case_id}: champ 'titre' manquant")
+    if "texte_simple" in data and not isinstance(data["texte_simple"], str):
+        raise KnowledgeBaseError(f"{case_id}: 'texte_simple' doit être une chaîne")
+    for name in LIST_FIELDS:
+        value = data.get(name, [])
+        if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+            raise KnowledgeBaseError(f"{case_id}: '{name}' doit être une liste de chaînes")
+    return data
+
+
+def slugify(text: str) -> str:
+    """Identifiant snake_case sans accents ("Période d’essai" -> "periode_d_essai")"""
+    ascii_text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("ascii")
+    # Frontières camelCase ("heuresSup" -> "heures_sup")
+    ascii_text = re.sub(r"([a-z0-9])([A-Z])", r"\1_\2", ascii_text)
+    return re.sub(r"[^a-z0-9]+", "_", ascii_text.lower()).strip("_")
+
+
+def normalize_cases(raw_cases: Dict[str, Dict]) -> Tuple[Dict[str, Dict], Dict[str, str]]:
+    """
+    Attribue à chaque cas son identifiant canonique
+
+    L'identifiant déclaré dans le champ "id" est retenu s'il est en
+    snake_case, sinon la clé source (nom de fichier) est convertie.
+    La clé source est conservée comme alias : les conversations
+    existantes qui la référencent restent résolues.
+
+    Args:
+        raw_cases: Clé source (ex: nom de fichier) -> cas validé
+
+    Returns:
+        (cas par identifiant canonique, alias -> identifiant canonique)
+    """
+    cases: Dict[str, Dict] = {}
+    aliases: Dict[str, str] = {}
+    for source_id in sorted(raw_cases):
+        data = raw_cases[source_id]
+        declared = data.get("id")
+        if isinstance(declared, str) and CASE_ID_PATTERN.match(declared):
+            case_id = declared
+        else:
+            case_id = slugify(source_id)
+
+        if case_id in cases:
+            logger.warning(f"Cas en double ignoré: {source_id} (id {case_id})")
+            continue
+
+        cases[case_id] = {**data, "id": case_id}
+        for alias in (source_id, source_id.lower(), slugify(source_id)):
+            if alias != case_id:
+                aliases[alias] = case_id
+    return cases, aliases
+
+
+def _freeze(value):
+    """Copie en lecture seule (dict -> MappingProxyType, list -> tuple)"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    """Inverse de _freeze (pour la sérialisation)"""
+    if isinstance(value, Mapping):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+@dataclass(frozen=True)
+class KnowledgeSnapshot:
+    """Instantané immuable de la base de connaissances et de ses dérivés"""
+    version: int
+    checksum: str
+    loaded_at: datetime
+    cases: Mapping[str, Mapping]
+    # Liste "- id: titre" utilisée par le prompt de détection
+    cases_prompt: str
+    # Bloc de contexte injecté dans le prompt système pour chaque cas
+    case_contexts: Mapping[str, str] = field(default_factory=dict)
+    # Ancien identifiant -> identifiant canonique
+    aliases: Mapping[str, str] = field(default_factory=dict)
+
+    def __len__(self):
+        return len(self.cases)
+
+    def resolve(self, case_id: Optional[str]) -> Optional[str]:
+        """Identifiant canonique d'un cas (accepte les alias), None si inconnu"""
+        if not case_id:
+            return None
+        if case_id in self.cases:
+            return case_id
+        return self.aliases.get(case_id) or self.aliases.get(case_id.lower())
+
+
+def build_snapshot(
+    cases: Dict[str, Dict],
+    version: int = 0,
+    aliases: Optional[Dict[str, str]] = None
+) -> KnowledgeSnapshot:
+    """Construit un instantané et ses index à partir des cas normalisés"""
+    ordered = {case_id: cases[case_id] for case_id in sorted(cases)}
+    canonical = json.dumps(ordered, ensure_ascii=False, sort_keys=True)
+
+    cases_prompt = "\n".join(
+        f"- {case_id}: {data.get('titre', '')}"
+        for case_id, data in ordered.items()
+    )
+    case_contexts = {
+        case_id: (
+            f"\n\nCAS IDENTIFIÉ: {data.get('titre', '')}\n"
+            f"INFORMATIONS: {json.dumps(data, ensure_ascii=False, indent=2)}"
+        )
+        for case_id, data in ordered.items()
+    }
+
+    return KnowledgeSnapshot(
+        version=version,
+        checksum=hashlib.sha256(canonical.encode("utf-8")).hexdigest(),
+        loaded_at=datetime.utcnow(),
+        cases=_freeze(ordered),
+        cases_prompt=cases_prompt,
+        case_contexts=MappingProxyType(case_contexts),
+        aliases=MappingProxyType(dict(aliases or {})),
+    )
+
+
+EMPTY_SNAPSHOT = build_snapshot({})
+
+
+def dump_compiled_snapshot(snapshot: KnowledgeSnapshot) -> bytes:
+    """
+    Sérialise un instantané et ses index précalculés
+
+    Format : SNAPSHOT_MAGIC + sha256 (32 octets) + JSON compressé zlib.
+    """
+    payload = {
+        "format": SNAPSHOT_FORMAT,
+        "checksum": snapshot.checksum,
+        "built_at": snapshot.loaded_at.isoformat(),
+        "cases": {case_id: _thaw(data) for case_id, data in snapshot.cases.items()},
+        "aliases": dict(snapshot.aliases),
+        "cases_prompt": snapshot.cases_prompt,
+        "case_contexts": dict(snapshot.case_contexts),
+    }
+    body = zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"), 9)
+    return SNAPSHOT_MAGIC + hashlib.sha256(body).digest() + body
+
+
+def load_compiled_snapshot(path: Path, version: int = 0) -> KnowledgeSnapshot:
+    """
+    Charge un instantané compilé en une seule lecture
+
+    Les index sont repris tels quels, sans recalcul.
+
+    Raises:
+        KnowledgeBaseError: Fichier corrompu ou format inconnu
+    """
+    data = Path(path).read_bytes()
+    header_size = len(SNAPSHOT_MAGIC) + 32
+    if len(data) < header_size or not data.startswith(SNAPSHOT_MAGIC):
+        raise KnowledgeBaseError(f"{path}: format d'instantané inconnu")
+    digest, body = data[len(SNAPSHOT_MAGIC):header_size], data[header_size:]
+    if hashlib.sha256(body).digest() != digest:
+        raise KnowledgeBaseError(f"{path}: somme de contrôle invalide")
+
+    payload = json.loads(zlib.decompress(body))
+    if payload.get("format") != SNAPSHOT_FORMAT:
+        raise KnowledgeBaseError(f"{path}: version de format {payload.get('format')} non supportée")
+
+    return KnowledgeSnapshot(
+        version=version,
+        checksum=payload["checksum"],
+        loaded_at=datetime.utcnow(),
+        cases=_freeze(payload["cases"]),
+        cases_prompt=payload["cases_prompt"],
+        case_contexts=MappingProxyType(payload["case_contexts"]),
+        aliases=MappingProxyType(payload["aliases"]),
+    )
+
+
+class KnowledgeBaseManager:
+    """
+    Charge la base de connaissances et publie un nouvel instantané à chaque modification
+
+    Source : l'instantané compilé `snapshot_path` s'il est défini, sinon les
+    fichiers JSON du dossier `directory`.
+    """
+
+    def __init__(
+        self,
+        directory: str = KNOWLEDGE_BASE_DIR,
+        poll_interval: float = KNOWLEDGE_BASE_POLL_INTERVAL,
+        snapshot_path: str = KNOWLEDGE_BASE_SNAPSHOT
+    ):
+        self.directory = Path(directory)
+        self.snapshot_path = Path(snapshot_path) if snapshot_path else None
+        self.poll_interval = poll_interval
+        self._snapshot = EMPTY_SNAPSHOT
+        self._listeners: List[Callable[[KnowledgeSnapshot], None]] = []
+        # fichier -> ((mtime_ns, taille), cas validé)
+        self._files: Dict[str, Tuple[Tuple[int, int], Dict]] = {}
+        self._compiled_stat: Optional[Tuple[int, int]] = None
+        # Versions rejetées (fichier -> (mtime_ns, taille)) : signalées une seule fois
+        self._rejected: Dict[str, Tuple[int, int]] = {}
+        self._compiled_rejected: Optional[Tuple[int, int]] = None
+        self._reload_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def snapshot(self) -> KnowledgeSnapshot:
+        """Instantané courant (lecture atomique d'une référence)"""
+        return self._snapshot
+
+    def subscribe(self, callback: Callable[[KnowledgeSnapshot], None]):
+        """Appelle `callback` avec chaque nouvel instantané publié"""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback: Callable[[KnowledgeSnapshot], None]):
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def _publish(self, snapshot: KnowledgeSnapshot):
+        self._snapshot = snapshot
+        for callback in self._listeners:
+            try:
+                callback(snapshot)
+            except Exception:
+                logger.exception("Erreur d'un abonné à la base de connaissances")
+
+    def _scan(self) -> Dict[str, Tuple[int, int]]:
+        signature = {}
+        for json_file in self.directory.glob("*.json"):
+            try:
+                stat = json_file.stat()
+            except FileNotFoundError:
+                continue
+            signature[json_file.name] = (stat.st_mtime_ns, stat.st_size)
+        return signature
+
+    def reload(self) -> bool:
+        """
+        Relit la source si elle a changé et publie un nouvel instantané si besoin
+
+        Un fichier invalide est ignoré : la version précédemment chargée
+        (du cas ou de l'instantané compilé) est conservée. Il n'est relu
+        (et signalé) à nouveau qu'une fois modifié.
+
+        Returns:
+            True si un nouvel instantané a été publié
+        """
+        with self._reload_lock:
+            if self.snapshot_path is not None:
+                return self._reload_compiled()
+            return self._reload_directory()
+
+    def _reload_compiled(self) -> bool:
+        try:
+            stat = self.snapshot_path.stat()
+        except FileNotFoundError:
+            logger.warning(f"Instantané {self.snapshot_path} introuvable")
+            return False
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature in (self._compiled_stat, self._compiled_rejected):
+            return False
+
+        try:
+            snapshot = load_compiled_snapshot(self.snapshot_path, version=self._snapshot.version + 1)
+        except Exception as e:
+            logger.error(f"Erreur chargement {self.snapshot_path}: {e}")
+            self._compiled_rejected = signature
+            return False
+        self._compiled_stat = signature
+        self._compiled_rejected = None
+
+        if snapshot.checksum == self._snapshot.checksum:
+            return False
+
+        self._publish(snapshot)
+        logger.info(f"✅ Base de connaissances v{snapshot.version}: {len(snapshot)} cas (instantané compilé)")
+        return True
+
+    def _reload_directory(self) -> bool:
+        if not self.directory.exists():
+            logger.warning(f"Dossier {self.directory} introuvable")
+            return False
+
+        signature = self._scan()
+        self._rejected = {name: stat for name, stat in self._rejected.items() if signature.get(name) == stat}
+        changed = [
+            name for name, stat in signature.items()
+            if (name not in self._files or self._files[name][0] != stat) and name not in self._rejected
+        ]
+        removed = [name for name in self._files if name not in signature]
+        if not changed and not removed:
+            return False
+
+        files = {name: entry for name, entry in self._files.items() if name in signature}
+        for name in changed:
+            case_id = Path(name).stem  # Nom du fichier sans extension
+            try:
+                with open(self.directory / name, "r", encoding="utf-8") as f:
+                    data = validate_case(case_id, json.load(f))
+            except Exception as e:
+                logger.error(f"Erreur chargement {name}: {e}")
+                self._rejected[name] = signature[name]
+                continue
+            files[name] = (signature[name], data)
+
+        cases, aliases = normalize_cases(
+            {Path(name).stem: data for name, (_, data) in files.items()}
+        )
+        snapshot = build_snapshot(cases, version=self._snapshot.version + 1, aliases=aliases)
+        self._files = files
+
+        if snapshot.checksum == self._snapshot.checksum:
+            return False
+
+        self._publish(snapshot)
+        logger.info(
+            f"✅ Base de connaissances v{snapshot.version}: {len(snapshot)} cas "
+            f"({len(changed)} modifié(s), {len(removed)} supprimé(s))"
+        )
+        return True
+
+    def start(self):
+        """Démarre la surveillance du dossier en arrière-plan"""
+        if self._thread is not None or self.poll_interval <= 0:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._watch, name="kb-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Arrête la surveillance du dossier"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._thread.join(timeout=self.poll_interval + 1)
+        self._thread = None
+
+    def _watch(self):
+        while not self._stopping.wait(self.poll_interval):
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("Erreur de rechargement de la base de connaissances")
@@ -1,115 +1,210 @@
 """
 Application FastAPI principale
 SYFL AI - Assistant juridique togolais
+
+L'application est construite par `create_app(settings)` ; l'import du module
+n'a pas d'effet de bord (ni base de données, ni client LLM, ni ReportLab).
+Les tables, la base de connaissances, le moteur IA et les workers sont
+initialisés au démarrage (lifespan).
+
+Usage:
+    uvicorn app.main:app
+    uvicorn --factory app.main:create_app
+    gunicorn app.main:app -c gunicorn.conf.py     # production multi-workers
 """
-import os
-import json
-from pathlib import Path
-from fastapi import FastAPI, Request
+import asyncio
+import gc
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import Depends, FastAPI, HTTPException, Request, status
+from fastapi.responses import JSONResponse, Response
+from starlette.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 from loguru import logger
-from slowapi import Limiter, _rate_limit_exceeded_handler
-from slowapi.util import get_remote_address
+from slowapi import _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
 
-from app.database import engine, Base
-from app.routes import auth, chat
+from app.config import Settings
+from app import database
+from app.database import Base, get_db, pool_status
+from app.routes import auth, chat, export, stats, ws
 from app.ai_engine import AIEngine
+from app.fallback import FallbackEngine
+from app.jobs import job_runner
+from app.knowledge_base import KnowledgeBaseManager
+from app.read_replicas import read_router
+from app.write_behind import write_behind
+from app.context_cache import context_cache
+from app.metrics import CONTENT_TYPE, REGISTRY, MetricsMiddleware
+from app.timing import ServerTimingMiddleware
+from app.pdf_export import render_pool
+from app import bulk_export  # noqa: F401 - enregistre le handler des exports groupés
+from app import archive  # noqa: F401 - enregistre le handler d'archivage
 
 # Charger les variables d'environnement
 load_dotenv()
 
-# Créer les tables
-Base.metadata.create_all(bind=engine)
-logger.info("✅ Base de données initialisée")
-
-# Initialiser le rate limiter
-limiter = Limiter(key_func=get_remote_address)
-
-# Créer l'application FastAPI
-app = FastAPI(
-    title="SYFL AI API",
-    description="API Backend pour SYFL AI - Assistant juridique togolais",
-    version="1.0.0"
-)
-
-# Ajouter le rate limiter à l'app
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
-
-# Configuration CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=[
-        "http://localhost:3000",  # Next.js dev
-        "http://localhost:19006",  # Expo web
-        "http://localhost:8081",  # Expo mobile
-        "https://syfl-ai-frontend.vercel.app",  # Vercel production
-    ],
-    allow_origin_regex=r"https://.*\.vercel\.app",  # Tous les déploiements Vercel
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Charger la base de connaissances
-knowledge_base = {}
-
-
-def load_knowledge_base():
-    """Charge les cas juridiques depuis les fichiers JSON"""
-    global knowledge_base
-    base_path = Path("bases_connaissances")
-    
-    if not base_path.exists():
-        logger.warning("Dossier bases_connaissances introuvable")
-        return
-    
-    for json_file in base_path.glob("*.json"):
-        try:
-            with open(json_file, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                case_id = json_file.stem  # Nom du fichier sans extension
-                knowledge_base[case_id] = data
-                logger.info(f"Cas chargé: {data.get('titre', case_id)}")
-        except Exception as e:
-            logger.error(f"Erreur chargement {json_file}: {e}")
-    
-    logger.info(f"✅ {len(knowledge_base)} cas juridiques chargés")
-
-
-# Initialiser l'AIEngine
-MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
-if not MISTRAL_API_KEY:
-    logger.error("❌ MISTRAL_API_KEY non trouvée dans .env")
-    raise ValueError("MISTRAL_API_KEY manquante")
-
-ai_engine = AIEngine(api_key=MISTRAL_API_KEY)
-
-# Configurer l'AIEngine pour le module chat
-chat.set_ai_engine(ai_engine)
-
-
-@app.on_event("startup")
-def startup_event():
-    """Événement de démarrage"""
-    load_knowledge_base()
-    ai_engine.load_knowledge_base(knowledge_base)
-    logger.info("🚀 SYFL AI démarré avec succès")
-
-
-# Inclure les routes
-app.include_router(auth.router)
-app.include_router(chat.router)
-
-# Importer et inclure les nouvelles routes
-from app.routes import export, stats
-app.include_router(export.router)
-app.include_router(stats.router)
-
-
-@app.get("/")
+
+def build_ai_engine(settings: Settings) -> AIEngine:
+    """Moteur IA selon le backend configuré (le SDK Mistral est chargé au premier appel)"""
+    if settings.llm_backend == "fake":
+        from app.fake_llm import FakeMistral
+        logger.warning("⚠️ LLM_BACKEND=fake : réponses simulées, aucun appel à Mistral")
+        return AIEngine(api_key="", model=settings.mistral_model, client=FakeMistral())
+    return AIEngine(api_key=settings.mistral_api_key, model=settings.mistral_model)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Démarrage et arrêt de l'application"""
+    started = time.perf_counter()
+    settings: Settings = app.state.settings
+    try:
+        settings.validate()
+    except ValueError as e:
+        logger.error(f"❌ Configuration invalide: {e}")
+        raise
+
+    if settings.create_tables and not app.state.preloaded:
+        await run_in_threadpool(Base.metadata.create_all, bind=app.state.engine)
+        logger.info("✅ Base de données initialisée")
+
+    # Chaque nouvelle version de la base de connaissances est transmise à l'AIEngine
+    ai_engine = build_ai_engine(settings)
+    knowledge_base_manager: KnowledgeBaseManager = app.state.knowledge_base_manager
+    knowledge_base_manager.subscribe(ai_engine.use_snapshot)
+    if not knowledge_base_manager.reload() and len(knowledge_base_manager.snapshot):
+        # Base inchangée depuis un démarrage précédent : instantané déjà en mémoire
+        ai_engine.use_snapshot(knowledge_base_manager.snapshot)
+    if settings.watch_knowledge_base:
+        knowledge_base_manager.start()
+    app.state.ai_engine = ai_engine
+    chat.set_ai_engine(ai_engine)
+
+    if settings.background_workers:
+        # Workers des jobs d'arrière-plan (exports groupés, purges...)
+        job_runner.start()
+        # Écritures différées (rejoue d'abord le journal laissé par un arrêt brutal)
+        await run_in_threadpool(write_behind.start)
+    # Sondes de santé des réplicas en lecture
+    replica_checks = asyncio.create_task(read_router.run_health_checks()) if read_router.enabled else None
+    logger.info(f"🚀 SYFL AI démarré avec succès ({(time.perf_counter() - started) * 1000:.0f}ms)")
+    yield
+    # Arrêt gracieux : les jobs en cours se terminent avant la sortie
+    knowledge_base_manager.stop()
+    knowledge_base_manager.unsubscribe(ai_engine.use_snapshot)
+    if settings.background_workers:
+        await run_in_threadpool(job_runner.shutdown)
+        await run_in_threadpool(write_behind.shutdown)
+    render_pool.shutdown()
+    if replica_checks is not None:
+        replica_checks.cancel()
+    # Connexions aiosqlite/asyncpg fermées sur la boucle qui les a ouvertes
+    await app.state.async_engine.dispose()
+    await read_router.dispose()
+
+
+def preload(app: FastAPI):
+    """
+    Initialisation partagée, exécutée une fois dans le processus maître
+    avant le fork des workers (gunicorn --preload)
+
+    Les tables sont créées une seule fois (pas de course entre workers), et
+    l'instantané de la base de connaissances et son index de secours sont
+    construits avant le fork : les workers les partagent en copie sur
+    écriture au lieu de les reconstruire chacun. Les connexions et clients
+    (pool SQLAlchemy, client Mistral, threads) restent propres à chaque worker.
+    """
+    settings: Settings = app.state.settings
+    settings.validate()
+    if settings.create_tables:
+        Base.metadata.create_all(bind=app.state.engine)
+        logger.info("✅ Base de données initialisée")
+
+    knowledge_base_manager: KnowledgeBaseManager = app.state.knowledge_base_manager
+    knowledge_base_manager.reload()
+    snapshot = knowledge_base_manager.snapshot
+    FallbackEngine.for_snapshot(snapshot)
+    app.state.preloaded = True
+
+    # Les connexions du maître ne doivent jamais servir dans un worker
+    app.state.engine.dispose()
+    # Objets préchargés hors du ramasse-miettes : ses passages ne modifient
+    # plus leurs pages mémoire, qui restent partagées entre les workers
+    gc.freeze()
+    logger.info(f"📦 Préchargé avant fork: {len(snapshot)} cas (v{snapshot.version})")
+
+
+def create_app(
+    settings: Optional[Settings] = None,
+    engine: Optional[Engine] = None,
+    async_engine: Optional[AsyncEngine] = None
+) -> FastAPI:
+    """
+    Construit l'application (routes, middlewares) sans rien initialiser
+
+    Args:
+        settings: Réglages de l'instance, lus depuis l'environnement par défaut
+        engine: Moteur des tables créées au démarrage (app.database.engine par défaut)
+        async_engine: Moteur async fermé à l'arrêt (app.database.async_engine par défaut)
+    """
+    settings = settings or Settings.from_env()
+
+    app = FastAPI(
+        title="SYFL AI API",
+        description="API Backend pour SYFL AI - Assistant juridique togolais",
+        version="1.0.0",
+        lifespan=lifespan
+    )
+    app.state.settings = settings
+    app.state.engine = engine or database.engine
+    app.state.async_engine = async_engine or database.async_engine
+    # Base de connaissances (rechargée à chaud quand un fichier change)
+    app.state.knowledge_base_manager = KnowledgeBaseManager()
+    app.state.ai_engine = None
+    app.state.preloaded = False
+
+    # Rate limiter des routes d'authentification (désactivable pour les benchmarks de charge)
+    auth.limiter.enabled = settings.rate_limit_enabled
+    app.state.limiter = auth.limiter
+    app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+
+    # Latence, statut et requêtes en cours par route (exposés sur /metrics)
+    app.add_middleware(MetricsMiddleware)
+    # Décomposition par phase (en-tête Server-Timing) et profils échantillonnés
+    app.add_middleware(ServerTimingMiddleware)
+
+    # Configuration CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_origin_regex=settings.cors_origin_regex,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["Server-Timing"],
+    )
+
+    # Inclure les routes
+    app.include_router(auth.router)
+    app.include_router(chat.router)
+    app.include_router(export.router)
+    app.include_router(stats.router)
+    app.include_router(ws.router)
+
+    app.get("/")(root)
+    app.get("/metrics", include_in_schema=False)(metrics)
+    app.get("/health")(health_check)
+    return app
+
+
 def root():
     """Route racine"""
     return {
@@ -119,13 +214,50 @@ def root():
     }
 
 
-@app.get("/health")
-def health_check():
-    """Vérification de santé de l'API"""
-    return {
-        "status": "healthy",
-        "database": "connected",
-        "knowledge_base_loaded": len(knowledge_base) > 0,
-        "cases_count": len(knowledge_base),
-        "mistral_configured": MISTRAL_API_KEY is not None
+def metrics(request: Request):
+    """Métriques au format texte Prometheus"""
+    token = request.app.state.settings.metrics_token
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Jeton invalide")
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
+def check_database(db: Session) -> bool:
+    """Exécute une requête triviale sur la base"""
+    try:
+        db.execute(text("SELECT 1"))
+        return True
+    except Exception as e:
+        logger.error(f"❌ Base de données injoignable: {e}")
+        return False
+
+
+def health_check(request: Request, db: Session = Depends(get_db)):
+    """Vérification de santé de l'API (503 si la base est injoignable)"""
+    settings: Settings = request.app.state.settings
+    ai_engine: Optional[AIEngine] = request.app.state.ai_engine
+    snapshot = request.app.state.knowledge_base_manager.snapshot
+    database_ok = check_database(db)
+    payload = {
+        "status": "healthy" if database_ok else "unhealthy",
+        "database": "connected" if database_ok else "unreachable",
+        "database_pool": pool_status(request.app.state.engine),
+        "database_async_pool": pool_status(request.app.state.async_engine),
+        "read_replicas": read_router.status(),
+        "write_behind": write_behind.status(),
+        "context_cache": context_cache.status(),
+        "knowledge_base_loaded": len(snapshot) > 0,
+        "cases_count": len(snapshot),
+        "knowledge_base_version": snapshot.version,
+        "knowledge_base_checksum": snapshot.checksum[:12],
+        "knowledge_base_loaded_at": snapshot.loaded_at.isoformat(),
+        "mistral_configured": settings.mistral_api_key is not None,
+        "llm_circuit": ai_engine.circuit.state if ai_engine is not None else None
     }
+    if not database_ok:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=payload)
+    return payload
+
+
+# Application par défaut (uvicorn app.main:app), configurée depuis l'environnement
+app = create_app()
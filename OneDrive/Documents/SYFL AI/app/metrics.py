@@ -0,0 +1,449 @@
+"""
+Métriques de l'application au format texte Prometheus
+
+Registre minimal en mémoire (compteurs, jauges, histogrammes avec labels),
+sans dépendance externe. Les valeurs sont propres au processus : avec
+plusieurs workers, chaque worker expose les siennes et Prometheus agrège.
+
+Usage:
+    REQUESTS = counter("app_requests_total", "Requêtes", ["route"])
+    REQUESTS.labels("/api/chat/send").inc()
+
+    with LATENCY.labels("detect_case").time():
+        ...
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from loguru import logger
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.timing import record_span
+
+# Bornes par défaut (secondes) : de la requête en cache à l'appel LLM lent
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Requêtes SQL et attente du pool : surtout sous la milliseconde
+DB_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base commune : nom, aide, labels et séries par combinaison de labels"""
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._series: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def _new_series(self):
+        raise NotImplementedError
+
+    def labels(self, *values: str):
+        """Série correspondant aux valeurs de labels (créée au premier usage)"""
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name}: labels attendus {self.labelnames}")
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.setdefault(key, self._new_series())
+        return series
+
+    def _default(self):
+        return self.labels()
+
+    def collect(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, series in sorted(self._series.items()):
+            lines.extend(series.render(self.name, self.labelnames, key))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self, name, labelnames, key) -> List[str]:
+        return [f"{name}{_format_labels(labelnames, key)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    """Valeur qui ne fait qu'augmenter"""
+    kind = "counter"
+
+    def _new_series(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """Valeur instantanée (peut aussi être calculée à la collecte)"""
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback: Optional[Callable[[], Dict]] = None):
+        super().__init__(name, documentation, labelnames)
+        # Retourne {valeurs de labels: valeur}, appelé à chaque collecte
+        self.callback = callback
+
+    def _new_series(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def collect(self) -> List[str]:
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.debug(f"Collecte de {self.name} impossible: {e}")
+                values = {}
+            for key, value in values.items():
+                self.labels(*key).set(value)
+        return super().collect()
+
+
+class _HistogramSeries:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    def render(self, name, labelnames, key) -> List[str]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = 'le="' + _format_value(bound) + '"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, key, le)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, key)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, key)} {cumulative}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Distribution de durées (ou de tailles) par intervalles cumulés"""
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_series(self):
+        return _HistogramSeries(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class Registry:
+    """Ensemble des métriques exposées par /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: _Metric) -> _Metric:
+        """
+        Ajoute une métrique au registre
+
+        Raises:
+            ValueError: Une autre métrique porte déjà ce nom (ses séries
+                seraient mélangées à celles de la nouvelle)
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Métrique déjà enregistrée: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = (), callback=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames, callback))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# === HTTP ===
+
+HTTP_REQUESTS = counter(
+    "syfl_http_requests_total", "Requêtes HTTP traitées", ["method", "route", "status"]
+)
+HTTP_LATENCY = histogram(
+    "syfl_http_request_duration_seconds", "Durée des requêtes HTTP", ["method", "route", "status"]
+)
+HTTP_IN_FLIGHT = gauge(
+    "syfl_http_requests_in_flight", "Requêtes HTTP en cours", ["method"]
+)
+
+# === LLM ===
+
+LLM_LATENCY = histogram(
+    "syfl_llm_request_duration_seconds", "Durée des appels au LLM", ["task", "model", "outcome"]
+)
+LLM_TOKENS = counter(
+    "syfl_llm_tokens_total", "Tokens consommés par les appels au LLM", ["task", "model", "kind"]
+)
+LLM_UNAVAILABLE = counter(
+    "syfl_llm_unavailable_total", "Appels au LLM évités (disjoncteur ou file saturée)", ["task", "reason"]
+)
+CHAT_REPLIES = counter(
+    "syfl_chat_replies_total", "Réponses du chat par origine", ["source"]
+)
+WS_CONNECTIONS = gauge(
+    "syfl_ws_connections", "Connexions WebSocket du chat ouvertes"
+)
+WS_GENERATIONS = counter(
+    "syfl_ws_generations_total", "Réponses diffusées sur WebSocket par issue", ["outcome"]
+)
+
+# === Caches ===
+
+CACHE_REQUESTS = counter(
+    "syfl_cache_requests_total", "Consultations des caches", ["cache", "result"]
+)
+
+# === Rendu PDF ===
+
+PDF_RENDER_LATENCY = histogram(
+    "syfl_pdf_render_duration_seconds", "Durée des rendus PDF", ["mode"]
+)
+PDF_RENDER_QUEUE = histogram(
+    "syfl_pdf_render_queue_seconds", "Attente d'une place dans le pool de rendu PDF", buckets=DB_BUCKETS
+)
+PDF_RENDER_REJECTED = counter(
+    "syfl_pdf_render_rejected_total", "Rendus PDF refusés (pool saturé)"
+)
+
+# === Base de données ===
+
+# Moteurs instrumentés par nom (label engine) : primary, async, hôte d'un réplica
+_ENGINES: Dict[str, Engine] = {}
+
+DB_QUERY_LATENCY = histogram(
+    "syfl_db_query_duration_seconds", "Durée des requêtes SQL", ["engine", "operation"], buckets=DB_BUCKETS
+)
+DB_POOL_CHECKOUT = histogram(
+    "syfl_db_pool_checkout_seconds", "Attente d'une connexion du pool", ["engine"], buckets=DB_BUCKETS
+)
+DB_CONNECTION_HOLD = histogram(
+    "syfl_db_connection_hold_seconds", "Durée d'emprunt d'une connexion du pool", ["engine"],
+    buckets=DEFAULT_BUCKETS
+)
+DB_READ_ROUTING = counter(
+    "syfl_db_read_routing_total", "Sessions de lecture par destination", ["target"]
+)
+WRITE_BEHIND_RECORDS = counter(
+    "syfl_write_behind_records_total", "Écritures différées par issue", ["outcome"]
+)
+WRITE_BEHIND_PENDING = gauge(
+    "syfl_write_behind_pending", "Écritures journalisées en attente d'insertion"
+)
+WRITE_BEHIND_FLUSH = histogram(
+    "syfl_write_behind_flush_seconds", "Durée des insertions par lot des écritures différées", buckets=DB_BUCKETS
+)
+
+
+def record_cache(cache: str, hit: bool):
+    """Compte une consultation de cache"""
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def _pool_stats() -> Dict[Tuple[str, ...], float]:
+    stats = {}
+    for engine_name, engine in list(_ENGINES.items()):
+        pool = engine.pool
+        for name in ("size", "checkedout", "overflow", "checkedin"):
+            method = getattr(pool, name, None)
+            if callable(method):
+                stats[(engine_name, name)] = method()
+    return stats
+
+
+DB_POOL_CONNECTIONS = gauge(
+    "syfl_db_pool_connections", "État du pool de connexions", ["engine", "state"], callback=_pool_stats
+)
+
+
+def instrument_engine(engine: Engine, name: str = "primary"):
+    """
+    Mesure les requêtes SQL et le pool de connexions d'un moteur
+
+    - durée de chaque requête (before/after_cursor_execute)
+    - attente d'une connexion : Engine.raw_connection() chronométré
+    - durée d'emprunt : du checkout au checkin
+
+    Tout est attaché au moteur et non à son pool : engine.dispose() remplace
+    le pool (gunicorn preload/post_fork), les mesures continuent sur le nouveau.
+
+    Args:
+        engine: Moteur synchrone (AsyncEngine.sync_engine pour un moteur async)
+        name: Valeur du label engine de ses séries (primary, async, hôte du réplica)
+    """
+    if getattr(engine, "_syfl_instrumented", False):
+        return
+    engine._syfl_instrumented = True
+    _ENGINES[name] = engine
+    checkout_latency = DB_POOL_CHECKOUT.labels(name)
+    connection_hold = DB_CONNECTION_HOLD.labels(name)
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("syfl_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["syfl_query_start"].pop()
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+        DB_QUERY_LATENCY.labels(name, operation).observe(duration)
+        # Temps SQL cumulé de la requête HTTP en cours (Server-Timing)
+        record_span("db", duration)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(context):
+        starts = context.connection.info.get("syfl_query_start") if context.connection else None
+        if starts:
+            starts.pop()
+
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["syfl_checkout_at"] = time.perf_counter()
+
+    @event.listens_for(engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        start = connection_record.info.pop("syfl_checkout_at", None)
+        if start is not None:
+            connection_hold.observe(time.perf_counter() - start)
+
+    # Pas d'événement avant le checkout : Connection() passe par raw_connection(),
+    # qui lit engine.pool à chaque appel
+    raw_connection = engine.raw_connection
+
+    def timed_raw_connection():
+        start = time.perf_counter()
+        try:
+            return raw_connection()
+        finally:
+            checkout_latency.observe(time.perf_counter() - start)
+
+    engine.raw_connection = timed_raw_connection
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI : durée, statut et requêtes en cours par route
+
+    La route est le chemin déclaré (/api/chat/conversations/{conversation_id})
+    et non l'URL, pour garder un nombre de séries borné. La durée couvre
+    l'envoi complet de la réponse, streaming compris.
+    """
+
+    def __init__(self, app, excluded_paths: Sequence[str] = ("/metrics",)):
+        self.app = app
+        self.excluded_paths = set(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        start = time.perf_counter()
+        in_flight = HTTP_IN_FLIGHT.labels(method)
+        in_flight.inc()
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            status = str(status_code)
+            HTTP_REQUESTS.labels(method, route_path, status).inc()
+            HTTP_LATENCY.labels(method, route_path, status).observe(time.perf_counter() - start)
@@ -1,7 +1,7 @@
 """
 Modèles de base de données SQLAlchemy
 """
-from sqlalchemy import Column, Integer, String, Text, DateTime, ForeignKey, JSON, Boolean
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, ForeignKey, JSON, Boolean, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database import Base
@@ -19,8 +19,10 @@ class User(Base):
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     
-    # Relations
-    conversations = relationship("Conversation", back_populates="user", cascade="all, delete-orphan")
+    # Relations (passive_deletes : les enfants sont supprimés par la base, ON DELETE CASCADE)
+    conversations = relationship(
+        "Conversation", back_populates="user", cascade="all, delete-orphan", passive_deletes=True
+    )
 
 
 class Conversation(Base):
@@ -36,7 +38,9 @@ class Conversation(Base):
     
     # Relations
     user = relationship("User", back_populates="conversations")
-    messages = relationship("Message", back_populates="conversation", cascade="all, delete-orphan")
+    messages = relationship(
+        "Message", back_populates="conversation", cascade="all, delete-orphan", passive_deletes=True
+    )
 
 
 class Message(Base):
@@ -47,13 +51,69 @@ class Message(Base):
     conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), nullable=False, index=True)
     role = Column(String, nullable=False, index=True)  # "user" ou "assistant"
     content = Column(Text, nullable=False)
-    extra_data = Column(JSON, nullable=True)  # Données supplémentaires (cas détecté, etc.)
+    extra_data = Column(JSON, nullable=True)  # Données supplémentaires libres
     created_at = Column(DateTime, default=datetime.utcnow, index=True)
     
+    # Métadonnées des réponses de l'assistant (colonnes typées et indexées pour les statistiques)
+    case_id = Column(String, nullable=True, index=True)  # Cas juridique détecté
+    confidence = Column(Float, nullable=True)  # Confiance de la détection
+    source = Column(String, nullable=True, index=True)  # "llm" ou "knowledge_base"
+    model = Column(String, nullable=True, index=True)  # Modèle du LLM (réponses "llm" uniquement)
+    prompt_tokens = Column(Integer, nullable=True)
+    completion_tokens = Column(Integer, nullable=True)
+    latency_ms = Column(Integer, nullable=True)  # Durée de l'appel au LLM
+    
     # Relations
     conversation = relationship("Conversation", back_populates="messages")
 
 
+class ConversationArchive(Base):
+    """Messages d'une conversation inactive, compressés en un seul blob (voir app.archive)"""
+    __tablename__ = "conversation_archives"
+    
+    conversation_id = Column(Integer, ForeignKey("conversations.id", ondelete="CASCADE"), primary_key=True)
+    codec = Column(String, nullable=False)  # "zlib" ou "zstd"
+    payload = Column(LargeBinary, nullable=False)
+    message_count = Column(Integer, nullable=False)
+    role_counts = Column(JSON, nullable=False)  # {"user": n, "assistant": m}
+    last_message_id = Column(Integer, nullable=True)  # Clé du cache des exports PDF
+    raw_size = Column(Integer, nullable=False)  # Taille avant compression (octets)
+    archived_at = Column(DateTime, default=datetime.utcnow)
+
+
+class WriteBehindCheckpoint(Base):
+    """Dernière écriture différée insérée pour chaque journal local (voir app.write_behind)"""
+    __tablename__ = "write_behind_checkpoints"
+    
+    slot = Column(String, primary_key=True)  # "<hôte>/slot-<n>"
+    seq = Column(Integer, nullable=False)  # Mis à jour dans la transaction du lot
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class Job(Base):
+    """Modèle de job d'arrière-plan (exports, purges, recalculs...)"""
+    __tablename__ = "jobs"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False, index=True)  # Nom du handler (ex: bulk_export)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=True, index=True)
+    status = Column(String, nullable=False, default="pending", index=True)  # pending, running, completed, failed, expired
+    priority = Column(Integer, nullable=False, default=0)  # Les plus grandes valeurs passent en premier
+    payload = Column(JSON, nullable=True)
+    result = Column(JSON, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=3)
+    last_error = Column(Text, nullable=True)
+    progress_current = Column(Integer, default=0)
+    progress_total = Column(Integer, default=0)
+    run_after = Column(DateTime, default=datetime.utcnow, index=True)  # Report après un échec (backoff)
+    locked_by = Column(String, nullable=True)  # Worker qui exécute le job
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
 class Case(Base):
     """Modèle de cas juridique (pour référence future)"""
     __tablename__ = "cases"
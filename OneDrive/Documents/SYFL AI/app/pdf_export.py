@@ -0,0 +1,416 @@
+"""
+Rendu PDF des conversations hors de la boucle d'événements
+
+Le rendu ReportLab est purement CPU : il est exécuté dans un pool de
+processus borné qui ne reçoit que des données simples (dict + tuples),
+jamais d'objets SQLAlchemy.
+"""
+import asyncio
+import importlib.util
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Tuple
+
+from loguru import logger
+
+from app.metrics import PDF_RENDER_LATENCY, PDF_RENDER_QUEUE, PDF_RENDER_REJECTED
+
+# ReportLab n'est importé qu'au premier rendu (démarrage de l'application plus rapide)
+REPORTLAB_AVAILABLE = importlib.util.find_spec("reportlab") is not None
+
+# Configuration du pool de rendu
+# PDF_EXPORT_WORKERS=0 désactive le pool de processus (rendu dans un thread)
+PDF_EXPORT_WORKERS = int(os.getenv("PDF_EXPORT_WORKERS", "2"))
+PDF_EXPORT_MAX_CONCURRENCY = int(os.getenv("PDF_EXPORT_MAX_CONCURRENCY", "4"))
+PDF_EXPORT_TIMEOUT = float(os.getenv("PDF_EXPORT_TIMEOUT", "30"))
+PDF_EXPORT_QUEUE_TIMEOUT = float(os.getenv("PDF_EXPORT_QUEUE_TIMEOUT", "5"))
+# Processus utilisables par les jobs (exports groupés), 0 = PDF_EXPORT_WORKERS - 1
+PDF_EXPORT_JOB_CONCURRENCY = int(os.getenv("PDF_EXPORT_JOB_CONCURRENCY", "0")) or None
+# Au-delà de ce nombre de messages, rendu incrémental depuis la base (mémoire bornée)
+PDF_STREAMING_THRESHOLD = int(os.getenv("PDF_STREAMING_THRESHOLD", "300"))
+
+# Intervalle de vérification du démarrage d'un rendu en file d'attente (secondes)
+_START_POLL_INTERVAL = 0.01
+
+# Version du gabarit : à incrémenter à chaque changement de mise en page
+# (invalide les PDF en cache)
+TEMPLATE_VERSION = 1
+
+# (role, contenu, date de création)
+MessageTuple = Tuple[str, str, datetime]
+
+_styles = None
+
+
+class PDFExportBusy(Exception):
+    """Levée quand toutes les places de rendu sont occupées"""
+
+
+def get_styles():
+    """Feuille de styles du PDF (construite au premier appel)"""
+    global _styles
+    if _styles is None:
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+
+        styles = getSampleStyleSheet()
+        styles.add(ParagraphStyle(
+            'CustomTitle',
+            parent=styles['Heading1'],
+            fontSize=24,
+            textColor=colors.HexColor('#2563eb'),
+            spaceAfter=30,
+        ))
+
+        styles.add(ParagraphStyle(
+            'CustomHeading',
+            parent=styles['Heading2'],
+            fontSize=14,
+            textColor=colors.HexColor('#1e40af'),
+            spaceAfter=12,
+        ))
+
+        styles.add(ParagraphStyle(
+            'UserMessage',
+            parent=styles['BodyText'],
+            fontSize=11,
+            leftIndent=20,
+            rightIndent=0,
+            spaceAfter=10,
+        ))
+
+        styles.add(ParagraphStyle(
+            'AssistantMessage',
+            parent=styles['BodyText'],
+            fontSize=11,
+            leftIndent=0,
+            rightIndent=20,
+            spaceAfter=10,
+        ))
+        _styles = styles
+    return _styles
+
+
+class _FlowableFeed(list):
+    """
+    Liste de flowables alimentée à la demande par un itérateur
+
+    ReportLab consomme la liste par le début : seuls quelques flowables
+    sont en mémoire à la fois au lieu d'un par message.
+    """
+
+    def __init__(self, flowables: Iterable, low_water: int = 64):
+        super().__init__()
+        self._source = iter(flowables)
+        self._low_water = low_water
+
+    def __len__(self):
+        if self._source is not None and super().__len__() < self._low_water:
+            self._refill()
+        return super().__len__()
+
+    def _refill(self):
+        for flowable in self._source:
+            self.append(flowable)
+            if super().__len__() >= 2 * self._low_water:
+                return
+        self._source = None
+
+
+def _iter_flowables(meta: Dict, messages: Iterable[MessageTuple], message_count: int):
+    """Génère les flowables du document dans l'ordre"""
+    from reportlab.lib import colors
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, Spacer, Table, TableStyle
+
+    styles = get_styles()
+
+    # Add title
+    yield Paragraph("SYFL AI - Consultation Juridique", styles['CustomTitle'])
+    yield Spacer(1, 0.2*inch)
+
+    # Add conversation info
+    info_data = [
+        ["Type de cas:", meta["case_type"] or "Non spécifié"],
+        ["Date:", meta["created_at"].strftime("%d/%m/%Y à %H:%M")],
+        ["Utilisateur:", meta["username"]],
+        ["Nombre de messages:", str(message_count)]
+    ]
+
+    info_table = Table(info_data, colWidths=[2*inch, 4*inch])
+    info_table.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e5e7eb')),
+        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, -1), 10),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#d1d5db'))
+    ]))
+
+    yield info_table
+    yield Spacer(1, 0.3*inch)
+
+    # Add messages
+    yield Paragraph("Conversation", styles['CustomHeading'])
+    yield Spacer(1, 0.1*inch)
+
+    for role, content, created_at in messages:
+        # Message header
+        role_label = "👤 Vous" if role == "user" else "🤖 Assistant SYFL AI"
+        time_str = created_at.strftime("%H:%M")
+
+        header = f"<b>{role_label}</b> - {time_str}"
+        yield Paragraph(header, styles['Normal'])
+
+        # Message content
+        content = content.replace('\n', '<br/>')
+        style = styles['UserMessage'] if role == "user" else styles['AssistantMessage']
+        yield Paragraph(content, style)
+        yield Spacer(1, 0.15*inch)
+
+    # Add footer
+    yield Spacer(1, 0.3*inch)
+    footer_text = f"""
+    <para align=center>
+    <font size=8 color="#6b7280">
+    Document généré par SYFL AI le {datetime.now().strftime("%d/%m/%Y à %H:%M")}<br/>
+    Système d'assistance juridique pour le droit du travail togolais<br/>
+    <b>Note:</b> Ce document est fourni à titre informatif uniquement et ne constitue pas un avis juridique.
+    </font>
+    </para>
+    """
+    yield Paragraph(footer_text, styles['Normal'])
+
+
+def write_conversation_pdf(
+    output: BinaryIO,
+    meta: Dict,
+    messages: Iterable[MessageTuple],
+    message_count: int
+):
+    """
+    Écrit le PDF d'une conversation dans un fichier
+
+    Les messages peuvent provenir directement d'un curseur de base de
+    données : ils sont convertis en flowables au fur et à mesure.
+
+    Args:
+        output: Fichier binaire de destination
+        meta: case_type, created_at et username de la conversation
+        messages: Messages sous forme de tuples (role, content, created_at)
+        message_count: Nombre de messages (affiché en en-tête)
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.platypus import SimpleDocTemplate
+
+    doc = SimpleDocTemplate(output, pagesize=A4)
+    doc.build(_FlowableFeed(_iter_flowables(meta, messages, message_count)))
+
+
+def render_conversation_pdf(meta: Dict, messages: List[MessageTuple]) -> bytes:
+    """
+    Construit le PDF d'une conversation
+
+    Fonction de niveau module pour pouvoir être exécutée dans un
+    processus enfant.
+
+    Args:
+        meta: case_type, created_at et username de la conversation
+        messages: Messages sous forme de tuples (role, content, created_at)
+
+    Returns:
+        Contenu du PDF
+    """
+    buffer = BytesIO()
+    write_conversation_pdf(buffer, meta, messages, len(messages))
+    return buffer.getvalue()
+
+
+class PDFRenderPool:
+    """
+    Pool de rendu PDF borné (processus + plafond de concurrence + timeout)
+
+    Les jobs d'arrière-plan n'ont qu'une part du pool (job_concurrency
+    processus) : un export groupé ne remplit pas la file d'attente devant
+    les exports interactifs.
+    """
+
+    def __init__(
+        self,
+        workers: int = PDF_EXPORT_WORKERS,
+        max_concurrency: int = PDF_EXPORT_MAX_CONCURRENCY,
+        timeout: float = PDF_EXPORT_TIMEOUT,
+        queue_timeout: float = PDF_EXPORT_QUEUE_TIMEOUT,
+        job_concurrency: Optional[int] = PDF_EXPORT_JOB_CONCURRENCY
+    ):
+        """
+        Args:
+            workers: Nombre de processus de rendu (0 = rendu dans un thread)
+            max_concurrency: Nombre maximal de rendus en cours ou en attente du pool
+            timeout: Durée maximale d'un rendu, à partir de son démarrage (secondes)
+            queue_timeout: Attente maximale du démarrage d'un rendu (secondes)
+            job_concurrency: Rendus simultanés des jobs (défaut : workers - 1, au moins 1)
+        """
+        self.workers = workers
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.queue_timeout = queue_timeout
+        self.job_concurrency = job_concurrency if job_concurrency is not None else max(workers - 1, 1)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._thread_executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._job_slots = threading.BoundedSemaphore(self.job_concurrency)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Crée le pool de processus au premier export"""
+        with self._executor_lock:
+            if self._executor is None:
+                # "spawn" : pas de fork d'un processus multi-threadé (et compatible Windows)
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+                logger.info(f"Pool de rendu PDF démarré ({self.workers} processus)")
+            return self._executor
+
+    def _get_thread_executor(self) -> ThreadPoolExecutor:
+        """Threads des rendus incrémentaux (et de tous les rendus sans processus)"""
+        with self._executor_lock:
+            if self._thread_executor is None:
+                # Autant de threads que de places : un rendu admis démarre aussitôt
+                self._thread_executor = ThreadPoolExecutor(
+                    max_workers=max(self.max_concurrency, 1), thread_name_prefix="pdf-render"
+                )
+            return self._thread_executor
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _run_bounded(self, submit: Callable[[], Future], mode: str):
+        """
+        Exécute un rendu en respectant le plafond de concurrence et le timeout
+
+        L'attente d'une place puis du démarrage dans le pool est bornée par
+        queue_timeout (PDFExportBusy), la durée du rendu lui-même par timeout.
+        Un rendu qui dépasse le timeout (ou dont la requête est annulée)
+        continue dans son processus ou son thread : sa place n'est libérée
+        qu'à la fin effective du rendu, pour que le plafond reste respecté.
+        """
+        semaphore = self._get_semaphore()
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.queue_timeout
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            PDF_RENDER_REJECTED.inc()
+            raise PDFExportBusy()
+
+        try:
+            concurrent_future = submit()
+        except BaseException:
+            semaphore.release()
+            raise
+        future = asyncio.wrap_future(concurrent_future)
+        render_start = time.perf_counter()
+
+        def release(done: asyncio.Future):
+            semaphore.release()
+            PDF_RENDER_LATENCY.labels(mode).observe(time.perf_counter() - render_start)
+            # Résultat d'un rendu abandonné : évite "exception was never retrieved"
+            if not done.cancelled():
+                done.exception()
+
+        future.add_done_callback(release)
+
+        # Rendus déjà en cours dans le pool : l'attente ne compte pas dans le timeout
+        while not (concurrent_future.running() or concurrent_future.done()):
+            if loop.time() >= deadline and concurrent_future.cancel():
+                PDF_RENDER_REJECTED.inc()
+                raise PDFExportBusy()
+            await asyncio.sleep(_START_POLL_INTERVAL)
+        render_start = time.perf_counter()
+        PDF_RENDER_QUEUE.observe(render_start - start)
+
+        return await asyncio.wait_for(asyncio.shield(future), timeout=self.timeout)
+
+    async def render(self, meta: Dict, messages: List[MessageTuple]) -> bytes:
+        """
+        Rend un PDF sans bloquer la boucle d'événements
+
+        Raises:
+            PDFExportBusy: Le rendu n'a pas pu démarrer dans le délai imparti
+            asyncio.TimeoutError: Le rendu a dépassé le timeout
+        """
+        executor = self._get_executor() if self.workers > 0 else self._get_thread_executor()
+        return await self._run_bounded(
+            lambda: executor.submit(render_conversation_pdf, meta, messages),
+            "process" if self.workers > 0 else "thread"
+        )
+
+    async def render_streaming(self, func: Callable, *args):
+        """
+        Exécute un rendu incrémental dans un thread
+
+        Utilisé pour les très longues conversations dont les messages sont
+        lus par lots depuis la base : seul le plafond de concurrence et le
+        timeout du pool s'appliquent.
+        """
+        executor = self._get_thread_executor()
+        return await self._run_bounded(lambda: executor.submit(func, *args), "streaming")
+
+    def submit(self, meta: Dict, messages: List[MessageTuple]) -> Future:
+        """
+        Soumet un rendu depuis du code synchrone (jobs d'arrière-plan)
+
+        Bloque tant que les job_concurrency places des jobs sont prises.
+        Sans pool de processus, le rendu est fait immédiatement dans le
+        thread appelant.
+        """
+        start = time.perf_counter()
+        if self.workers > 0:
+            self._job_slots.acquire()
+            try:
+                future = self._get_executor().submit(render_conversation_pdf, meta, messages)
+            except BaseException:
+                self._job_slots.release()
+                raise
+
+            def done(_):
+                self._job_slots.release()
+                PDF_RENDER_LATENCY.labels("job").observe(time.perf_counter() - start)
+
+            future.add_done_callback(done)
+            return future
+
+        future = Future()
+        try:
+            future.set_result(render_conversation_pdf(meta, messages))
+        except Exception as e:
+            future.set_exception(e)
+        PDF_RENDER_LATENCY.labels("job").observe(time.perf_counter() - start)
+        return future
+
+    def shutdown(self):
+        """Arrête le pool de processus"""
+        self._semaphore = None
+        if self._thread_executor is not None:
+            self._thread_executor.shutdown(wait=False)
+            self._thread_executor = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Pool de rendu PDF arrêté")
+
+
+# Pool partagé par les routes d'export
+render_pool = PDFRenderPool()
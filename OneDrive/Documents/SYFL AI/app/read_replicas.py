@@ -0,0 +1,283 @@
+"""
+Routage des lectures vers des réplicas (DATABASE_READ_URLS)
+
+Les routes en lecture seule (liste et détail des conversations, statistiques,
+export PDF) obtiennent leur session par `get_read_db` : un réplica choisi à
+tour de rôle parmi ceux en bonne santé. La session principale de la requête
+est utilisée à la place :
+- sans réplica configuré ;
+- si tous les réplicas sont indisponibles ;
+- pendant READ_REPLICA_STICKY_SECONDS après une écriture de l'utilisateur,
+  pour qu'il relise ses propres écritures malgré le retard de réplication
+  (les routes qui écrivent appellent `read_router.record_write`).
+
+La fenêtre d'adhérence est gardée en mémoire, donc par worker, et portée
+aussi par la réponse de la route qui écrit : un jeton signé (SECRET_KEY) et
+de courte durée, dans le cookie et l'en-tête READ_STICKY_COOKIE. Le client
+qui le renvoie (cookie, ou même en-tête) relit sur la base principale quel
+que soit le worker qui sert sa lecture. Les écritures faites par le
+WebSocket ne posent pas de cookie : elles ne collent que sur leur worker.
+
+Un réplica dont la connexion échoue est écarté pendant
+READ_REPLICA_RETRY_SECONDS ; la tâche de santé du lifespan le sonde
+(SELECT 1) toutes les READ_REPLICA_CHECK_SECONDS et le réintègre.
+"""
+import asyncio
+import hashlib
+import hmac
+import itertools
+import math
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+from fastapi import Depends, Request, Response
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker
+
+from app.auth import SECRET_KEY, get_current_active_user
+from app.database import async_database_url, create_configured_async_engine, get_async_db, pool_status
+from app.metrics import DB_READ_ROUTING
+from app.models import User
+
+# URLs des réplicas, séparées par des virgules (vide = lectures sur la base principale)
+DATABASE_READ_URLS = os.getenv("DATABASE_READ_URLS", "")
+# Durée pendant laquelle les lectures d'un utilisateur restent sur la base principale après une écriture
+READ_REPLICA_STICKY_SECONDS = float(os.getenv("READ_REPLICA_STICKY_SECONDS", "5"))
+# Durée d'éviction d'un réplica après un échec de connexion
+READ_REPLICA_RETRY_SECONDS = float(os.getenv("READ_REPLICA_RETRY_SECONDS", "30"))
+# Intervalle des sondes de santé
+READ_REPLICA_CHECK_SECONDS = float(os.getenv("READ_REPLICA_CHECK_SECONDS", "10"))
+# Cookie (et en-tête X-<nom>) portant la fenêtre d'adhérence d'un worker à l'autre
+READ_STICKY_COOKIE = os.getenv("READ_STICKY_COOKIE", "syfl-read-sticky")
+
+# Au-delà, les entrées expirées de la table d'adhérence sont purgées
+_STICKY_PRUNE_THRESHOLD = 10_000
+
+
+@dataclass
+class Replica:
+    """Un réplica en lecture et son état de santé"""
+    name: str
+    engine: AsyncEngine
+    sessionmaker: async_sessionmaker
+    healthy: bool = True
+    # Instant (horloge monotone) à partir duquel un réplica écarté est retenté
+    retry_at: float = 0.0
+    last_error: Optional[str] = None
+
+    @classmethod
+    def from_url(cls, url: str) -> "Replica":
+        async_url = async_database_url(url)
+        parsed = make_url(async_url)
+        # Label engine des métriques : hôte du réplica (fichier pour SQLite)
+        host = f"{parsed.host}:{parsed.port}" if parsed.port else (parsed.host or parsed.database)
+        engine = create_configured_async_engine(async_url, metrics_name=host)
+        name = parsed.render_as_string(hide_password=True)
+        return cls(
+            name=name,
+            engine=engine,
+            sessionmaker=async_sessionmaker(engine, autoflush=False, expire_on_commit=False),
+        )
+
+    def available(self, now: float) -> bool:
+        return self.healthy or now >= self.retry_at
+
+
+class ReadRouter:
+    """
+    Choix de la session des lectures : réplica (à tour de rôle) ou base principale
+
+    Args:
+        replicas: Réplicas en lecture (liste vide = routage désactivé)
+        sticky_seconds: Fenêtre de lecture de ses propres écritures
+        retry_seconds: Éviction d'un réplica après un échec
+        clock: Horloge monotone (remplaçable dans les tests)
+        wall_clock: Horloge des jetons d'adhérence, partagée par les workers
+        secret: Clé de signature des jetons d'adhérence
+    """
+
+    def __init__(
+        self,
+        replicas: List[Replica],
+        sticky_seconds: float = READ_REPLICA_STICKY_SECONDS,
+        retry_seconds: float = READ_REPLICA_RETRY_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+        wall_clock: Callable[[], float] = time.time,
+        secret: str = SECRET_KEY
+    ):
+        self.replicas = replicas
+        self.sticky_seconds = sticky_seconds
+        self.retry_seconds = retry_seconds
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self._secret = secret.encode()
+        self._turn = itertools.count()
+        # user_id -> fin de la fenêtre d'adhérence à la base principale
+        self._sticky: Dict[int, float] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_urls(cls, urls: str, **kwargs) -> "ReadRouter":
+        return cls([Replica.from_url(url.strip()) for url in urls.split(",") if url.strip()], **kwargs)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def record_write(self, user_id: int, response: Optional[Response] = None):
+        """
+        Les prochaines lectures de l'utilisateur iront à la base principale
+
+        Args:
+            response: Réponse de la route qui écrit ; elle porte le jeton
+                d'adhérence pour les autres workers
+        """
+        if not self.enabled:
+            return
+        now = self.clock()
+        with self._lock:
+            self._sticky[user_id] = now + self.sticky_seconds
+            if len(self._sticky) > _STICKY_PRUNE_THRESHOLD:
+                self._sticky = {uid: until for uid, until in self._sticky.items() if until > now}
+        if response is not None:
+            token = self.sticky_token(user_id)
+            response.set_cookie(
+                READ_STICKY_COOKIE, token,
+                max_age=math.ceil(self.sticky_seconds), httponly=True, samesite="lax"
+            )
+            response.headers[f"X-{READ_STICKY_COOKIE}"] = token
+
+    def _sign(self, payload: str) -> str:
+        return hmac.new(self._secret, payload.encode(), hashlib.sha256).hexdigest()
+
+    def sticky_token(self, user_id: int) -> str:
+        """Jeton signé : <user_id>.<fin de la fenêtre (epoch)>.<signature>"""
+        payload = f"{user_id}.{math.ceil(self.wall_clock() + self.sticky_seconds)}"
+        return f"{payload}.{self._sign(payload)}"
+
+    def _token_is_sticky(self, user_id: int, token: str) -> bool:
+        payload, _, signature = token.rpartition(".")
+        token_user, _, until = payload.partition(".")
+        if not hmac.compare_digest(signature, self._sign(payload)) or token_user != str(user_id):
+            return False
+        try:
+            return float(until) > self.wall_clock()
+        except ValueError:
+            return False
+
+    def is_sticky(self, user_id: int, token: Optional[str] = None) -> bool:
+        """Fenêtre d'adhérence en cours (écriture sur ce worker, ou jeton d'une autre)"""
+        with self._lock:
+            until = self._sticky.get(user_id)
+        if until is not None and until > self.clock():
+            return True
+        return token is not None and self._token_is_sticky(user_id, token)
+
+    def choose(self, user_id: Optional[int] = None) -> Optional[Replica]:
+        """Réplica à utiliser, ou None pour la base principale"""
+        if not self.enabled or (user_id is not None and self.is_sticky(user_id)):
+            return None
+        now = self.clock()
+        candidates = [replica for replica in self.replicas if replica.available(now)]
+        if not candidates:
+            return None
+        return candidates[next(self._turn) % len(candidates)]
+
+    def mark_down(self, replica: Replica, error: Exception):
+        if replica.healthy:
+            logger.warning(f"⚠️ Réplica {replica.name} écarté: {error}")
+        replica.healthy = False
+        replica.retry_at = self.clock() + self.retry_seconds
+        replica.last_error = f"{type(error).__name__}: {str(error).splitlines()[0][:200]}"
+
+    def mark_up(self, replica: Replica):
+        if not replica.healthy:
+            logger.info(f"✅ Réplica {replica.name} réintégré")
+        replica.healthy = True
+        replica.last_error = None
+
+    async def probe(self):
+        """Sonde chaque réplica (SELECT 1) et met à jour son état"""
+        for replica in self.replicas:
+            try:
+                async with replica.engine.connect() as connection:
+                    await connection.execute(text("SELECT 1"))
+            except Exception as e:
+                self.mark_down(replica, e)
+            else:
+                self.mark_up(replica)
+
+    async def run_health_checks(self, interval: float = READ_REPLICA_CHECK_SECONDS):
+        """Boucle de sondes, lancée par le lifespan quand des réplicas sont configurés"""
+        while True:
+            await self.probe()
+            await asyncio.sleep(interval)
+
+    @asynccontextmanager
+    async def session(
+        self,
+        primary: AsyncSession,
+        user_id: Optional[int] = None,
+        sticky_token: Optional[str] = None
+    ) -> AsyncIterator[AsyncSession]:
+        """
+        Session des lectures de l'utilisateur
+
+        La connexion au réplica est ouverte avant de rendre la session : en
+        cas d'échec, le réplica est écarté et le suivant est essayé, puis la
+        base principale (`primary`, session de la requête).
+        """
+        sticky = user_id is not None and self.enabled and self.is_sticky(user_id, sticky_token)
+        replica = None if sticky else self.choose()
+        while replica is not None:
+            session = replica.sessionmaker()
+            try:
+                await session.connection()
+            except Exception as e:
+                await session.close()
+                self.mark_down(replica, e)
+                replica = self.choose()
+                continue
+            DB_READ_ROUTING.labels("replica").inc()
+            async with session:
+                yield session
+            return
+
+        DB_READ_ROUTING.labels("sticky" if sticky else "primary").inc()
+        yield primary
+
+    def status(self) -> List[Dict[str, Any]]:
+        """État des réplicas (exposé par /health)"""
+        return [
+            {
+                "name": replica.name,
+                "healthy": replica.healthy,
+                "last_error": replica.last_error,
+                "pool": pool_status(replica.engine),
+            }
+            for replica in self.replicas
+        ]
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+
+read_router = ReadRouter.from_urls(DATABASE_READ_URLS)
+
+
+async def get_read_db(
+    request: Request,
+    current_user: User = Depends(get_current_active_user),
+    primary: AsyncSession = Depends(get_async_db)
+):
+    """Dependency des routes en lecture seule : réplica ou session principale de la requête"""
+    token = request.headers.get(f"x-{READ_STICKY_COOKIE}") or request.cookies.get(READ_STICKY_COOKIE)
+    async with read_router.session(primary, current_user.id, token) as db:
+        yield db
@@ -1,6 +1,7 @@
 """
 Routes d'authentification
 """
+import os
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlalchemy.orm import Session
 from slowapi import Limiter
@@ -17,7 +18,10 @@ from app.auth import (
 )
 
 router = APIRouter(prefix="/auth", tags=["auth"])
-limiter = Limiter(key_func=get_remote_address)
+limiter = Limiter(
+    key_func=get_remote_address,
+    enabled=os.getenv("RATE_LIMIT_ENABLED", "true").lower() != "false"
+)
 
 
 @router.post("/register", response_model=Token, status_code=status.HTTP_201_CREATED)
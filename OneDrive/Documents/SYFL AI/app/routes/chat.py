@@ -1,20 +1,41 @@
 """
 Routes de chat
 """
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+import gzip
+import json
+import threading
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from starlette.concurrency import run_in_threadpool
+from typing import Dict, List, NamedTuple, Optional
 
-from app.database import get_db
-from app.models import User, Conversation, Message
+from app.ai_engine import AIReply
+from app.archive import load_archive, message_rows, restore_conversation
+from app.database import get_async_db
+from app.read_replicas import get_read_db, read_router
+from app.models import User, Conversation, ConversationArchive, Message
 from app.schemas import (
     ChatRequest,
     ChatResponse,
     ConversationResponse,
     ConversationDetailResponse,
-    MessageResponse
+    ConversationsDeletedResponse,
+    MessageResponse,
+    SearchResponse,
+    SearchResultResponse
 )
 from app.auth import get_current_active_user
+from app.context_cache import context_cache
+from app.export_cache import export_cache
+from app.http_cache import accepts_encoding, etag_matches
+from app.knowledge_base import KnowledgeSnapshot
+from app.metrics import CHAT_REPLIES, record_cache
+from app.search import SEARCH_DEFAULT_LIMIT, SEARCH_MAX_LIMIT, InvalidCursor, search_messages
+from app.timing import span
+from app.write_behind import write_behind
 
 router = APIRouter(prefix="/api/chat", tags=["chat"])
 
@@ -28,121 +49,275 @@ def set_ai_engine(engine):
     ai_engine = engine
 
 
-@router.post("/send", response_model=ChatResponse)
-def send_message(
-    chat_request: ChatRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
-):
-    """Envoie un message et reçoit une réponse de l'IA"""
+async def run_ai(fast_mode: bool, func, /, *args, **kwargs):
+    """
+    Appelle le moteur IA sans bloquer la boucle d'événements
+
+    Les appels au LLM (bloquants) passent par le pool de threads ; en mode
+    rapide la réponse est calculée localement, sans thread.
+    """
+    if fast_mode:
+        return func(*args, **kwargs)
+    return await run_in_threadpool(func, *args, **kwargs)
+
+
+class Turn(NamedTuple):
+    """Échange en cours : message de l'utilisateur enregistré, réponse à générer"""
+    conversation: Conversation
+    history: List[Dict]
+    case_detected: Optional[str]
+    confidence: Optional[float]
+
+
+async def prepare_turn(
+    db: AsyncSession,
+    user: User,
+    message: str,
+    conversation_id: Optional[int] = None,
+    fast_mode: bool = False
+) -> Turn:
+    """
+    Enregistre le message de l'utilisateur et prépare le contexte de la réponse
     
+    Raises:
+        HTTPException: 404 si la conversation n'existe pas
+    """
     # Récupérer ou créer la conversation
-    if chat_request.conversation_id:
-        conversation = db.query(Conversation).filter(
-            Conversation.id == chat_request.conversation_id,
-            Conversation.user_id == current_user.id
-        ).first()
+    with span("conversation"):
+        if conversation_id:
+            # État d'archivage lu avec la conversation : pas de requête de plus par échange
+            row = (await db.execute(
+                select(Conversation, ConversationArchive.conversation_id.isnot(None)).outerjoin(
+                    ConversationArchive, ConversationArchive.conversation_id == Conversation.id
+                ).where(
+                    Conversation.id == conversation_id,
+                    Conversation.user_id == user.id
+                )
+            )).first()
         
-        if not conversation:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Conversation non trouvée"
+            if not row:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Conversation non trouvée"
+                )
+            conversation, archived = row
+            if archived:
+                # Conversation archivée : ses messages reviennent dans la table messages
+                await restore_conversation(db, conversation.id)
+            # Derniers messages encore en mémoire depuis l'échange précédent
+            cached_history = context_cache.get(conversation.id, conversation.updated_at)
+        else:
+            # Créer une nouvelle conversation
+            conversation = Conversation(
+                user_id=user.id,
+                title="Nouvelle consultation"
             )
-    else:
-        # Créer une nouvelle conversation
-        conversation = Conversation(
-            user_id=current_user.id,
-            title="Nouvelle consultation"
-        )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
+            db.add(conversation)
+            await db.commit()
+            cached_history = []
+    previous_updated_at = conversation.updated_at
     
     # Sauvegarder le message utilisateur
-    user_message = Message(
-        conversation_id=conversation.id,
-        role="user",
-        content=chat_request.message
-    )
-    db.add(user_message)
-    db.commit()
-    
-    # Récupérer l'historique de la conversation (pour le contexte)
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation.id
-    ).order_by(Message.created_at).all()
-    
-    # Préparer l'historique pour l'IA (exclure le dernier message)
-    conversation_history = [
-        {"role": msg.role, "content": msg.content}
-        for msg in messages[:-1]
-    ]
+    with span("save_user_message"):
+        user_message = Message(
+            conversation_id=conversation.id,
+            role="user",
+            content=message
+        )
+        db.add(user_message)
+        # Marque de la dernière activité (invalide le contexte en cache des autres workers)
+        conversation.updated_at = datetime.utcnow()
+        await db.commit()
+    
+    if cached_history is not None:
+        conversation_history = cached_history
+        # En cache : conversation neuve, ou déjà au moins un échange
+        first_message = not conversation_id
+    else:
+        # Récupérer l'historique de la conversation (pour le contexte)
+        with span("history"):
+            # Réponse précédente encore dans le journal des écritures différées
+            await write_behind.flushed(conversation.id)
+            messages = (await db.execute(
+                select(Message.role, Message.content).where(
+                    Message.conversation_id == conversation.id
+                ).order_by(Message.created_at.desc(), Message.id.desc()).limit(context_cache.window + 1)
+            )).all()[::-1]
+        
+        # Préparer l'historique pour l'IA (exclure le dernier message)
+        conversation_history = [
+            {"role": role, "content": content}
+            for role, content in messages[:-1]
+        ]
+        first_message = len(messages) == 1
     
     # Détecter le cas si c'est le premier message
     case_detected = conversation.case_type
     confidence = None
     
-    if len(messages) == 1:  # Premier message
-        case_detected = ai_engine.detect_case(chat_request.message)
+    if first_message:
+        with span("detect"):
+            case_detected = await run_ai(
+                fast_mode, ai_engine.detect_case,
+                message, fast_mode=fast_mode
+            )
         
-        if case_detected:
-            confidence = 0.85
-            conversation.case_type = case_detected
-            conversation.title = case_detected.replace("_", " ").title()
-            db.commit()
-    
-    # Générer la réponse de l'IA
-    response_text = ai_engine.generate_response(
-        user_message=chat_request.message,
-        case_id=case_detected,
-        conversation_history=conversation_history
-    )
+            if case_detected:
+                confidence = 0.85
+                conversation.case_type = case_detected
+                conversation.title = case_detected.replace("_", " ").title()
+                await db.commit()
     
-    # Sauvegarder la réponse de l'assistant
-    assistant_message = Message(
-        conversation_id=conversation.id,
-        role="assistant",
-        content=response_text,
-        extra_data={
-            "case_detected": case_detected,
-            "confidence": confidence
-        }
+    # Contexte du prochain échange (marque après le dernier commit de la conversation)
+    if cached_history is None:
+        context_cache.put(conversation.id, conversation.updated_at, [tuple(row) for row in messages])
+    elif conversation_id:
+        context_cache.append(
+            conversation.id, previous_updated_at, "user", message, updated_at=conversation.updated_at
+        )
+    else:
+        context_cache.put(conversation.id, conversation.updated_at, [("user", message)])
+    
+    return Turn(conversation, conversation_history, case_detected, confidence)
+
+
+async def save_reply(
+    db: AsyncSession,
+    user: User,
+    turn: Turn,
+    reply: AIReply,
+    extra_data: Optional[Dict] = None,
+    response: Optional[Response] = None
+):
+    """
+    Enregistre la réponse de l'assistant
+
+    `response` (routes HTTP) reçoit le jeton de lecture de ses propres écritures.
+    """
+    CHAT_REPLIES.labels(reply.source).inc()
+    conversation_id = turn.conversation.id
+    
+    with span("save_reply"):
+        reply_values = dict(
+            conversation_id=conversation_id,
+            role="assistant",
+            content=reply.content,
+            case_id=turn.case_detected,
+            confidence=turn.confidence,
+            source=reply.source,
+            model=reply.model,
+            prompt_tokens=reply.prompt_tokens,
+            completion_tokens=reply.completion_tokens,
+            latency_ms=reply.latency_ms,
+            created_at=datetime.utcnow()
+        )
+        if extra_data:
+            reply_values["extra_data"] = extra_data
+        # Écriture différée : réponse envoyée dès que le message est journalisé
+        if not await write_behind.submit("messages", reply_values, key=conversation_id):
+            db.add(Message(**reply_values))
+            await db.commit()
+    context_cache.append(conversation_id, turn.conversation.updated_at, "assistant", reply.content)
+    
+    # Les exports PDF de cette conversation ne sont plus à jour
+    export_cache.invalidate(conversation_id)
+    # L'utilisateur relit ses messages sur la base principale
+    read_router.record_write(user.id, response)
+
+
+@router.post("/send", response_model=ChatResponse)
+async def send_message(
+    chat_request: ChatRequest,
+    response: Response,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Envoie un message et reçoit une réponse de l'IA"""
+    turn = await prepare_turn(
+        db, current_user, chat_request.message,
+        conversation_id=chat_request.conversation_id,
+        fast_mode=chat_request.fast_mode
     )
-    db.add(assistant_message)
-    db.commit()
+    
+    # Générer la réponse de l'IA (ou depuis la base de connaissances en mode dégradé)
+    with span("generate"):
+        reply = await run_ai(
+            chat_request.fast_mode, ai_engine.generate_reply,
+            user_message=chat_request.message,
+            case_id=turn.case_detected,
+            conversation_history=turn.history,
+            fast_mode=chat_request.fast_mode
+        )
+    
+    await save_reply(db, current_user, turn, reply, response=response)
     
     return ChatResponse(
-        message=response_text,
-        conversation_id=conversation.id,
-        case_detected=case_detected,
-        confidence=confidence
+        message=reply.content,
+        conversation_id=turn.conversation.id,
+        case_detected=turn.case_detected,
+        confidence=turn.confidence,
+        source=reply.source
     )
 
 
 @router.get("/conversations", response_model=List[ConversationResponse])
-def get_conversations(
+async def get_conversations(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Récupère toutes les conversations de l'utilisateur"""
-    conversations = db.query(Conversation).filter(
+    conversations = await db.scalars(select(Conversation).where(
         Conversation.user_id == current_user.id
-    ).order_by(Conversation.updated_at.desc()).all()
+    ).order_by(Conversation.updated_at.desc()))
     
-    return conversations
+    return conversations.all()
+
+
+@router.get("/search", response_model=SearchResponse)
+async def search_conversations(
+    q: str = Query(..., min_length=2, max_length=200),
+    limit: int = Query(SEARCH_DEFAULT_LIMIT, ge=1, le=SEARCH_MAX_LIMIT),
+    cursor: Optional[str] = None,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """Recherche plein texte dans les messages de l'utilisateur (plus pertinents d'abord)"""
+    try:
+        hits, next_cursor = await search_messages(db, current_user.id, q, limit, cursor)
+    except InvalidCursor:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Curseur de pagination invalide"
+        )
+    
+    return SearchResponse(
+        results=[
+            SearchResultResponse(
+                message_id=hit.message_id,
+                conversation_id=hit.conversation_id,
+                conversation_title=hit.conversation_title,
+                role=hit.role,
+                created_at=hit.created_at,
+                snippet=hit.snippet
+            )
+            for hit in hits
+        ],
+        next_cursor=next_cursor
+    )
 
 
 @router.get("/conversations/{conversation_id}", response_model=ConversationDetailResponse)
-def get_conversation(
+async def get_conversation(
     conversation_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ):
     """Récupère une conversation avec tous ses messages"""
-    conversation = db.query(Conversation).filter(
+    await write_behind.flushed(conversation_id)
+    conversation = await db.scalar(select(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ).options(selectinload(Conversation.messages)))
     
     if not conversation:
         raise HTTPException(
@@ -150,37 +325,133 @@ def get_conversation(
             detail="Conversation non trouvée"
         )
     
+    if not conversation.messages:
+        archive = await load_archive(db, conversation.id)
+        if archive is not None:
+            return ConversationDetailResponse(
+                **ConversationResponse.model_validate(conversation).model_dump(),
+                messages=[
+                    MessageResponse(id=message_id, role=role, content=content, created_at=created_at)
+                    for message_id, role, content, created_at in message_rows(archive)
+                ]
+            )
+    
     return conversation
 
 
+@router.delete("/conversations", response_model=ConversationsDeletedResponse)
+async def delete_all_conversations(
+    response: Response,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Supprime toutes les conversations de l'utilisateur (une seule requête)"""
+    result = await db.execute(
+        delete(Conversation).where(
+            Conversation.user_id == current_user.id
+        ).returning(Conversation.id)
+    )
+    conversation_ids = result.scalars().all()
+    await db.commit()
+    
+    for conversation_id in conversation_ids:
+        export_cache.invalidate(conversation_id)
+        context_cache.invalidate(conversation_id)
+    read_router.record_write(current_user.id, response)
+    
+    return ConversationsDeletedResponse(deleted=len(conversation_ids))
+
+
 @router.delete("/conversations/{conversation_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_conversation(
+async def delete_conversation(
     conversation_id: int,
+    response: Response,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Supprime une conversation"""
-    conversation = db.query(Conversation).filter(
+    """Supprime une conversation (ses messages sont supprimés par la base, ON DELETE CASCADE)"""
+    result = await db.execute(delete(Conversation).where(
         Conversation.id == conversation_id,
         Conversation.user_id == current_user.id
-    ).first()
+    ))
     
-    if not conversation:
+    if result.rowcount == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Conversation non trouvée"
         )
     
-    db.delete(conversation)
-    db.commit()
+    await db.commit()
+    export_cache.invalidate(conversation_id)
+    context_cache.invalidate(conversation_id)
+    read_router.record_write(current_user.id, response)
     
     return None
 
 
+class CasesPayload(NamedTuple):
+    """Réponse de /cases pré-rendue pour une version de la base de connaissances"""
+    checksum: str
+    # Un ETag fort par représentation (corps différents)
+    etag: str
+    gzip_etag: str
+    body: bytes
+    gzip_body: bytes
+
+
+_cases_payload: Optional[CasesPayload] = None
+_cases_payload_lock = threading.Lock()
+
+
+def render_cases_payload(snapshot: KnowledgeSnapshot) -> CasesPayload:
+    """Sérialise et compresse la liste des cas une seule fois par instantané"""
+    cases_list = [
+        {
+            "id": case_id,
+            "titre": case_data.get("titre", ""),
+            "description": case_data.get("texte_simple", ""),
+            "articles_reference": list(case_data.get("articles_reference", ())),
+            "questions_clarification": list(case_data.get("questions_clarification", ())),
+            "actions": list(case_data.get("actions", ())),
+        }
+        for case_id, case_data in snapshot.cases.items()
+    ]
+    body = json.dumps(
+        {"total": len(cases_list), "cases": cases_list},
+        ensure_ascii=False,
+        separators=(",", ":")
+    ).encode("utf-8")
+    return CasesPayload(
+        checksum=snapshot.checksum,
+        etag=f'"cases-{snapshot.checksum[:32]}"',
+        gzip_etag=f'"cases-{snapshot.checksum[:32]}-gz"',
+        body=body,
+        # mtime fixe : même entrée, mêmes octets
+        gzip_body=gzip.compress(body, compresslevel=9, mtime=0),
+    )
+
+
+def get_cases_payload(snapshot: KnowledgeSnapshot) -> CasesPayload:
+    """Réponse pré-rendue de l'instantané, recalculée seulement s'il a changé"""
+    global _cases_payload
+    payload = _cases_payload
+    if payload is not None and payload.checksum == snapshot.checksum:
+        record_cache("cases", True)
+        return payload
+    record_cache("cases", False)
+    with _cases_payload_lock:
+        if _cases_payload is None or _cases_payload.checksum != snapshot.checksum:
+            _cases_payload = render_cases_payload(snapshot)
+        return _cases_payload
+
+
 @router.get("/cases")
-def get_legal_cases():
+def get_legal_cases(request: Request):
     """
     Retourne la liste de tous les cas juridiques disponibles
+
+    Le corps est pré-rendu (et compressé) une fois par version de la base
+    de connaissances ; le client revalide avec If-None-Match.
     """
     if not ai_engine:
         raise HTTPException(
@@ -188,19 +459,18 @@ def get_legal_cases():
             detail="AI Engine non initialisé"
         )
     
-    cases_list = []
-    for case_id, case_data in ai_engine.knowledge_base.items():
-        cases_list.append({
-            "id": case_id,
-            "titre": case_data.get("titre", ""),
-            "description": case_data.get("description", ""),
-            "type": case_data.get("type", ""),
-            "faits": case_data.get("faits", []),
-            "articles_applicables": case_data.get("articles_applicables", []),
-            "conseils_juridiques": case_data.get("conseils_juridiques", [])
-        })
-    
-    return {
-        "total": len(cases_list),
-        "cases": cases_list
+    payload = get_cases_payload(ai_engine.snapshot)
+    gzipped = accepts_encoding(request, "gzip")
+    etag = payload.gzip_etag if gzipped else payload.etag
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, no-cache",
+        "Vary": "Accept-Encoding",
     }
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+        return Response(content=payload.gzip_body, media_type="application/json", headers=headers)
+    return Response(content=payload.body, media_type="application/json", headers=headers)
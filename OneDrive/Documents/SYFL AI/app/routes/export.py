@@ -1,171 +1,339 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from io import BytesIO
-from fastapi.responses import StreamingResponse
+import asyncio
+import os
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+from typing import Optional
 
-from ..database import get_db
-from ..models import User, Conversation, Message
+from ..archive import aiter_archive_batches, load_archive, message_rows
+from ..database import get_async_db, get_db, get_sessionmaker
+from ..read_replicas import get_read_db
+from ..models import User, Conversation, Message, Job
+from ..schemas import ExportJobResponse
 from ..auth import get_current_user
-
-try:
-    from reportlab.lib.pagesizes import letter, A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import inch
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib import colors
-    REPORTLAB_AVAILABLE = True
-except ImportError:
-    REPORTLAB_AVAILABLE = False
+from ..bulk_export import BULK_EXPORT_JOB
+from ..jobs import ACTIVE_STATUSES, job_runner
+from ..export_cache import export_cache
+from ..http_cache import etag_matches
+from ..export_formats import STREAM_FORMATS, aiter_message_batches, astream_conversation, iter_message_rows
+from ..pdf_export import (
+    REPORTLAB_AVAILABLE,
+    PDF_STREAMING_THRESHOLD,
+    TEMPLATE_VERSION,
+    PDFExportBusy,
+    render_pool,
+    write_conversation_pdf
+)
 
 router = APIRouter(prefix="/api/export", tags=["export"])
 
 
+async def load_export_header(db: AsyncSession, conversation_id: int, user: User):
+    """
+    Load what identifies the current version of a conversation export
+
+    Returns None if the conversation does not exist, otherwise
+    (meta, last_message_id, message_count); last_message_id is None
+    without messages. meta["archived"] tells whether the messages are
+    read from the conversation archive.
+    """
+    conversation = await db.scalar(select(Conversation).where(
+        Conversation.id == conversation_id,
+        Conversation.user_id == user.id
+    ))
+
+    if not conversation:
+        return None
+
+    last_message_id, message_count = (await db.execute(select(
+        func.max(Message.id), func.count(Message.id)
+    ).where(
+        Message.conversation_id == conversation_id
+    ))).one()
+
+    archived = False
+    if message_count == 0:
+        archive = await load_archive(db, conversation_id)
+        if archive is not None:
+            archived = True
+            last_message_id, message_count = archive.last_message_id, archive.message_count
+
+    meta = {
+        "id": conversation.id,
+        "title": conversation.title,
+        "case_type": conversation.case_type,
+        "created_at": conversation.created_at,
+        "username": user.username,
+        "archived": archived,
+    }
+    return meta, last_message_id, message_count
+
+
+async def load_export_messages(
+    db: AsyncSession,
+    conversation_id: int,
+    archived: bool = False,
+    max_id: Optional[int] = None
+):
+    """
+    Load the messages of a conversation as (role, content, created_at) tuples
+
+    `max_id` stops at the last message of the export version already
+    identified (cache key and ETag), even if newer messages were written since.
+    """
+    if archived:
+        archive = await load_archive(db, conversation_id)
+        return [(role, content, created_at) for _, role, content, created_at in message_rows(archive)]
+    query = select(Message.role, Message.content, Message.created_at).where(
+        Message.conversation_id == conversation_id
+    )
+    if max_id is not None:
+        query = query.where(Message.id <= max_id)
+    rows = (await db.execute(query.order_by(Message.created_at.asc(), Message.id.asc()))).all()
+    return [tuple(row) for row in rows]
+
+
+def write_streaming_pdf(
+    session_factory: sessionmaker,
+    cache_key: str,
+    meta: dict,
+    message_count: int,
+    last_message_id: int
+):
+    """
+    Render a long conversation straight from the DB cursor into the cache
+
+    Messages are read in batches and turned into flowables on demand, and
+    the PDF is written to a file: memory does not grow with the conversation.
+    Runs in a thread, hence the synchronous session; the thread owns it
+    because a render past the timeout outlives the request. Messages stop
+    at `last_message_id`, the one the cache key was built from.
+    """
+    with session_factory() as db:
+        rows = iter_message_rows(db, meta["id"], max_id=last_message_id)
+        messages = ((role, content, created_at) for _, role, content, created_at in rows)
+        with export_cache.writer(cache_key) as output:
+            write_conversation_pdf(output, meta, messages, message_count)
+    return export_cache.get(cache_key)
+
+
 @router.get("/conversation/{conversation_id}/pdf")
 async def export_conversation_pdf(
     conversation_id: int,
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db),
+    primary: AsyncSession = Depends(get_async_db),
+    session_factory: sessionmaker = Depends(get_sessionmaker)
 ):
     """
     Export a conversation to PDF format
+
+    Long conversations are rendered from a cursor in a thread, which opens
+    its own session on the primary with `session_factory`: their header
+    (cache key and ETag) is then read from the primary too, so that the
+    key and the rendered messages come from the same database.
     """
     if not REPORTLAB_AVAILABLE:
         raise HTTPException(
             status_code=501,
             detail="PDF export not available. Install reportlab: pip install reportlab"
         )
-    
-    # Get conversation
-    conversation = db.query(Conversation).filter(
-        Conversation.id == conversation_id,
-        Conversation.user_id == current_user.id
-    ).first()
-    
-    if not conversation:
+
+    # Rendering runs in the process pool
+    header = await load_export_header(db, conversation_id, current_user)
+
+    if header is None:
         raise HTTPException(status_code=404, detail="Conversation not found")
-    
-    # Get messages
-    messages = db.query(Message).filter(
-        Message.conversation_id == conversation_id
-    ).order_by(Message.created_at.asc()).all()
-    
-    if not messages:
+
+    meta, last_message_id, message_count = header
+    # Archived messages are decompressed in memory anyway
+    streaming = message_count > PDF_STREAMING_THRESHOLD and not meta["archived"]
+
+    if streaming and db is not primary:
+        header = await load_export_header(primary, conversation_id, current_user)
+        if header is None:
+            raise HTTPException(status_code=404, detail="Conversation not found")
+        meta, last_message_id, message_count = header
+
+    if last_message_id is None:
         raise HTTPException(status_code=400, detail="No messages to export")
-    
-    # Create PDF
-    buffer = BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4)
-    
-    # Container for the 'Flowable' objects
-    elements = []
-    
-    # Define styles
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=24,
-        textColor=colors.HexColor('#2563eb'),
-        spaceAfter=30,
-    )
-    
-    heading_style = ParagraphStyle(
-        'CustomHeading',
-        parent=styles['Heading2'],
-        fontSize=14,
-        textColor=colors.HexColor('#1e40af'),
-        spaceAfter=12,
-    )
-    
-    user_message_style = ParagraphStyle(
-        'UserMessage',
-        parent=styles['BodyText'],
-        fontSize=11,
-        leftIndent=20,
-        rightIndent=0,
-        spaceAfter=10,
-    )
-    
-    assistant_message_style = ParagraphStyle(
-        'AssistantMessage',
-        parent=styles['BodyText'],
-        fontSize=11,
-        leftIndent=0,
-        rightIndent=20,
-        spaceAfter=10,
-    )
-    
-    # Add title
-    elements.append(Paragraph("SYFL AI - Consultation Juridique", title_style))
-    elements.append(Spacer(1, 0.2*inch))
-    
-    # Add conversation info
-    info_data = [
-        ["Type de cas:", conversation.case_type or "Non spécifié"],
-        ["Date:", conversation.created_at.strftime("%d/%m/%Y à %H:%M")],
-        ["Utilisateur:", current_user.username],
-        ["Nombre de messages:", str(len(messages))]
-    ]
-    
-    info_table = Table(info_data, colWidths=[2*inch, 4*inch])
-    info_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (0, -1), colors.HexColor('#e5e7eb')),
-        ('TEXTCOLOR', (0, 0), (-1, -1), colors.black),
-        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-        ('FONTNAME', (0, 0), (0, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
-        ('GRID', (0, 0), (-1, -1), 1, colors.HexColor('#d1d5db'))
-    ]))
-    
-    elements.append(info_table)
-    elements.append(Spacer(1, 0.3*inch))
-    
-    # Add messages
-    elements.append(Paragraph("Conversation", heading_style))
-    elements.append(Spacer(1, 0.1*inch))
-    
-    for msg in messages:
-        # Message header
-        role_label = "👤 Vous" if msg.role == "user" else "🤖 Assistant SYFL AI"
-        time_str = msg.created_at.strftime("%H:%M")
-        
-        header = f"<b>{role_label}</b> - {time_str}"
-        elements.append(Paragraph(header, styles['Normal']))
-        
-        # Message content
-        content = msg.content.replace('\n', '<br/>')
-        style = user_message_style if msg.role == "user" else assistant_message_style
-        elements.append(Paragraph(content, style))
-        elements.append(Spacer(1, 0.15*inch))
-    
-    # Add footer
-    elements.append(Spacer(1, 0.3*inch))
-    footer_text = f"""
-    <para align=center>
-    <font size=8 color="#6b7280">
-    Document généré par SYFL AI le {datetime.now().strftime("%d/%m/%Y à %H:%M")}<br/>
-    Système d'assistance juridique pour le droit du travail togolais<br/>
-    <b>Note:</b> Ce document est fourni à titre informatif uniquement et ne constitue pas un avis juridique.
-    </font>
-    </para>
-    """
-    elements.append(Paragraph(footer_text, styles['Normal']))
-    
-    # Build PDF
-    doc.build(elements)
-    
-    # Get the value of the BytesIO buffer
-    buffer.seek(0)
-    
+
+    cache_key = export_cache.make_key(conversation_id, last_message_id, TEMPLATE_VERSION)
+    etag = export_cache.make_etag(cache_key)
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers)
+
+    path = export_cache.get(cache_key)
+    if path is None:
+        try:
+            if streaming:
+                path = await render_pool.render_streaming(
+                    write_streaming_pdf, session_factory, cache_key, meta, message_count, last_message_id
+                )
+            else:
+                messages = await load_export_messages(db, conversation_id, meta["archived"], last_message_id)
+                pdf_bytes = await render_pool.render(meta, messages)
+                path = await run_in_threadpool(export_cache.put, cache_key, pdf_bytes)
+        except PDFExportBusy:
+            raise HTTPException(
+                status_code=503,
+                detail="Too many PDF exports in progress, please retry later",
+                headers={"Retry-After": "5"}
+            )
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=504, detail="PDF export timed out")
+
     # Generate filename
     filename = f"conversation_{conversation_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-    
-    return StreamingResponse(
-        buffer,
+
+    return FileResponse(
+        path,
         media_type="application/pdf",
+        filename=filename,
+        headers=cache_headers
+    )
+
+
+@router.get("/conversation/{conversation_id}/{export_format}")
+async def export_conversation_stream(
+    conversation_id: int,
+    export_format: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    Export a conversation as JSONL, Markdown or HTML
+
+    Rows are streamed from the DB cursor in batches, so memory stays
+    bounded whatever the length of the conversation.
+    """
+    if export_format not in STREAM_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported export format. Use one of: pdf, {', '.join(STREAM_FORMATS)}"
+        )
+
+    header = await load_export_header(db, conversation_id, current_user)
+    if header is None:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+
+    meta, last_message_id, _ = header
+    if last_message_id is None:
+        raise HTTPException(status_code=400, detail="No messages to export")
+
+    fmt = STREAM_FORMATS[export_format]
+    batches = aiter_archive_batches if meta["archived"] else aiter_message_batches
+
+    async def body():
+        try:
+            async for chunk in astream_conversation(
+                export_format, meta, batches(db, conversation_id)
+            ):
+                yield chunk
+        finally:
+            await db.close()
+
+    filename = f"conversation_{conversation_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{fmt.extension}"
+
+    return StreamingResponse(
+        body(),
+        media_type=fmt.media_type,
         headers={
             "Content-Disposition": f"attachment; filename={filename}"
         }
     )
+
+
+@router.post("/all", response_model=ExportJobResponse, status_code=202)
+def start_bulk_export(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Start exporting all conversations of the current user as a ZIP of PDFs
+
+    Returns the job immediately; poll GET /api/export/jobs/{id} for progress.
+    An export already in progress for the user is returned instead of a new one.
+    Stays synchronous: the job runner persists jobs with a sync session.
+    """
+    if not REPORTLAB_AVAILABLE:
+        raise HTTPException(
+            status_code=501,
+            detail="PDF export not available. Install reportlab: pip install reportlab"
+        )
+
+    job = db.query(Job).filter(
+        Job.kind == BULK_EXPORT_JOB,
+        Job.user_id == current_user.id,
+        Job.status.in_(ACTIVE_STATUSES)
+    ).first()
+
+    if job is None:
+        job = job_runner.enqueue(db, BULK_EXPORT_JOB, user_id=current_user.id)
+
+    return job
+
+
+async def get_user_export_job(db: AsyncSession, job_id: int, user: User) -> Job:
+    """Load an export job of the user or raise 404"""
+    job = await db.scalar(select(Job).where(
+        Job.id == job_id,
+        Job.kind == BULK_EXPORT_JOB,
+        Job.user_id == user.id
+    ))
+
+    if not job:
+        raise HTTPException(status_code=404, detail="Export job not found")
+
+    return job
+
+
+@router.get("/jobs/{job_id}", response_model=ExportJobResponse)
+async def get_bulk_export(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Get the status and progress of a bulk export
+    """
+    return await get_user_export_job(db, job_id, current_user)
+
+
+@router.get("/jobs/{job_id}/download")
+async def download_bulk_export(
+    job_id: int,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Download the ZIP produced by a completed bulk export
+
+    Returns 410 once the ZIP has expired (EXPORT_JOB_RETENTION_HOURS) or is
+    missing from disk.
+    """
+    job = await get_user_export_job(db, job_id, current_user)
+
+    if job.status == "expired":
+        raise HTTPException(status_code=410, detail="Export expired, please start a new one")
+
+    if job.status != "completed" or not job.result:
+        raise HTTPException(status_code=409, detail=f"Export not ready (status: {job.status})")
+
+    file_path = job.result["file_path"]
+    if not await run_in_threadpool(os.path.exists, file_path):
+        raise HTTPException(status_code=410, detail="Export file no longer available, please start a new one")
+
+    return FileResponse(
+        file_path,
+        media_type="application/zip",
+        filename=f"syfl_ai_consultations_{job.created_at.strftime('%Y%m%d')}.zip"
+    )
@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Dict, Any
 
-from ..database import get_db
-from ..models import User, Conversation, Message
+from ..read_replicas import get_read_db
+from ..models import User, Conversation, ConversationArchive, Message
 from ..auth import get_current_user
 
 router = APIRouter(prefix="/api/stats", tags=["stats"])
@@ -12,65 +12,109 @@ router = APIRouter(prefix="/api/stats", tags=["stats"])
 
 @router.get("")
 async def get_user_statistics(
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ) -> Dict[str, Any]:
     """
     Get statistics for the current user
     """
     # Total conversations
-    total_conversations = db.query(func.count(Conversation.id)).filter(
+    total_conversations = await db.scalar(select(func.count(Conversation.id)).where(
         Conversation.user_id == current_user.id
-    ).scalar()
+    ))
     
     # Total messages
-    total_messages = db.query(func.count(Message.id)).join(
+    total_messages = await db.scalar(select(func.count(Message.id)).join(
         Conversation, Message.conversation_id == Conversation.id
-    ).filter(
+    ).where(
         Conversation.user_id == current_user.id
-    ).scalar()
+    ))
     
     # Messages by role
-    user_messages = db.query(func.count(Message.id)).join(
+    user_messages = await db.scalar(select(func.count(Message.id)).join(
         Conversation, Message.conversation_id == Conversation.id
-    ).filter(
+    ).where(
         Conversation.user_id == current_user.id,
         Message.role == "user"
-    ).scalar()
+    ))
     
-    assistant_messages = db.query(func.count(Message.id)).join(
+    assistant_messages = await db.scalar(select(func.count(Message.id)).join(
         Conversation, Message.conversation_id == Conversation.id
-    ).filter(
+    ).where(
         Conversation.user_id == current_user.id,
         Message.role == "assistant"
-    ).scalar()
+    ))
+    
+    # Archived conversations keep their message counts in the archive
+    archived = (await db.execute(select(
+        ConversationArchive.conversation_id, ConversationArchive.message_count, ConversationArchive.role_counts
+    ).join(
+        Conversation, ConversationArchive.conversation_id == Conversation.id
+    ).where(
+        Conversation.user_id == current_user.id
+    ))).all()
+    archived_counts = {conversation_id: count for conversation_id, count, _ in archived}
+    total_messages += sum(archived_counts.values())
+    user_messages += sum(role_counts.get("user", 0) for _, _, role_counts in archived)
+    assistant_messages += sum(role_counts.get("assistant", 0) for _, _, role_counts in archived)
+    
+    # Assistant replies by source, from the typed (indexed) message columns.
+    # Archived conversations only keep their role counts and are not included here.
+    replies = (await db.execute(select(
+        Message.source,
+        func.count(Message.id),
+        func.avg(Message.latency_ms),
+        func.sum(Message.prompt_tokens),
+        func.sum(Message.completion_tokens)
+    ).join(
+        Conversation, Message.conversation_id == Conversation.id
+    ).where(
+        Conversation.user_id == current_user.id,
+        Message.role == "assistant",
+        Message.source.isnot(None)
+    ).group_by(Message.source))).all()
+    replies_dict = {
+        source: {
+            "count": count,
+            "average_latency_ms": round(latency, 1) if latency is not None else None,
+            "prompt_tokens": prompt_tokens or 0,
+            "completion_tokens": completion_tokens or 0
+        }
+        for source, count, latency, prompt_tokens, completion_tokens in replies
+    }
     
     # Cases distribution
-    cases_distribution = db.query(
+    cases_distribution = (await db.execute(select(
         Conversation.case_type,
         func.count(Conversation.id).label('count')
-    ).filter(
+    ).where(
         Conversation.user_id == current_user.id,
         Conversation.case_type.isnot(None)
-    ).group_by(Conversation.case_type).all()
+    ).group_by(Conversation.case_type))).all()
     
-    # Format cases distribution
-    cases_dict = {case_type: count for case_type, count in cases_distribution}
+    # Older conversations store the knowledge-base file stem, newer ones the
+    # canonical case id: merge both through the alias map of the loaded snapshot
+    snapshot = request.app.state.knowledge_base_manager.snapshot
+    cases_dict: Dict[str, int] = {}
+    for case_type, count in cases_distribution:
+        case_id = snapshot.resolve(case_type) or case_type
+        cases_dict[case_id] = cases_dict.get(case_id, 0) + count
     
     # Most recent conversation
-    recent_conversation = db.query(Conversation).filter(
+    recent_conversation = await db.scalar(select(Conversation).where(
         Conversation.user_id == current_user.id
-    ).order_by(Conversation.created_at.desc()).first()
+    ).order_by(Conversation.created_at.desc()).limit(1))
     
     recent_conversation_data = None
     if recent_conversation:
         recent_conversation_data = {
             "id": recent_conversation.id,
-            "case_type": recent_conversation.case_type,
+            "case_type": snapshot.resolve(recent_conversation.case_type) or recent_conversation.case_type,
             "created_at": recent_conversation.created_at.isoformat(),
-            "message_count": db.query(func.count(Message.id)).filter(
-                Message.conversation_id == recent_conversation.id
-            ).scalar()
+            "message_count": archived_counts.get(recent_conversation.id) or await db.scalar(
+                select(func.count(Message.id)).where(Message.conversation_id == recent_conversation.id)
+            )
         }
     
     # Average messages per conversation
@@ -94,6 +138,7 @@ async def get_user_statistics(
             "user_messages": user_messages,
             "assistant_messages": assistant_messages
         },
+        "replies": replies_dict,
         "cases": {
             "distribution": cases_dict,
             "total_cases_consulted": len(cases_dict)
@@ -0,0 +1,376 @@
+"""
+Chat en temps réel sur WebSocket
+
+Une connexion est authentifiée une seule fois puis porte plusieurs
+consultations à la fois : chaque demande a un identifiant choisi par le
+client, repris dans toutes les trames qui la concernent. Les réponses du
+LLM sont diffusées au fil de l'eau et peuvent être interrompues.
+
+Protocole (trames JSON) :
+
+    client -> serveur
+        {"type": "auth", "token": "..."}    si le token n'est passé ni dans
+                                              l'en-tête Authorization ni en ?token=
+        {"type": "send", "id": "r1", "message": "...", "conversation_id": 12, "fast_mode": false}
+        {"type": "cancel", "id": "r1"}
+        {"type": "ping"}
+
+    serveur -> client
+        {"type": "ready", "user_id": 3}
+        {"type": "start", "id": "r1", "conversation_id": 12, "case_detected": "..."}
+        {"type": "token", "id": "r1", "delta": "..."}
+        {"type": "done", "id": "r1", "conversation_id": 12, "source": "llm", "cancelled": false}
+        {"type": "error", "id": "r1", "code": "...", "detail": "..."}
+        {"type": "pong"}
+
+Contre-pression par connexion : les trames sortantes passent par une file
+bornée (WS_SEND_BUFFER) vidée par un seul écrivain. Un client qui lit
+lentement la remplit ; les générations attendent alors, et le thread qui lit
+le flux de Mistral s'arrête après WS_STREAM_WINDOW fragments d'avance. Les
+fragments en attente sont regroupés en une seule trame.
+
+Une annulation (ou la déconnexion) arrête la lecture du flux : la connexion
+à Mistral est fermée et le créneau du LLM libéré. Le début de réponse déjà
+produit est enregistré (extra_data {"cancelled": true}), sauf à la
+déconnexion.
+"""
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect, status
+from loguru import logger
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app.ai_engine import SOURCE_LLM, AIReply
+from app.auth import decode_access_token, user_from_token
+from app.database import get_async_sessionmaker
+from app.metrics import WS_CONNECTIONS, WS_GENERATIONS
+from app.models import User
+from app.routes import chat
+from app.schemas import ChatRequest
+
+# Délai pour envoyer la trame d'authentification (secondes)
+WS_AUTH_TIMEOUT = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+# Générations simultanées par connexion
+WS_MAX_GENERATIONS = int(os.getenv("WS_MAX_GENERATIONS", "4"))
+# Trames en attente d'envoi par connexion
+WS_SEND_BUFFER = int(os.getenv("WS_SEND_BUFFER", "64"))
+# Fragments lus d'avance sur le flux du LLM, par génération
+WS_STREAM_WINDOW = int(os.getenv("WS_STREAM_WINDOW", "32"))
+
+# Fréquence à laquelle un thread bloqué par la contre-pression vérifie l'annulation
+_CANCEL_POLL = 0.05
+
+_DELTA, _DONE, _ERROR = "delta", "done", "error"
+
+router = APIRouter(tags=["chat"])
+
+
+class Generation:
+    """Réponse en cours de diffusion"""
+
+    def __init__(self, conversation_id: Optional[int]):
+        self.conversation_id = conversation_id
+        self.cancel = threading.Event()
+        self.task: Optional[asyncio.Task] = None
+
+
+def _produce(stream, post, credits: threading.Semaphore, cancel: threading.Event):
+    """
+    Thread : lit le flux du moteur IA et transmet chaque fragment à la boucle
+
+    Chaque fragment consomme un crédit, rendu quand la boucle le prend en
+    charge : le thread n'a jamais plus de WS_STREAM_WINDOW fragments d'avance.
+    """
+    try:
+        while True:
+            while not credits.acquire(timeout=_CANCEL_POLL):
+                if cancel.is_set():
+                    break
+            if cancel.is_set():
+                # Sans attendre le fragment suivant du LLM
+                stream.close()
+                post((_DONE, None))
+                return
+            try:
+                delta = next(stream)
+            except StopIteration as stop:
+                post((_DONE, stop.value))
+                return
+            post((_DELTA, delta))
+    except Exception as e:
+        post((_ERROR, e))
+
+
+class ChatConnection:
+    """Une connexion WebSocket authentifiée et ses générations en cours"""
+
+    def __init__(self, websocket: WebSocket, user: User, sessionmaker: async_sessionmaker, expires_at: float):
+        self.websocket = websocket
+        self.user = user
+        self.sessionmaker = sessionmaker
+        self.expires_at = expires_at
+        self.outbox: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_BUFFER)
+        self.generations: Dict[str, Generation] = {}
+
+    async def send(self, frame: Dict):
+        """Met une trame en file (attend si le client ne lit pas assez vite)"""
+        await self.outbox.put(frame)
+
+    async def error(self, request_id: Optional[str], code: str, detail: str):
+        await self.send({"type": "error", "id": request_id, "code": code, "detail": detail})
+
+    async def _writer(self):
+        while True:
+            frame = await self.outbox.get()
+            await self.websocket.send_json(frame)
+
+    async def run(self):
+        writer = asyncio.create_task(self._writer())
+        WS_CONNECTIONS.inc()
+        try:
+            await self.send({"type": "ready", "user_id": self.user.id})
+            while True:
+                try:
+                    frame = await self.websocket.receive_json()
+                except ValueError:
+                    await self.error(None, "invalid_frame", "Trame JSON attendue")
+                    continue
+                if not await self.handle(frame):
+                    break
+        except WebSocketDisconnect:
+            pass
+        finally:
+            WS_CONNECTIONS.dec()
+            # Déconnexion : les LLM en cours sont arrêtés, créneaux libérés
+            tasks = []
+            for generation in self.generations.values():
+                generation.cancel.set()
+                if generation.task is not None:
+                    generation.task.cancel()
+                    tasks.append(generation.task)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            writer.cancel()
+
+    async def handle(self, frame) -> bool:
+        """Traite une trame du client (False : fermer la connexion)"""
+        kind = frame.get("type") if isinstance(frame, dict) else None
+        if kind == "send":
+            # Authentifiée une seule fois : la connexion ne survit pas au token
+            if time.time() >= self.expires_at:
+                await self.websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token expiré")
+                return False
+            await self.start(frame)
+        elif kind == "cancel":
+            generation = self.generations.get(str(frame.get("id")))
+            if generation is not None:
+                generation.cancel.set()
+        elif kind == "ping":
+            await self.send({"type": "pong"})
+        else:
+            await self.error(None, "invalid_frame", "Type de trame inconnu")
+        return True
+
+    async def start(self, frame: Dict):
+        """Lance la génération d'une réponse sans bloquer la lecture des trames"""
+        request_id = frame.get("id")
+        if not isinstance(request_id, (str, int)) or isinstance(request_id, bool):
+            await self.error(None, "invalid_request", "Identifiant de demande manquant")
+            return
+        request_id = str(request_id)
+        try:
+            request = ChatRequest.model_validate(
+                {key: value for key, value in frame.items() if key not in ("type", "id")}
+            )
+        except ValidationError as e:
+            await self.error(request_id, "invalid_request", str(e.errors()[0]["msg"]))
+            return
+
+        if request_id in self.generations:
+            await self.error(request_id, "duplicate_id", "Demande déjà en cours avec cet identifiant")
+            return
+        if len(self.generations) >= WS_MAX_GENERATIONS:
+            await self.error(request_id, "busy", f"Au plus {WS_MAX_GENERATIONS} réponses en cours par connexion")
+            return
+        if request.conversation_id is not None and any(
+            generation.conversation_id == request.conversation_id for generation in self.generations.values()
+        ):
+            await self.error(request_id, "conversation_busy", "Une réponse est déjà en cours dans cette conversation")
+            return
+
+        generation = Generation(request.conversation_id)
+        self.generations[request_id] = generation
+        generation.task = asyncio.create_task(self.generate(request_id, request, generation))
+
+    async def generate(self, request_id: str, request: ChatRequest, generation: Generation):
+        """Enregistre le message, diffuse la réponse puis l'enregistre"""
+        outcome = "error"
+        try:
+            async with self.sessionmaker() as db:
+                turn = await chat.prepare_turn(
+                    db, self.user, request.message,
+                    conversation_id=request.conversation_id,
+                    fast_mode=request.fast_mode
+                )
+                generation.conversation_id = turn.conversation.id
+                await self.send({
+                    "type": "start",
+                    "id": request_id,
+                    "conversation_id": turn.conversation.id,
+                    "case_detected": turn.case_detected
+                })
+
+                stream = chat.ai_engine.stream_reply(
+                    request.message,
+                    case_id=turn.case_detected,
+                    conversation_history=turn.history,
+                    fast_mode=request.fast_mode,
+                    cancel=generation.cancel
+                )
+                content, reply = await self.relay(request_id, stream, request.fast_mode, generation.cancel)
+                cancelled = generation.cancel.is_set()
+                if reply is None:
+                    # Flux fermé avant sa fin : seul le texte déjà diffusé est connu
+                    reply = AIReply(content, SOURCE_LLM, chat.ai_engine.model)
+                if reply.content:
+                    await chat.save_reply(
+                        db, self.user, turn, reply,
+                        extra_data={"cancelled": True} if cancelled else None
+                    )
+                outcome = "cancelled" if cancelled else "completed"
+                await self.send({
+                    "type": "done",
+                    "id": request_id,
+                    "conversation_id": turn.conversation.id,
+                    "source": reply.source,
+                    "cancelled": cancelled
+                })
+        except HTTPException as e:
+            await self.error(request_id, "not_found", e.detail)
+        except asyncio.CancelledError:
+            outcome = "disconnected"
+            raise
+        except Exception as e:
+            logger.error(f"Erreur génération WebSocket: {e}")
+            await self.error(request_id, "generation_failed", "La réponse n'a pas pu être générée")
+        finally:
+            WS_GENERATIONS.labels(outcome).inc()
+            self.generations.pop(request_id, None)
+
+    async def relay(
+        self,
+        request_id: str,
+        stream,
+        fast_mode: bool,
+        cancel: threading.Event
+    ) -> Tuple[str, Optional[AIReply]]:
+        """
+        Diffuse les fragments de la réponse au client
+
+        Returns:
+            (texte diffusé, réponse du moteur ou None si le flux a été fermé)
+        """
+        parts = []
+        if fast_mode:
+            # Base de connaissances : calcul local, pas de thread
+            while True:
+                try:
+                    delta = next(stream)
+                except StopIteration as stop:
+                    return "".join(parts), stop.value
+                parts.append(delta)
+                await self.send({"type": "token", "id": request_id, "delta": delta})
+
+        loop = asyncio.get_running_loop()
+        inbox: asyncio.Queue = asyncio.Queue()
+        credits = threading.Semaphore(WS_STREAM_WINDOW)
+
+        def post(item):
+            try:
+                loop.call_soon_threadsafe(inbox.put_nowait, item)
+            except RuntimeError:
+                # Boucle fermée : plus personne pour lire
+                pass
+
+        producer = asyncio.ensure_future(run_in_threadpool(_produce, stream, post, credits, cancel))
+        finished = False
+        try:
+            while True:
+                kind, value = await inbox.get()
+                deltas = []
+                # Fragments arrivés pendant l'envoi précédent : une seule trame
+                while kind == _DELTA:
+                    deltas.append(value)
+                    credits.release()
+                    if inbox.empty():
+                        kind = None
+                        break
+                    kind, value = inbox.get_nowait()
+                if deltas:
+                    parts.extend(deltas)
+                    await self.send({"type": "token", "id": request_id, "delta": "".join(deltas)})
+                if kind == _DONE:
+                    finished = True
+                    return "".join(parts), value
+                if kind == _ERROR:
+                    finished = True
+                    raise value
+        finally:
+            if not finished:
+                # Sortie anticipée (déconnexion) : le thread s'arrête et libère le LLM
+                cancel.set()
+            await asyncio.shield(producer)
+
+
+async def authenticate(websocket: WebSocket, sessionmaker: async_sessionmaker) -> Tuple[Optional[User], float]:
+    """
+    Utilisateur de la connexion : token de l'en-tête Authorization, du
+    paramètre ?token= ou de la première trame {"type": "auth"}
+
+    Returns:
+        (utilisateur actif ou None, expiration du token en secondes epoch)
+    """
+    token = websocket.query_params.get("token")
+    authorization = websocket.headers.get("authorization", "")
+    if not token and authorization.lower().startswith("bearer "):
+        token = authorization[7:]
+    if not token:
+        try:
+            frame = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT)
+        except (asyncio.TimeoutError, ValueError, KeyError):
+            return None, 0
+        if isinstance(frame, dict) and frame.get("type") == "auth":
+            token = frame.get("token")
+    if not isinstance(token, str):
+        return None, 0
+
+    payload = decode_access_token(token)
+    if payload is None:
+        return None, 0
+    async with sessionmaker() as db:
+        user = await user_from_token(db, token)
+    if user is None or not user.is_active:
+        return None, 0
+    return user, float(payload.get("exp", 0))
+
+
+@router.websocket("/ws/chat")
+async def chat_websocket(
+    websocket: WebSocket,
+    sessionmaker: async_sessionmaker = Depends(get_async_sessionmaker)
+):
+    """Chat multiplexé en streaming (voir le protocole en tête du module)"""
+    await websocket.accept()
+    try:
+        user, expires_at = await authenticate(websocket, sessionmaker)
+    except WebSocketDisconnect:
+        return
+    if user is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Impossible de valider les identifiants")
+        return
+    await ChatConnection(websocket, user, sessionmaker, expires_at).run()
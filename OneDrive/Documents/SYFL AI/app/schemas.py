@@ -47,6 +47,8 @@ class ChatRequest(BaseModel):
     """Schéma pour envoyer un message"""
     message: str = Field(..., min_length=1, max_length=5000)
     conversation_id: Optional[int] = None
+    # Réponse immédiate depuis la base de connaissances, sans appel au LLM
+    fast_mode: bool = False
 
 
 class ChatResponse(BaseModel):
@@ -55,6 +57,8 @@ class ChatResponse(BaseModel):
     conversation_id: int
     case_detected: Optional[str] = None
     confidence: Optional[float] = None
+    # "llm" ou "knowledge_base" (mode rapide ou LLM indisponible)
+    source: Optional[str] = None
 
 
 class MessageResponse(BaseModel):
@@ -85,6 +89,45 @@ class ConversationDetailResponse(ConversationResponse):
     messages: List[MessageResponse]
 
 
+class ConversationsDeletedResponse(BaseModel):
+    """Schéma pour la suppression de toutes les conversations"""
+    deleted: int
+
+
+class SearchResultResponse(BaseModel):
+    """Schéma pour un message trouvé par la recherche"""
+    message_id: int
+    conversation_id: int
+    conversation_title: Optional[str] = None
+    role: str
+    created_at: datetime
+    # Extrait échappé (HTML), termes trouvés entre <mark></mark>
+    snippet: str
+
+
+class SearchResponse(BaseModel):
+    """Schéma pour une page de résultats de recherche"""
+    results: List[SearchResultResponse]
+    # À renvoyer dans `cursor` pour la page suivante (None : dernière page)
+    next_cursor: Optional[str] = None
+
+
+# === EXPORT ===
+
+class ExportJobResponse(BaseModel):
+    """Schéma pour l'état d'un export groupé"""
+    id: int
+    status: str
+    total: int = Field(0, validation_alias="progress_total")
+    completed: int = Field(0, validation_alias="progress_current")
+    error: Optional[str] = Field(None, validation_alias="last_error")
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+
 # === CAS JURIDIQUES ===
 
 class CaseResponse(BaseModel):
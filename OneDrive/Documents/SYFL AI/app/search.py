@@ -0,0 +1,265 @@
+"""
+Recherche plein texte dans l'historique des consultations
+
+Index maintenu par la base à chaque insertion, modification ou suppression
+d'un message (aucun `LIKE '%…%'`) :
+- SQLite : table FTS5 `messages_fts` (contenu externe : la table messages),
+  tokenizer unicode61 sans accents, tenue à jour par des triggers. FTS5 n'a
+  pas de racinisation française : chaque mot de la requête est tronqué à la
+  racine de la détection par mots-clés (STEM_LENGTH) et cherché en préfixe
+  ("licencié" -> licenc*, trouve "licenciement").
+- PostgreSQL : colonne générée `search_vector` (tsvector, configuration
+  `syfl_french` = racinisation française + unaccent) et index GIN.
+
+Les résultats sont classés par pertinence (bm25 / ts_rank_cd), avec un
+extrait surligné, et paginés par curseur (score, id du message).
+
+Le schéma est créé avec les tables (`create_all`) ou par la migration
+alembic pour une base existante. Les conversations archivées (app.archive)
+ne sont plus dans la table messages : elles sortent de l'index.
+"""
+import base64
+import html
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import DDL, DateTime, event, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.fallback import STEM_LENGTH
+from app.knowledge_base import slugify
+from app.models import Message
+
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 50
+# Termes retenus par requête
+SEARCH_MAX_TERMS = 8
+# Longueur des extraits (mots)
+SNIPPET_WORDS = 16
+
+# Délimiteurs posés par la base autour des termes trouvés, remplacés par <mark>
+# après échappement HTML du texte (le contenu des messages n'est jamais interprété)
+_HIGHLIGHT_START = "\x02"
+_HIGHLIGHT_END = "\x03"
+
+# Mots trop fréquents pour être cherchés (sans accents)
+SEARCH_STOPWORDS = {
+    "les", "des", "une", "est", "pas", "que", "qui", "quoi", "pour", "par", "sur", "dans",
+    "avec", "sans", "mon", "mes", "ma", "ton", "tes", "son", "ses", "nous", "vous", "ils",
+    "elle", "elles", "leur", "leurs", "mais", "donc", "car", "aux", "ont", "suis", "etre",
+    "avoir", "cette", "ces", "cet", "plus", "tres", "tout", "tous",
+}
+
+# === Schéma ===
+
+SQLITE_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    "content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+    # Aussi déclenché par les suppressions en cascade (ON DELETE CASCADE)
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); END",
+    "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+    "INSERT INTO messages_fts(messages_fts, rowid, content) VALUES ('delete', old.id, old.content); "
+    "INSERT INTO messages_fts(rowid, content) VALUES (new.id, new.content); END",
+]
+SQLITE_DROP_DDL = ["DROP TABLE IF EXISTS messages_fts"]
+
+POSTGRES_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "DO $$ BEGIN "
+    "IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'syfl_french') THEN "
+    "CREATE TEXT SEARCH CONFIGURATION syfl_french (COPY = french); "
+    "ALTER TEXT SEARCH CONFIGURATION syfl_french "
+    "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, french_stem; "
+    "END IF; END $$",
+    "ALTER TABLE messages ADD COLUMN IF NOT EXISTS search_vector tsvector "
+    "GENERATED ALWAYS AS (to_tsvector('syfl_french'::regconfig, content)) STORED",
+    "CREATE INDEX IF NOT EXISTS ix_messages_search_vector ON messages USING GIN (search_vector)",
+]
+
+for _statement in SQLITE_DDL:
+    event.listen(Message.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in SQLITE_DROP_DDL:
+    event.listen(Message.__table__, "before_drop", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in POSTGRES_DDL:
+    event.listen(Message.__table__, "after_create", DDL(_statement).execute_if(dialect="postgresql"))
+
+
+# === Requêtes ===
+
+class SearchHit(NamedTuple):
+    """Un message trouvé, avec son extrait surligné"""
+    message_id: int
+    conversation_id: int
+    conversation_title: Optional[str]
+    role: str
+    created_at: Any
+    snippet: str
+    # Plus petit = plus pertinent (clé de pagination avec message_id)
+    score: float
+
+
+class InvalidCursor(ValueError):
+    """Curseur de pagination illisible"""
+
+
+def search_terms(query: str) -> List[str]:
+    """Racines des mots significatifs d'une requête (sans accents)"""
+    terms = []
+    for word in slugify(query).split("_"):
+        if len(word) < 3 or word in SEARCH_STOPWORDS:
+            continue
+        stem = word[:STEM_LENGTH]
+        if stem not in terms:
+            terms.append(stem)
+    return terms[:SEARCH_MAX_TERMS]
+
+
+def fts5_query(terms: List[str]) -> str:
+    """Requête FTS5 : tous les termes, en préfixe ("licenc"* "salair"*)"""
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+def encode_cursor(score: float, message_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([score, message_id]).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        score, message_id = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return float(score), int(message_id)
+    except (ValueError, TypeError, UnicodeError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def render_snippet(snippet: str) -> str:
+    """Extrait échappé (HTML), termes trouvés entre <mark></mark>"""
+    return html.escape(snippet).replace(_HIGHLIGHT_START, "<mark>").replace(_HIGHLIGHT_END, "</mark>")
+
+
+def _after_cursor(paginated: bool) -> str:
+    """Pagination : (score, id) strictement après le curseur"""
+    if not paginated:
+        return ""
+    return "WHERE score > :after_score OR (score = :after_score AND id > :after_id)"
+
+
+def _sqlite_matches(paginated: bool):
+    return text(f"""
+        SELECT id, score FROM (
+            SELECT messages.id AS id, bm25(messages_fts) AS score
+            FROM messages_fts
+            JOIN messages ON messages.id = messages_fts.rowid
+            JOIN conversations ON conversations.id = messages.conversation_id
+            WHERE messages_fts MATCH :query AND conversations.user_id = :user_id
+        )
+        {_after_cursor(paginated)}
+        ORDER BY score, id
+        LIMIT :limit
+    """)
+
+
+def _postgres_search(paginated: bool):
+    return text(f"""
+        WITH matches AS (
+            SELECT id, score FROM (
+                SELECT messages.id AS id,
+                       -ts_rank_cd(messages.search_vector, websearch_to_tsquery('syfl_french', :query)) AS score
+                FROM messages
+                JOIN conversations ON conversations.id = messages.conversation_id
+                WHERE messages.search_vector @@ websearch_to_tsquery('syfl_french', :query)
+                  AND conversations.user_id = :user_id
+            ) ranked
+            {_after_cursor(paginated)}
+            ORDER BY score, id
+            LIMIT :limit
+        )
+        SELECT messages.id, messages.conversation_id, conversations.title, messages.role, messages.created_at,
+               ts_headline('syfl_french', messages.content, websearch_to_tsquery('syfl_french', :query),
+                           :headline_options) AS snippet,
+               matches.score
+        FROM matches
+        JOIN messages ON messages.id = matches.id
+        JOIN conversations ON conversations.id = messages.conversation_id
+        ORDER BY matches.score, matches.id
+    """).columns(created_at=DateTime)
+
+
+_SQLITE_MATCHES = {paginated: _sqlite_matches(paginated) for paginated in (False, True)}
+_POSTGRES_SEARCH = {paginated: _postgres_search(paginated) for paginated in (False, True)}
+
+_SQLITE_SNIPPETS = text(f"""
+    SELECT messages.id, messages.conversation_id, conversations.title, messages.role, messages.created_at,
+           snippet(messages_fts, 0, '{_HIGHLIGHT_START}', '{_HIGHLIGHT_END}', '…', {SNIPPET_WORDS}) AS snippet
+    FROM messages_fts
+    JOIN messages ON messages.id = messages_fts.rowid
+    JOIN conversations ON conversations.id = messages.conversation_id
+    WHERE messages_fts MATCH :query AND messages_fts.rowid IN (SELECT value FROM json_each(:ids))
+""").columns(created_at=DateTime)
+
+_POSTGRES_HEADLINE_OPTIONS = (
+    f"StartSel={_HIGHLIGHT_START}, StopSel={_HIGHLIGHT_END}, "
+    f"MaxWords={SNIPPET_WORDS}, MinWords={SNIPPET_WORDS // 2}, MaxFragments=2, FragmentDelimiter=\" … \""
+)
+
+
+async def search_messages(
+    db: AsyncSession,
+    user_id: int,
+    query: str,
+    limit: int = SEARCH_DEFAULT_LIMIT,
+    cursor: Optional[str] = None
+) -> Tuple[List[SearchHit], Optional[str]]:
+    """
+    Messages de l'utilisateur correspondant à la requête, les plus pertinents d'abord
+
+    Args:
+        db: Session async (base principale ou réplica)
+        user_id: Propriétaire des conversations
+        query: Texte saisi par l'utilisateur
+        limit: Résultats par page
+        cursor: Curseur renvoyé par la page précédente
+
+    Returns:
+        (résultats, curseur de la page suivante ou None)
+
+    Raises:
+        InvalidCursor: Curseur illisible
+    """
+    # Un résultat de plus pour savoir s'il reste une page
+    params: Dict[str, Any] = {"user_id": user_id, "limit": limit + 1}
+    paginated = cursor is not None
+    if paginated:
+        params["after_score"], params["after_id"] = decode_cursor(cursor)
+
+    if db.get_bind().dialect.name == "postgresql":
+        if not query.strip():
+            return [], None
+        rows = (await db.execute(_POSTGRES_SEARCH[paginated], {
+            **params, "query": query, "headline_options": _POSTGRES_HEADLINE_OPTIONS
+        })).all()
+        hits = [SearchHit(*row[:5], render_snippet(row.snippet), float(row.score)) for row in rows]
+    else:
+        terms = search_terms(query)
+        if not terms:
+            return [], None
+        match = fts5_query(terms)
+        matches = (await db.execute(_SQLITE_MATCHES[paginated], {**params, "query": match})).all()
+        # Extraits calculés seulement pour la page renvoyée
+        ids = [message_id for message_id, _ in matches]
+        rows = {
+            row.id: row
+            for row in await db.execute(_SQLITE_SNIPPETS, {"query": match, "ids": json.dumps(ids)})
+        }
+        hits = [
+            SearchHit(*rows[message_id][:5], render_snippet(rows[message_id].snippet), score)
+            for message_id, score in matches if message_id in rows
+        ]
+
+    next_cursor = None
+    if len(hits) > limit:
+        hits = hits[:limit]
+        next_cursor = encode_cursor(hits[-1].score, hits[-1].message_id)
+    return hits, next_cursor
@@ -0,0 +1,269 @@
+"""
+Décomposition du temps de chaque requête
+
+Le middleware ouvre une mesure par requête (contextvar) ; le code
+instrumenté y ajoute des phases avec `span("nom")`. Les durées sont
+renvoyées dans l'en-tête Server-Timing (visible dans les outils de
+développement du navigateur) et journalisées pour les requêtes lentes.
+
+Un profil statistique peut aussi être capturé : un thread unique du
+processus échantillonne la pile des threads qui servent les requêtes
+profilées en cours (sys._current_frames) et écrit les piles agrégées de
+chaque requête au format "collapsed" (flamegraph.pl, speedscope) dans
+PROFILE_DIR.
+
+Usage:
+    with span("history"):
+        messages = db.query(...).all()
+"""
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Set
+
+from loguru import logger
+from starlette.concurrency import run_in_threadpool
+
+# Journalise la décomposition des requêtes plus lentes que ce seuil (ms, 0 = toutes)
+SERVER_TIMING_LOG_THRESHOLD_MS = float(os.getenv("SERVER_TIMING_LOG_THRESHOLD_MS", "1000"))
+# Profile 1 requête sur N (0 = désactivé)
+PROFILE_SAMPLE_RATE = int(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+# Profile toutes les requêtes et conserve celles plus lentes que ce seuil (ms, 0 = désactivé)
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "0"))
+# Intervalle d'échantillonnage des piles (secondes)
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+
+
+class RequestTimings:
+    """Phases mesurées pendant une requête"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # phase -> durée cumulée (secondes)
+        self.spans: Dict[str, float] = {}
+        # Threads qui exécutent du code de la requête (pour le profileur) :
+        # celui de la boucle d'événements, plus ceux des spans en cours
+        self.thread_ids: Set[int] = {threading.get_ident()}
+        self._owner = threading.get_ident()
+        self._thread_spans: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def enter_thread(self):
+        """Le thread appelant exécute du code de la requête (début d'un span)"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._thread_spans[thread_id] += 1
+            self.thread_ids.add(thread_id)
+
+    def leave_thread(self):
+        """Fin d'un span : un thread du pool rendu au pool n'est plus échantillonné"""
+        thread_id = threading.get_ident()
+        with self._lock:
+            self._thread_spans[thread_id] -= 1
+            if self._thread_spans[thread_id] <= 0:
+                del self._thread_spans[thread_id]
+                if thread_id != self._owner:
+                    self.thread_ids.discard(thread_id)
+
+    def threads(self) -> Set[int]:
+        with self._lock:
+            return set(self.thread_ids)
+
+    def add(self, name: str, duration: float):
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + duration
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def header(self) -> str:
+        """Valeur de l'en-tête Server-Timing (durées en millisecondes)"""
+        with self._lock:
+            spans = list(self.spans.items())
+        entries = [f"{name};dur={duration * 1000:.1f}" for name, duration in spans]
+        entries.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[RequestTimings]] = ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    """Mesure de la requête en cours (None hors requête)"""
+    return _current.get()
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Mesure une phase de la requête en cours (sans effet hors requête)"""
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+    timings.enter_thread()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(name, time.perf_counter() - start)
+        timings.leave_thread()
+
+
+def record_span(name: str, duration: float):
+    """Ajoute une durée déjà mesurée à la requête en cours"""
+    timings = _current.get()
+    if timings is not None:
+        timings.add(name, duration)
+
+
+class RequestProfile:
+    """Piles échantillonnées d'une requête profilée"""
+
+    def __init__(self, timings: RequestTimings):
+        self.timings = timings
+        self.samples: Counter = Counter()
+
+    def write(self, name: str) -> Optional[Path]:
+        """Écrit les piles agrégées (format collapsed) dans PROFILE_DIR"""
+        if not self.samples:
+            return None
+        directory = Path(PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}_{name}.folded"
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+        return path
+
+
+class StackSampler:
+    """
+    Échantillonne les piles des requêtes profilées en cours
+
+    Un seul thread pour tout le processus : à chaque intervalle, les piles
+    (sys._current_frames) sont relevées une fois et attribuées à chaque
+    requête enregistrée qui a du code sur ces threads. Sans requête
+    enregistrée, le thread attend sans rien relever.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self._profiles: Dict[int, RequestProfile] = {}
+        self._lock = threading.Lock()
+        self._active = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, timings: RequestTimings) -> RequestProfile:
+        """Commence l'échantillonnage d'une requête"""
+        profile = RequestProfile(timings)
+        with self._lock:
+            self._profiles[id(profile)] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._thread.start()
+        self._active.set()
+        return profile
+
+    def unregister(self, profile: RequestProfile):
+        """Fin de l'échantillonnage : `profile.samples` n'est plus modifié"""
+        with self._lock:
+            self._profiles.pop(id(profile), None)
+            if not self._profiles:
+                self._active.clear()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            stacks: Dict[int, str] = {}
+            with self._lock:
+                for profile in self._profiles.values():
+                    for thread_id in profile.timings.threads():
+                        if thread_id == own_id or thread_id not in frames:
+                            continue
+                        if thread_id not in stacks:
+                            stacks[thread_id] = _collapse(frames[thread_id])
+                        profile.samples[stacks[thread_id]] += 1
+            del frames
+
+
+def _collapse(frame) -> str:
+    """Pile d'un thread au format collapsed (appelant d'abord)"""
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ";".join(reversed(stack))
+
+
+# Échantillonneur partagé par toutes les requêtes profilées
+profiler = StackSampler()
+
+
+def _should_profile() -> bool:
+    if PROFILE_SLOW_MS > 0:
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.randrange(PROFILE_SAMPLE_RATE) == 0
+
+
+class ServerTimingMiddleware:
+    """
+    Middleware ASGI : mesure par requête, en-tête Server-Timing, journal
+    des requêtes lentes et profil échantillonné
+    """
+
+    def __init__(self, app, excluded_paths=("/metrics", "/health")):
+        self.app = app
+        self.excluded_paths = set(excluded_paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.excluded_paths:
+            await self.app(scope, receive, send)
+            return
+
+        timings = RequestTimings()
+        token = _current.set(timings)
+        profile = profiler.register(timings) if _should_profile() else None
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timings.header().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed_ms = timings.elapsed() * 1000
+            route = getattr(scope.get("route"), "path", None) or scope["path"]
+
+            if elapsed_ms >= SERVER_TIMING_LOG_THRESHOLD_MS:
+                logger.bind(
+                    method=scope["method"], route=route, status=status_code,
+                    duration_ms=round(elapsed_ms, 1),
+                    spans={name: round(duration * 1000, 1) for name, duration in timings.spans.items()}
+                ).info(f"⏱️ {scope['method']} {route} {status_code} {elapsed_ms:.0f}ms ({timings.header()})")
+
+            if profile is not None:
+                profiler.unregister(profile)
+                if PROFILE_SLOW_MS <= 0 or elapsed_ms >= PROFILE_SLOW_MS:
+                    slug = route.strip("/").replace("/", "_").replace("{", "").replace("}", "") or "root"
+                    path = await run_in_threadpool(profile.write, f"{scope['method']}_{slug}_{elapsed_ms:.0f}ms")
+                    if path is not None:
+                        logger.info(f"Profil enregistré: {path}")
@@ -0,0 +1,447 @@
+"""
+Écritures différées (write-behind) des réponses de l'assistant
+
+Avec WRITE_BEHIND_ENABLED=true, `send_message` n'attend plus le commit du
+message de l'assistant : la ligne est ajoutée (et synchronisée sur disque)
+à un journal local en ajout seul, puis un thread l'insère avec les autres
+écritures en attente, par lots (un INSERT multi-lignes et une transaction
+par lot). Les métadonnées de la réponse (modèle, tokens, latence) sont des
+colonnes du message : elles suivent le même chemin, sans commit de plus.
+
+Reprise après un arrêt brutal : chaque lot enregistre, dans sa propre
+transaction, le numéro de la dernière écriture insérée pour ce journal
+(table write_behind_checkpoints). Au démarrage, les écritures journalisées
+au-delà de ce numéro sont rejouées, sans doublon.
+
+Contre-pression : au-delà de WRITE_BEHIND_MAX_PENDING écritures en
+attente, `submit` attend une place pendant WRITE_BEHIND_ENQUEUE_TIMEOUT
+secondes puis rend False ; l'appelant écrit alors directement en base.
+
+Chaque processus prend un emplacement libre de WRITE_BEHIND_DIR (verrou
+fcntl) : un worker redémarré reprend le journal laissé par celui qu'il
+remplace.
+
+Usage:
+    if not await write_behind.submit("messages", values, key=conversation_id):
+        db.add(Message(**values))
+        await db.commit()
+"""
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Deque, Dict, List, NamedTuple, Optional
+
+from loguru import logger
+from sqlalchemy import DateTime, Table, insert
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from app.database import Base, SessionLocal
+from app.metrics import WRITE_BEHIND_FLUSH, WRITE_BEHIND_PENDING, WRITE_BEHIND_RECORDS
+from app.models import WriteBehindCheckpoint
+
+try:
+    import fcntl
+except ImportError:  # Windows : un seul processus par répertoire
+    fcntl = None
+
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+WRITE_BEHIND_DIR = os.getenv("WRITE_BEHIND_DIR", "write_behind")
+# Écritures insérées par lot (un INSERT multi-lignes par table)
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))
+# Délai maximal avant l'insertion d'une écriture (secondes)
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.1"))
+# Écritures en attente au-delà desquelles les producteurs attendent
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+# Attente d'une place avant de repasser en écriture directe (secondes)
+WRITE_BEHIND_ENQUEUE_TIMEOUT = float(os.getenv("WRITE_BEHIND_ENQUEUE_TIMEOUT", "1"))
+# Attente maximale des écritures d'une conversation avant de relire son historique (secondes)
+WRITE_BEHIND_READ_TIMEOUT = float(os.getenv("WRITE_BEHIND_READ_TIMEOUT", "2"))
+# fsync après chaque écriture journalisée (false : plus rapide, perte possible en cas de coupure)
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "true").lower() != "false"
+# Taille d'un segment du journal avant rotation (octets)
+WRITE_BEHIND_SEGMENT_BYTES = int(os.getenv("WRITE_BEHIND_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+
+# Attente entre deux essais quand la base refuse un lot (secondes, doublée jusqu'au maximum)
+_RETRY_DELAY = 0.5
+_RETRY_MAX_DELAY = 30.0
+
+
+class PendingWrite(NamedTuple):
+    """Une écriture journalisée, pas encore insérée"""
+    seq: int
+    table: str
+    row: Dict[str, Any]
+    # Regroupe les écritures à attendre avant une lecture (ex: id de conversation)
+    key: Optional[Any]
+
+
+def _encode(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def _decode(table: Table, row: Dict[str, Any]) -> Dict[str, Any]:
+    """Ligne relue du journal : les dates redeviennent des datetime"""
+    return {
+        name: datetime.fromisoformat(value)
+        if isinstance(value, str) and isinstance(table.c[name].type, DateTime) else value
+        for name, value in row.items()
+    }
+
+
+class WriteBehindQueue:
+    """
+    Journal local + insertion par lots des écritures différées
+
+    Args:
+        directory: Répertoire des emplacements (un journal par processus)
+        enabled: False = `submit` rend toujours False (écriture directe)
+        batch_size: Écritures insérées par transaction
+        flush_interval: Délai maximal avant insertion (secondes)
+        max_pending: Borne de la file (contre-pression)
+        enqueue_timeout: Attente d'une place dans la file (secondes)
+        fsync: Synchronisation du journal sur disque à chaque écriture
+        segment_bytes: Taille d'un segment avant rotation
+        session_factory: Sessions synchrones du thread d'insertion
+    """
+
+    def __init__(
+        self,
+        directory: str = WRITE_BEHIND_DIR,
+        enabled: bool = WRITE_BEHIND_ENABLED,
+        batch_size: int = WRITE_BEHIND_BATCH_SIZE,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+        max_pending: int = WRITE_BEHIND_MAX_PENDING,
+        enqueue_timeout: float = WRITE_BEHIND_ENQUEUE_TIMEOUT,
+        fsync: bool = WRITE_BEHIND_FSYNC,
+        segment_bytes: int = WRITE_BEHIND_SEGMENT_BYTES,
+        session_factory=SessionLocal
+    ):
+        self.directory = Path(directory)
+        self.enabled = enabled
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.enqueue_timeout = enqueue_timeout
+        self.fsync = fsync
+        self.segment_bytes = segment_bytes
+        self.session_factory = session_factory
+
+        self.slot: Optional[str] = None
+        self.slot_dir: Optional[Path] = None
+        self.last_error: Optional[str] = None
+        self._pending: Deque[PendingWrite] = deque()
+        self._pending_keys: Counter = Counter()
+        self._cond = threading.Condition()
+        # Numérotation et ajout au journal (l'ordre du journal est celui de la file)
+        self._log_lock = threading.Lock()
+        self._seq = 0
+        self._flushed_seq = 0
+        self._segment = None
+        self._segment_path: Optional[Path] = None
+        self._segment_number = 0
+        # Segments fermés -> numéro de leur dernière écriture
+        self._closed_segments: Dict[Path, int] = {}
+        self._lock_file = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and not self._stopping
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    # === Démarrage et reprise ===
+
+    def start(self):
+        """Prend un emplacement, rejoue son journal puis démarre le thread d'insertion"""
+        if not self.enabled or self._thread is not None:
+            return
+        self.slot_dir = self._acquire_slot()
+        slot_id_path = self.slot_dir / "slot-id"
+        if not slot_id_path.exists():
+            slot_id_path.write_text(uuid.uuid4().hex, encoding="utf-8")
+        # Identifiant stocké avec le journal : il survit aux changements d'hôte (conteneurs)
+        self.slot = slot_id_path.read_text(encoding="utf-8").strip()
+        self._recover()
+        self._open_segment()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        logger.info(f"✍️ Écritures différées actives ({self.slot_dir})")
+
+    def _acquire_slot(self) -> Path:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for number in itertools.count():
+            slot_dir = self.directory / f"slot-{number}"
+            slot_dir.mkdir(exist_ok=True)
+            if fcntl is None:
+                return slot_dir
+            lock_file = open(slot_dir / "lock", "a")
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                # Emplacement utilisé par un autre processus vivant
+                lock_file.close()
+                continue
+            self._lock_file = lock_file
+            return slot_dir
+
+    def _recover(self):
+        """Remet en file les écritures journalisées après le dernier lot inséré"""
+        db = self.session_factory()
+        try:
+            checkpoint = db.get(WriteBehindCheckpoint, self.slot)
+            checkpoint = checkpoint.seq if checkpoint else 0
+        finally:
+            db.close()
+
+        self._pending.clear()
+        self._pending_keys.clear()
+        self._closed_segments.clear()
+        last_seq = checkpoint
+        for path in sorted(self.slot_dir.glob("segment-*.log")):
+            self._segment_number = max(self._segment_number, int(path.stem.split("-")[1]))
+            segment_seq = 0
+            with open(path, encoding="utf-8") as segment:
+                for line in segment:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Dernière ligne coupée par l'arrêt : jamais acquittée
+                        logger.warning(f"Ligne incomplète ignorée dans {path.name}")
+                        break
+                    segment_seq = record["seq"]
+                    if record["seq"] > checkpoint:
+                        table = Base.metadata.tables[record["table"]]
+                        self._append_pending(PendingWrite(
+                            record["seq"], record["table"], _decode(table, record["row"]), record.get("key")
+                        ))
+            self._closed_segments[path] = segment_seq
+            last_seq = max(last_seq, segment_seq)
+
+        self._seq = last_seq
+        self._flushed_seq = checkpoint
+        self._prune_segments()
+        if self._pending:
+            logger.info(f"♻️ {len(self._pending)} écriture(s) différée(s) reprise(s) du journal")
+
+    # === Producteurs ===
+
+    def enqueue(self, table: str, row: Dict[str, Any], key: Optional[Any] = None) -> bool:
+        """
+        Journalise une ligne à insérer dans `table`
+
+        Returns:
+            True une fois l'écriture durable dans le journal ; False si la
+            file est arrêtée ou reste pleine (écrire directement en base)
+        """
+        if not self.running:
+            return False
+        columns = Base.metadata.tables[table].c
+        unknown = set(row) - set(columns.keys())
+        if unknown:
+            raise ValueError(f"Colonnes inconnues pour {table}: {', '.join(sorted(unknown))}")
+
+        with self._cond:
+            has_room = self._cond.wait_for(
+                lambda: len(self._pending) < self.max_pending or self._stopping,
+                timeout=self.enqueue_timeout
+            )
+        if not has_room or self._stopping:
+            WRITE_BEHIND_RECORDS.labels("bypassed").inc()
+            return False
+
+        with self._log_lock:
+            self._seq += 1
+            write = PendingWrite(self._seq, table, row, key)
+            line = json.dumps(
+                {"seq": write.seq, "table": table, "key": key, "row": {k: _encode(v) for k, v in row.items()}},
+                ensure_ascii=False, separators=(",", ":")
+            )
+            self._segment.write(line + "\n")
+            self._segment.flush()
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+            with self._cond:
+                self._append_pending(write)
+                if len(self._pending) >= self.batch_size:
+                    self._cond.notify_all()
+            if self._segment.tell() >= self.segment_bytes:
+                self._rotate_segment()
+        WRITE_BEHIND_RECORDS.labels("enqueued").inc()
+        return True
+
+    async def submit(self, table: str, row: Dict[str, Any], key: Optional[Any] = None) -> bool:
+        """`enqueue` depuis une route async (fsync et attente hors de la boucle)"""
+        if not self.running:
+            return False
+        return await run_in_threadpool(self.enqueue, table, row, key)
+
+    def wait_flushed(self, key: Any, timeout: float = WRITE_BEHIND_READ_TIMEOUT) -> bool:
+        """Attend l'insertion des écritures en attente pour `key`"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._pending_keys.get(key), timeout=timeout)
+
+    async def flushed(self, key: Any, timeout: float = WRITE_BEHIND_READ_TIMEOUT) -> bool:
+        """Lecture de ses propres écritures : à appeler avant de relire les lignes de `key`"""
+        if not self._pending_keys.get(key):
+            return True
+        return await run_in_threadpool(self.wait_flushed, key, timeout)
+
+    # === Insertion par lots ===
+
+    def _run(self):
+        delay = _RETRY_DELAY
+        while True:
+            with self._cond:
+                self._cond.wait_for(
+                    lambda: self._stopping or len(self._pending) >= self.batch_size,
+                    timeout=self.flush_interval
+                )
+                batch = list(itertools.islice(self._pending, self.batch_size))
+                stopping = self._stopping
+            if not batch:
+                if stopping:
+                    return
+                continue
+            try:
+                self.flush_batch(batch)
+                delay = _RETRY_DELAY
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {str(e).splitlines()[0][:200]}"
+                logger.error(f"❌ Insertion des écritures différées impossible: {self.last_error}")
+                if stopping:
+                    # Les écritures restent dans le journal, rejouées au prochain démarrage
+                    return
+                time.sleep(delay)
+                delay = min(delay * 2, _RETRY_MAX_DELAY)
+
+    def flush_batch(self, batch: List[PendingWrite]):
+        """Insère un lot (tête de la file) et avance le point de reprise dans la même transaction"""
+        start = time.perf_counter()
+        db = self.session_factory()
+        try:
+            try:
+                groups = defaultdict(list)
+                for write in batch:
+                    groups[(write.table, tuple(sorted(write.row)))].append(write.row)
+                for (table, _), rows in groups.items():
+                    db.execute(insert(Base.metadata.tables[table]).values(rows))
+                self._checkpoint(db, batch[-1].seq)
+                db.commit()
+            except IntegrityError:
+                # Une ligne refusée (ex: conversation supprimée entre-temps) : une par une
+                db.rollback()
+                self._flush_one_by_one(db, batch)
+                return
+        finally:
+            db.close()
+        WRITE_BEHIND_FLUSH.observe(time.perf_counter() - start)
+        WRITE_BEHIND_RECORDS.labels("flushed").inc(len(batch))
+        self._done(batch)
+
+    def _flush_one_by_one(self, db, batch: List[PendingWrite]):
+        for write in batch:
+            try:
+                db.execute(insert(Base.metadata.tables[write.table]).values(write.row))
+                self._checkpoint(db, write.seq)
+                db.commit()
+                WRITE_BEHIND_RECORDS.labels("flushed").inc()
+            except IntegrityError as e:
+                db.rollback()
+                logger.warning(f"Écriture différée {write.seq} abandonnée ({write.table}): {str(e).splitlines()[0]}")
+                self._checkpoint(db, write.seq)
+                db.commit()
+                WRITE_BEHIND_RECORDS.labels("dropped").inc()
+            self._done([write])
+
+    def _checkpoint(self, db, seq: int):
+        db.merge(WriteBehindCheckpoint(slot=self.slot, seq=seq))
+
+    def _append_pending(self, write: PendingWrite):
+        self._pending.append(write)
+        if write.key is not None:
+            self._pending_keys[write.key] += 1
+        WRITE_BEHIND_PENDING.set(len(self._pending))
+
+    def _done(self, writes: List[PendingWrite]):
+        """Retire de la file les écritures insérées et réveille les lecteurs et producteurs"""
+        # Même ordre de verrous que enqueue ; segments supprimés avant de
+        # réveiller les lecteurs (un insert attendu a quitté le journal)
+        with self._log_lock, self._cond:
+            for write in writes:
+                self._pending.popleft()
+                if write.key is not None:
+                    self._pending_keys[write.key] -= 1
+                    if self._pending_keys[write.key] <= 0:
+                        del self._pending_keys[write.key]
+            self._flushed_seq = writes[-1].seq
+            WRITE_BEHIND_PENDING.set(len(self._pending))
+            self._prune_segments()
+            self._cond.notify_all()
+
+    # === Segments du journal ===
+
+    def _open_segment(self):
+        self._segment_number += 1
+        self._segment_path = self.slot_dir / f"segment-{self._segment_number:06d}.log"
+        self._segment = open(self._segment_path, "a", encoding="utf-8")
+
+    def _rotate_segment(self):
+        self._segment.close()
+        self._closed_segments[self._segment_path] = self._seq
+        self._open_segment()
+
+    def _prune_segments(self):
+        """Supprime les segments fermés dont toutes les écritures sont insérées"""
+        for path, last_seq in list(self._closed_segments.items()):
+            if last_seq <= self._flushed_seq:
+                path.unlink(missing_ok=True)
+                del self._closed_segments[path]
+
+    # === Arrêt ===
+
+    def shutdown(self, timeout: float = 30):
+        """Insère les écritures en attente puis libère l'emplacement"""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join(timeout=timeout)
+        self._thread = None
+        with self._log_lock:
+            self._rotate_segment()
+            self._prune_segments()
+            self._segment.close()
+            self._segment = None
+            if self._segment_path.stat().st_size == 0:
+                self._segment_path.unlink()
+        if self._pending:
+            logger.warning(f"⚠️ {len(self._pending)} écriture(s) différée(s) restent dans le journal (reprises au redémarrage)")
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def status(self) -> Dict[str, Any]:
+        """État de la file (exposé par /health)"""
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "pending": len(self._pending),
+            "flushed_seq": self._flushed_seq,
+            "last_error": self.last_error,
+        }
+
+
+write_behind = WriteBehindQueue()
@@ -0,0 +1,378 @@
+"""
+Benchmark de charge HTTP pour SYFL AI
+
+Simule un trafic mixte réaliste (inscription/connexion, chat multi-tours,
+liste des conversations, statistiques, cas juridiques, export PDF) avec
+httpx en asynchrone, à concurrence fixe ou à débit cible, puis écrit un
+rapport JSON (p50/p95/p99, débit, taux d'erreur par opération) pour
+comparer les versions entre elles.
+
+Serveur à tester (LLM simulé, pas de rate limit) :
+    LLM_BACKEND=fake RATE_LIMIT_ENABLED=false uvicorn app.main:app --port 8000
+
+Usage:
+    python -m benchmarks.load --concurrency 20 --duration 60
+    python -m benchmarks.load --rps 50 --duration 60 --output bench.json
+    python -m benchmarks.load --compare bench_v1.json bench_v2.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import httpx
+
+# Poids de chaque opération dans le trafic généré
+DEFAULT_MIX = {
+    "chat_new": 15,
+    "chat_followup": 30,
+    "list_conversations": 20,
+    "get_conversation": 10,
+    "stats": 10,
+    "cases": 10,
+    "export_pdf": 5,
+}
+
+FIRST_MESSAGES = [
+    "Bonjour, j'ai été licencié sans préavis par mon employeur",
+    "Mon employeur ne me paie plus mon salaire depuis trois mois",
+    "Je fais des heures supplémentaires qui ne sont jamais payées",
+    "Mon patron refuse de me donner mon certificat de travail",
+    "Je travaille depuis deux ans sans contrat écrit",
+    "Ma période d'essai a été renouvelée trois fois",
+]
+FOLLOWUP_MESSAGES = [
+    "Quelles sont mes options et mes droits ?",
+    "Combien de temps ai-je pour agir ?",
+    "Dois-je contacter l'inspection du travail ?",
+    "Quels documents dois-je rassembler ?",
+]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Percentile par interpolation linéaire (valeurs déjà triées)"""
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * q
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+
+@dataclass
+class Recorder:
+    """Latences et erreurs par opération"""
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+    statuses: Dict[str, Dict[str, int]] = field(default_factory=dict)
+
+    def record(self, operation: str, duration: float, status: Optional[int], ok: bool):
+        self.latencies.setdefault(operation, []).append(duration)
+        key = str(status) if status is not None else "exception"
+        counts = self.statuses.setdefault(operation, {})
+        counts[key] = counts.get(key, 0) + 1
+        if not ok:
+            self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def summary(self, elapsed: float) -> Dict:
+        operations = {}
+        all_latencies = []
+        total_errors = 0
+        for operation, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            all_latencies.extend(values)
+            errors = self.errors.get(operation, 0)
+            total_errors += errors
+            operations[operation] = _stats(values, errors, elapsed)
+            operations[operation]["status_codes"] = self.statuses.get(operation, {})
+        overall = _stats(sorted(all_latencies), total_errors, elapsed)
+        return {"overall": overall, "operations": operations}
+
+
+def _stats(values: List[float], errors: int, elapsed: float) -> Dict:
+    count = len(values)
+    return {
+        "requests": count,
+        "errors": errors,
+        "error_rate": round(errors / count, 4) if count else 0.0,
+        "throughput_rps": round(count / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(values) / count * 1000, 2) if count else 0.0,
+            "p50": round(percentile(values, 0.50) * 1000, 2),
+            "p95": round(percentile(values, 0.95) * 1000, 2),
+            "p99": round(percentile(values, 0.99) * 1000, 2),
+            "max": round(values[-1] * 1000, 2) if count else 0.0,
+        },
+    }
+
+
+@dataclass
+class VirtualUser:
+    """Compte de test et ses conversations"""
+    email: str
+    password: str
+    token: Optional[str] = None
+    conversations: List[int] = field(default_factory=list)
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {"Authorization": f"Bearer {self.token}"}
+
+
+class LoadTest:
+    """Génère le trafic et collecte les mesures"""
+
+    def __init__(self, client: httpx.AsyncClient, mix: Dict[str, int], fast_mode: bool = False):
+        self.client = client
+        self.mix = mix
+        self.fast_mode = fast_mode
+        self.recorder = Recorder()
+        self.users: List[VirtualUser] = []
+
+    async def request(self, operation: str, method: str, url: str, expected=(200,), **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+            if operation == "export_pdf":
+                # Le corps fait partie de la latence perçue
+                await response.aread()
+        except httpx.HTTPError:
+            self.recorder.record(operation, time.perf_counter() - start, None, False)
+            return None
+        ok = response.status_code in expected
+        self.recorder.record(operation, time.perf_counter() - start, response.status_code, ok)
+        return response if ok else None
+
+    # === Préparation ===
+
+    async def create_user(self) -> Optional[VirtualUser]:
+        """Inscription puis connexion (les deux sont mesurées)"""
+        suffix = uuid.uuid4().hex[:12]
+        user = VirtualUser(email=f"bench_{suffix}@syflai.com", password="Bench123!")
+        response = await self.request("register", "POST", "/auth/register", expected=(201,), json={
+            "email": user.email,
+            "username": f"bench_{suffix}",
+            "password": user.password,
+            "full_name": "Utilisateur Benchmark",
+        })
+        if response is None:
+            return None
+        response = await self.request("login", "POST", "/auth/login", json={
+            "email": user.email,
+            "password": user.password,
+        })
+        if response is None:
+            return None
+        user.token = response.json()["access_token"]
+        return user
+
+    async def setup(self, users: int, concurrency: int):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def create():
+            async with semaphore:
+                return await self.create_user()
+
+        created = await asyncio.gather(*(create() for _ in range(users)))
+        self.users = [user for user in created if user is not None]
+        if not self.users:
+            raise RuntimeError("Aucun utilisateur créé (serveur joignable ? RATE_LIMIT_ENABLED=false ?)")
+
+    # === Opérations ===
+
+    async def chat_new(self, user: VirtualUser):
+        response = await self.request("chat_new", "POST", "/api/chat/send", headers=user.headers, json={
+            "message": random.choice(FIRST_MESSAGES),
+            "fast_mode": self.fast_mode,
+        })
+        if response is not None:
+            user.conversations.append(response.json()["conversation_id"])
+
+    async def chat_followup(self, user: VirtualUser):
+        if not user.conversations:
+            return await self.chat_new(user)
+        await self.request("chat_followup", "POST", "/api/chat/send", headers=user.headers, json={
+            "message": random.choice(FOLLOWUP_MESSAGES),
+            "conversation_id": random.choice(user.conversations),
+            "fast_mode": self.fast_mode,
+        })
+
+    async def list_conversations(self, user: VirtualUser):
+        await self.request("list_conversations", "GET", "/api/chat/conversations", headers=user.headers)
+
+    async def get_conversation(self, user: VirtualUser):
+        if not user.conversations:
+            return await self.list_conversations(user)
+        conversation_id = random.choice(user.conversations)
+        await self.request("get_conversation", "GET", f"/api/chat/conversations/{conversation_id}", headers=user.headers)
+
+    async def stats(self, user: VirtualUser):
+        await self.request("stats", "GET", "/api/stats", headers=user.headers)
+
+    async def cases(self, user: VirtualUser):
+        await self.request("cases", "GET", "/api/chat/cases", headers={"Accept-Encoding": "gzip"})
+
+    async def export_pdf(self, user: VirtualUser):
+        if not user.conversations:
+            return await self.chat_new(user)
+        conversation_id = random.choice(user.conversations)
+        await self.request(
+            "export_pdf", "GET", f"/api/export/conversation/{conversation_id}/pdf", headers=user.headers
+        )
+
+    async def run_one(self):
+        """Une opération tirée selon le mix, pour un utilisateur au hasard"""
+        operation = random.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        await getattr(self, operation)(random.choice(self.users))
+
+    # === Modes de charge ===
+
+    async def run_concurrency(self, concurrency: int, duration: float):
+        """Boucle fermée : `concurrency` clients enchaînent les requêtes"""
+        deadline = time.perf_counter() + duration
+
+        async def worker():
+            while time.perf_counter() < deadline:
+                await self.run_one()
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    async def run_rps(self, rps: float, duration: float, max_in_flight: int):
+        """Boucle ouverte : une requête lancée tous les 1/rps, quelle que soit la latence"""
+        semaphore = asyncio.Semaphore(max_in_flight)
+        tasks = set()
+        start = time.perf_counter()
+        sent = 0
+
+        async def launch():
+            try:
+                await self.run_one()
+            finally:
+                semaphore.release()
+
+        while True:
+            now = time.perf_counter()
+            if now - start >= duration:
+                break
+            target = int((now - start) * rps)
+            while sent < target:
+                if semaphore.locked():
+                    # Serveur saturé : l'envoi est abandonné et compté
+                    self.recorder.record("dropped", 0.0, None, False)
+                else:
+                    await semaphore.acquire()
+                    task = asyncio.create_task(launch())
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                sent += 1
+            await asyncio.sleep(min(1 / rps, 0.01))
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+async def run(args) -> Dict:
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix.update(json.loads(args.mix))
+
+    limits = httpx.Limits(max_connections=max(args.concurrency, args.max_in_flight))
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        test = LoadTest(client, mix, fast_mode=args.fast_mode)
+        await test.setup(args.users, args.concurrency)
+
+        start = time.perf_counter()
+        if args.rps:
+            await test.run_rps(args.rps, args.duration, args.max_in_flight)
+        else:
+            await test.run_concurrency(args.concurrency, args.duration)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "started_at": datetime.utcnow().isoformat(),
+        "revision": _git_revision(),
+        "config": {
+            "base_url": args.base_url,
+            "mode": "rps" if args.rps else "concurrency",
+            "rps": args.rps,
+            "concurrency": args.concurrency,
+            "duration_s": args.duration,
+            "users": args.users,
+            "fast_mode": args.fast_mode,
+            "mix": mix,
+        },
+        "elapsed_s": round(elapsed, 2),
+        **test.recorder.summary(elapsed),
+    }
+
+
+def compare(baseline_path: str, candidate_path: str) -> Dict:
+    """Écart relatif (%) des p50/p95/p99 et du débit entre deux rapports"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(candidate_path, encoding="utf-8") as f:
+        candidate = json.load(f)
+
+    def delta(old: float, new: float) -> Optional[float]:
+        return round((new - old) / old * 100, 1) if old else None
+
+    result = {}
+    for operation, new in candidate["operations"].items():
+        old = baseline["operations"].get(operation)
+        if old is None:
+            continue
+        result[operation] = {
+            **{
+                f"{q}_change_pct": delta(old["latency_ms"][q], new["latency_ms"][q])
+                for q in ("p50", "p95", "p99")
+            },
+            "throughput_change_pct": delta(old["throughput_rps"], new["throughput_rps"]),
+            "error_rate": {"baseline": old["error_rate"], "candidate": new["error_rate"]},
+        }
+    return {"baseline": baseline.get("revision"), "candidate": candidate.get("revision"), "operations": result}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de charge SYFL AI")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--duration", type=float, default=30, help="Durée de la phase de charge (s)")
+    parser.add_argument("--concurrency", type=int, default=10, help="Clients simultanés (boucle fermée)")
+    parser.add_argument("--rps", type=float, default=0, help="Débit cible (boucle ouverte), prioritaire sur --concurrency")
+    parser.add_argument("--max-in-flight", type=int, default=200, help="Requêtes simultanées max en mode --rps")
+    parser.add_argument("--users", type=int, default=20, help="Comptes créés avant la charge")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--mix", help='Poids JSON des opérations, ex: \'{"export_pdf": 0}\'')
+    parser.add_argument("--fast-mode", action="store_true", help="Envoie fast_mode=true au chat")
+    parser.add_argument("--output", help="Fichier JSON du rapport (sinon sortie standard)")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CANDIDATE"), help="Compare deux rapports")
+    args = parser.parse_args(argv)
+
+    report = compare(*args.compare) if args.compare else asyncio.run(run(args))
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
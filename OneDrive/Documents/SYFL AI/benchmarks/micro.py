@@ -0,0 +1,405 @@
+"""
+Micro-benchmarks des chemins critiques du backend
+
+Hors ligne : SQLite en mémoire (aiosqlite pour les routes async), LLM simulé sans latence. Chaque mesure est
+répétée et la médiane par appel est comparée à une référence enregistrée ;
+le script échoue si un benchmark est plus lent que la référence au-delà du
+seuil.
+
+Usage:
+    python -m benchmarks.micro                          # mesure et compare
+    python -m benchmarks.micro --save-baseline          # enregistre la référence
+    python -m benchmarks.micro --filter pdf --threshold 0.3
+"""
+import argparse
+import asyncio
+import json
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+DEFAULT_BASELINE = Path(__file__).with_name("baseline.json")
+DEFAULT_THRESHOLD = 0.20
+
+# (exécuter un appel, remettre en état sans être mesuré)
+Bench = Tuple[Callable[[], object], Optional[Callable[[], None]]]
+
+_benchmarks: Dict[str, Callable[[], Bench]] = {}
+# Ressources à libérer après la mesure en cours (moteurs async, boucles)
+_cleanups: List[Callable[[], None]] = []
+
+
+def benchmark(name: str):
+    """Enregistre une fabrique de benchmark (appelée juste avant la mesure)"""
+    def decorator(factory: Callable[[], Bench]):
+        _benchmarks[name] = factory
+        return factory
+    return decorator
+
+
+@dataclass
+class Result:
+    name: str
+    median: float
+    minimum: float
+    stdev: float
+    calls: int
+
+    def to_dict(self) -> Dict:
+        return {
+            "median_us": round(self.median * 1e6, 2),
+            "min_us": round(self.minimum * 1e6, 2),
+            "stdev_us": round(self.stdev * 1e6, 2),
+            "calls": self.calls,
+        }
+
+
+def measure(name: str, run: Callable, reset: Optional[Callable], min_time: float, repeat: int) -> Result:
+    """Médiane par appel sur `repeat` séries d'au moins `min_time` secondes"""
+    # Échauffement (caches, imports paresseux, JIT des requêtes SQL)
+    for _ in range(3):
+        run()
+        if reset:
+            reset()
+
+    per_call = []
+    calls = 0
+    for _ in range(repeat):
+        elapsed = 0.0
+        count = 0
+        while elapsed < min_time or count == 0:
+            start = time.perf_counter()
+            run()
+            elapsed += time.perf_counter() - start
+            count += 1
+            if reset:
+                reset()
+        per_call.append(elapsed / count)
+        calls += count
+    return Result(
+        name=name,
+        median=statistics.median(per_call),
+        minimum=min(per_call),
+        stdev=statistics.stdev(per_call) if len(per_call) > 1 else 0.0,
+        calls=calls,
+    )
+
+
+# === Environnement hors ligne ===
+
+def _session_factory():
+    from app.database import Base
+    from app import models  # noqa: F401 - déclare les tables
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def _async_session(loop: asyncio.AbstractEventLoop):
+    """AsyncSession (aiosqlite) sur une base en mémoire, libérée après la mesure"""
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from app.database import Base
+    from app import models  # noqa: F401 - déclare les tables
+
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+
+    async def setup():
+        async with engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+        return AsyncSession(engine, autoflush=False, expire_on_commit=False)
+
+    async def teardown():
+        await session.close()
+        await engine.dispose()
+
+    session = loop.run_until_complete(setup())
+    _cleanups.append(lambda: (loop.run_until_complete(teardown()), loop.close()))
+    return session
+
+
+def _stub_engine(cases: int = 10):
+    """AIEngine avec un LLM simulé instantané et `cases` cas synthétiques"""
+    from app.ai_engine import AIEngine
+    from app.fake_llm import FakeMistral
+
+    engine = AIEngine(api_key="", client=FakeMistral(latency_ms=0, jitter=0))
+    engine.load_knowledge_base({
+        f"cas_{i:03d}": {
+            "id": f"cas_{i:03d}",
+            "titre": f"Cas juridique numéro {i}",
+            "texte_simple": "Explication simple du droit applicable. " * 5,
+            "articles_reference": [f"Code du travail togolais – article {i}"],
+            "questions_clarification": ["Depuis quand ?", "Avez-vous un contrat ?"],
+            "actions": ["Saisir l'inspection du travail", "Consulter un syndicat"],
+        }
+        for i in range(cases)
+    })
+    return engine
+
+
+def _seed(db, messages: int, conversations: int = 1):
+    """Un utilisateur et ses conversations de `messages` messages"""
+    from app.auth import get_password_hash
+    from app.models import Conversation, Message, User
+
+    user = User(email="bench@syflai.com", username="bench", hashed_password=get_password_hash("Bench123!"))
+    db.add(user)
+    db.flush()
+    start = datetime(2024, 1, 1)
+    conversation_ids = []
+    for c in range(conversations):
+        conversation = Conversation(
+            user_id=user.id, title=f"Consultation {c}", case_type="salaire_impaye", created_at=start
+        )
+        db.add(conversation)
+        db.flush()
+        db.add_all([
+            Message(
+                conversation_id=conversation.id,
+                role="user" if i % 2 == 0 else "assistant",
+                content=f"Message {i} " + "contenu de la consultation " * 10,
+                case_id="salaire_impaye" if i % 2 else None,
+                source="llm" if i % 2 else None,
+                created_at=start + timedelta(seconds=i)
+            )
+            for i in range(messages)
+        ])
+        conversation_ids.append(conversation.id)
+    db.commit()
+    return user, conversation_ids
+
+
+def _history(turns: int) -> List[Dict]:
+    return [
+        {"role": "user" if i % 2 == 0 else "assistant", "content": "Historique de la conversation " * 8}
+        for i in range(turns)
+    ]
+
+
+# === Benchmarks ===
+
+def _register_prompt_benchmarks():
+    for cases in (10, 100):
+        for turns in (0, 10, 50):
+            def factory(cases=cases, turns=turns) -> Bench:
+                engine = _stub_engine(cases)
+                history = _history(turns)
+                return (lambda: engine.generate_reply(
+                    "Mon employeur ne me paie plus", case_id="cas_001", conversation_history=history
+                ), None)
+            benchmark(f"ai_engine.generate_reply[cases={cases},history={turns}]")(factory)
+
+        def detect_factory(cases=cases) -> Bench:
+            engine = _stub_engine(cases)
+            return (lambda: engine.detect_case("Mon employeur ne me paie plus"), None)
+        benchmark(f"ai_engine.detect_case[cases={cases}]")(detect_factory)
+
+
+def _register_send_message_benchmarks():
+    for size in (10, 100, 1000):
+        def factory(size=size) -> Bench:
+            from sqlalchemy import delete, func, select
+            from app.models import Message
+            from app.routes import chat
+            from app.schemas import ChatRequest
+
+            loop = asyncio.new_event_loop()
+            db = _async_session(loop)
+            user, (conversation_id,) = loop.run_until_complete(db.run_sync(_seed, size))
+            chat.set_ai_engine(_stub_engine())
+            request = ChatRequest(message="Quels sont mes droits ?", conversation_id=conversation_id)
+            last_id = loop.run_until_complete(db.scalar(select(func.max(Message.id))))
+
+            async def reset():
+                # Retire les messages ajoutés : la conversation garde `size` messages
+                await db.execute(delete(Message).where(Message.id > last_id))
+                await db.commit()
+
+            return (
+                lambda: loop.run_until_complete(chat.send_message(request, current_user=user, db=db)),
+                lambda: loop.run_until_complete(reset())
+            )
+        benchmark(f"chat.send_message[messages={size}]")(factory)
+
+
+def _register_serialization_benchmarks():
+    for size in (10, 100, 1000):
+        def factory(size=size) -> Bench:
+            from app.models import Conversation
+            from app.schemas import ConversationDetailResponse
+
+            db = _session_factory()()
+            _, (conversation_id,) = _seed(db, size)
+            conversation = db.get(Conversation, conversation_id)
+            conversation.messages  # chargés une fois : seule la sérialisation est mesurée
+            return (lambda: ConversationDetailResponse.model_validate(conversation).model_dump_json(), None)
+        benchmark(f"schemas.conversation_detail[messages={size}]")(factory)
+
+
+def _register_stats_benchmarks():
+    for conversations in (10, 100, 500):
+        def factory(conversations=conversations) -> Bench:
+            from app.routes.stats import get_user_statistics
+
+            loop = asyncio.new_event_loop()
+            db = _async_session(loop)
+            user, _ = loop.run_until_complete(db.run_sync(_seed, 10, conversations=conversations))
+            return (lambda: loop.run_until_complete(get_user_statistics(current_user=user, db=db)), None)
+        benchmark(f"stats.get_user_statistics[conversations={conversations}]")(factory)
+
+
+def _register_pdf_benchmarks():
+    for size in (10, 100):
+        def factory(size=size) -> Bench:
+            from app.pdf_export import render_conversation_pdf
+
+            meta = {
+                "id": 1, "title": "Consultation", "case_type": "salaire_impaye",
+                "created_at": datetime(2024, 1, 1), "username": "bench",
+            }
+            messages = [
+                ("user" if i % 2 == 0 else "assistant", "Contenu du message " * 20, datetime(2024, 1, 1))
+                for i in range(size)
+            ]
+            return (lambda: render_conversation_pdf(meta, messages), None)
+        benchmark(f"pdf.render_conversation_pdf[messages={size}]")(factory)
+
+
+def _register_auth_benchmarks():
+    @benchmark("auth.jwt_encode")
+    def jwt_encode() -> Bench:
+        from app.auth import create_access_token
+        return (lambda: create_access_token({"sub": "bench@syflai.com"}), None)
+
+    @benchmark("auth.jwt_decode")
+    def jwt_decode() -> Bench:
+        from jose import jwt
+        from app.auth import ALGORITHM, SECRET_KEY, create_access_token
+        token = create_access_token({"sub": "bench@syflai.com"})
+        return (lambda: jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]), None)
+
+    @benchmark("auth.pbkdf2_verify")
+    def pbkdf2_verify() -> Bench:
+        from app.auth import get_password_hash, verify_password
+        hashed = get_password_hash("Bench123!")
+        return (lambda: verify_password("Bench123!", hashed), None)
+
+
+_register_prompt_benchmarks()
+_register_send_message_benchmarks()
+_register_serialization_benchmarks()
+_register_stats_benchmarks()
+_register_pdf_benchmarks()
+_register_auth_benchmarks()
+
+
+# === Exécution et comparaison ===
+
+def run_benchmarks(pattern: str = "", min_time: float = 0.2, repeat: int = 5) -> Dict[str, Result]:
+    results = {}
+    for name, factory in _benchmarks.items():
+        if pattern and pattern not in name:
+            continue
+        run, reset = factory()
+        try:
+            results[name] = measure(name, run, reset, min_time, repeat)
+        finally:
+            while _cleanups:
+                _cleanups.pop()()
+        print(f"{name:60s} {results[name].median * 1e6:12.1f} µs", file=sys.stderr)
+    return results
+
+
+def compare(results: Dict[str, Result], baseline: Dict, threshold: float) -> List[Dict]:
+    """Benchmarks plus lents que la référence de plus de `threshold` (ratio)"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get("results", {}).get(name)
+        if reference is None:
+            continue
+        ratio = result.median * 1e6 / reference["median_us"] - 1
+        if ratio > threshold:
+            regressions.append({
+                "name": name,
+                "baseline_us": reference["median_us"],
+                "current_us": round(result.median * 1e6, 2),
+                "change_pct": round(ratio * 100, 1),
+            })
+    return regressions
+
+
+def _machine() -> Dict:
+    return {"python": platform.python_version(), "platform": platform.platform(), "processor": platform.processor()}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Micro-benchmarks SYFL AI")
+    parser.add_argument("--filter", default="", help="Sous-chaîne du nom des benchmarks à exécuter")
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Fichier de référence")
+    parser.add_argument("--save-baseline", action="store_true", help="Enregistre les résultats comme référence")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Régression tolérée (0.2 = +20%%)")
+    parser.add_argument("--min-time", type=float, default=0.2, help="Durée minimale d'une série (s)")
+    parser.add_argument("--repeat", type=int, default=5, help="Nombre de séries par benchmark")
+    parser.add_argument("--output", help="Fichier JSON du rapport (sinon sortie standard)")
+    parser.add_argument("--list", action="store_true", help="Liste les benchmarks")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        print("\n".join(_benchmarks))
+        return 0
+
+    # Les journaux du moteur IA fausseraient les mesures
+    from loguru import logger
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+
+    results = run_benchmarks(args.filter, args.min_time, args.repeat)
+    report = {
+        "created_at": datetime.utcnow().isoformat(),
+        "machine": _machine(),
+        "results": {name: result.to_dict() for name, result in results.items()},
+    }
+
+    baseline_path = Path(args.baseline)
+    exit_code = 0
+    if args.save_baseline:
+        if baseline_path.exists():
+            # Mise à jour partielle possible avec --filter
+            previous = json.loads(baseline_path.read_text(encoding="utf-8"))
+            report["results"] = {**previous.get("results", {}), **report["results"]}
+        baseline_path.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+        print(f"Référence enregistrée: {baseline_path}", file=sys.stderr)
+    elif baseline_path.exists():
+        baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+        if baseline.get("machine") != report["machine"]:
+            print("⚠️ Référence mesurée sur une autre machine, comparaison indicative", file=sys.stderr)
+        report["regressions"] = compare(results, baseline, args.threshold)
+        for regression in report["regressions"]:
+            print(
+                f"❌ {regression['name']}: {regression['baseline_us']} -> {regression['current_us']} µs "
+                f"(+{regression['change_pct']}%)",
+                file=sys.stderr
+            )
+        if report["regressions"]:
+            exit_code = 1
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,130 @@
+"""
+Benchmark du démarrage à froid
+
+Chaque mesure utilise un nouvel interpréteur (aucun module en cache) :
+- import : durée de `import app.main`
+- ready : lancement d'uvicorn jusqu'à la première réponse 200 de /health
+
+Usage:
+    python -m benchmarks.startup --runs 5
+    python -m benchmarks.startup --imports 15     # modules les plus longs à importer
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); import app.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def _env(database_dir: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.setdefault("MISTRAL_API_KEY", "benchmark")
+    env.setdefault("LLM_BACKEND", "fake")
+    env["DATABASE_URL"] = f"sqlite:///{Path(database_dir) / 'startup.db'}"
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(env: Dict[str, str]) -> float:
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_ready(env: Dict[str, str], timeout: float = 60) -> float:
+    port = _free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn s'est arrêté (code {process.returncode})")
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                    return time.perf_counter() - start
+            except httpx.TransportError:
+                pass
+            time.sleep(0.01)
+        raise TimeoutError("/health n'a pas répondu à temps")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def slowest_imports(env: Dict[str, str], count: int) -> List[Dict]:
+    """Modules de premier niveau les plus coûteux (python -X importtime)"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True
+    ).stderr
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        top = name.strip().split(".")[0]
+        modules[top] = max(modules.get(top, 0), int(cumulative))
+    ranked = sorted(modules.items(), key=lambda item: item[1], reverse=True)[:count]
+    return [{"module": name, "cumulative_ms": round(us / 1000, 1)} for name, us in ranked]
+
+
+def summarize(values: List[float]) -> Dict:
+    return {
+        "median_ms": round(statistics.median(values) * 1000, 1),
+        "min_ms": round(min(values) * 1000, 1),
+        "max_ms": round(max(values) * 1000, 1),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark du démarrage à froid de SYFL AI")
+    parser.add_argument("--runs", type=int, default=5, help="Nombre de démarrages mesurés")
+    parser.add_argument("--imports", type=int, default=0, help="Affiche les N modules les plus longs à importer")
+    parser.add_argument("--output", help="Fichier JSON du rapport (sinon sortie standard)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as database_dir:
+        env = _env(database_dir)
+        imports = [measure_import(env) for _ in range(args.runs)]
+        ready = [measure_ready(env) for _ in range(args.runs)]
+        report = {"runs": args.runs, "import": summarize(imports), "ready": summarize(ready)}
+        if args.imports:
+            report["slowest_imports"] = slowest_imports(env, args.imports)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + "\n", encoding="utf-8")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
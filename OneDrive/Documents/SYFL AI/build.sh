@@ -6,3 +6,6 @@ pip install -r requirements.txt
 
 # Exécuter les migrations Alembic
 alembic upgrade head
+
+# Compiler la base de connaissances (JSON + classeur Excel) en instantané
+python -m app.kb_build --output knowledge_base.snapshot
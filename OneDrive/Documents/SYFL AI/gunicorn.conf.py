@@ -0,0 +1,78 @@
+"""
+Configuration gunicorn : production multi-workers (workers uvicorn)
+
+    gunicorn app.main:app -c gunicorn.conf.py
+
+L'application est chargée une fois dans le maître (preload_app) ; avant le
+fork, `app.main.preload` crée les tables et construit l'instantané de la
+base de connaissances et ses index, partagés en copie sur écriture. Chaque
+worker ouvre ensuite son propre pool de connexions, son client LLM et ses
+threads (lifespan).
+
+Variables d'environnement:
+    PORT                    Port d'écoute (8000)
+    WEB_CONCURRENCY         Nombre de workers (déduit des cœurs sinon)
+    LLM_CONCURRENCY_BUDGET  Appels LLM simultanés pour tout le service (8),
+                            répartis entre les workers (LLM_MAX_CONCURRENCY)
+    DB_CONNECTION_BUDGET    Connexions à la base pour tout le service (20),
+                            réparties entre les workers (DB_POOL_SIZE)
+    GUNICORN_TIMEOUT        Délai avant redémarrage d'un worker bloqué (s)
+"""
+import os
+
+from app.config import available_cpus, plan_workers
+
+_cpus = available_cpus()
+_plan = plan_workers(
+    cpu_count=_cpus,
+    llm_budget=int(os.getenv("LLM_CONCURRENCY_BUDGET", "8")),
+    workers=int(os.getenv("WEB_CONCURRENCY") or 0),
+    db_budget=int(os.getenv("DB_CONNECTION_BUDGET", "20")),
+)
+
+# Lu par app.ai_engine, app.pdf_export et app.database à l'import, avant le
+# chargement de l'application ; une valeur explicite dans l'environnement reste
+# prioritaire. Pas de débordement : le total reste sous DB_CONNECTION_BUDGET,
+# les connexions d'un worker étant partagées entre ses moteurs sync et async.
+os.environ.setdefault("LLM_MAX_CONCURRENCY", str(_plan.llm_concurrency))
+os.environ.setdefault("PDF_EXPORT_WORKERS", str(_plan.pdf_workers))
+os.environ.setdefault("DB_POOL_SIZE", str(max(1, _plan.db_pool_size // 2)))
+os.environ.setdefault("DB_MAX_OVERFLOW", "0")
+
+bind = f"0.0.0.0:{os.getenv('PORT', '8000')}"
+workers = _plan.workers
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = True
+
+# Un appel LLM peut durer plusieurs secondes
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = 30
+keepalive = 5
+# Recyclage périodique des workers (fuites mémoire), forkés depuis le maître préchargé
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "2000"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+
+
+def when_ready(server):
+    """Maître prêt, workers pas encore forkés : préchargement partagé"""
+    from app.main import preload
+
+    preload(server.app.wsgi())
+    server.log.info(
+        "Workers: %s (cœurs: %s, LLM par worker: %s, rendu PDF par worker: %s, connexions par moteur: %s)",
+        workers, _cpus, os.environ["LLM_MAX_CONCURRENCY"], os.environ["PDF_EXPORT_WORKERS"],
+        os.environ["DB_POOL_SIZE"]
+    )
+
+
+def post_fork(server, worker):
+    """Pools SQLAlchemy propres au worker (jamais de connexion héritée du maître)"""
+    from app.database import async_engine, engine
+    from app.read_replicas import read_router
+
+    engine.dispose(close=False)
+    async_engine.sync_engine.dispose(close=False)
+    for replica in read_router.replicas:
+        replica.engine.sync_engine.dispose(close=False)
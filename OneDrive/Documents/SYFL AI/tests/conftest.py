@@ -1,25 +1,66 @@
 """
 Configuration pour les tests pytest
 """
+import asyncio
+import os
+import tempfile
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
+from sqlalchemy.pool import NullPool
 
-from app.main import app
-from app.database import Base, get_db
+from app.config import Settings
+from app.main import create_app
+from app.database import (
+    Base,
+    EngineProfile,
+    async_database_url,
+    create_configured_async_engine,
+    create_configured_engine,
+    engine_profile,
+    get_async_db,
+    get_async_sessionmaker,
+    get_db,
+    get_sessionmaker,
+)
 
-# Base de données de test en mémoire
-SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
+# Base de données de test dans un fichier temporaire, partagée par les
+# sessions synchrones et asynchrones (une base en mémoire ne l'est pas)
+_database_dir = tempfile.TemporaryDirectory()
+SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(_database_dir.name, 'test.db')}"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,
-)
+engine = create_configured_engine(SQLALCHEMY_DATABASE_URL)
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Sans pool : chaque TestClient a sa propre boucle d'événements, une connexion
+# aiosqlite ne peut pas passer de l'une à l'autre
+_async_url = async_database_url(SQLALCHEMY_DATABASE_URL)
+async_engine = create_configured_async_engine(_async_url, EngineProfile(
+    name="sqlite", options={"poolclass": NullPool}, pragmas=engine_profile(_async_url).pragmas
+))
+TestingAsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+
+def create_test_app(**settings):
+    """
+    Application sur la base de test, sans workers d'arrière-plan
+
+    Le démarrage crée les tables sur la base de test et n'ouvre rien sur la
+    base de l'application (ni jobs, ni écritures différées).
+    """
+    options = dict(
+        mistral_api_key=os.getenv("MISTRAL_API_KEY", "test"),
+        watch_knowledge_base=False,
+        background_workers=False,
+    )
+    options.update(settings)
+    return create_app(Settings(**options), engine=engine, async_engine=async_engine)
+
+
+app = create_test_app()
+
 
 @pytest.fixture(scope="function")
 def db():
@@ -33,6 +74,11 @@ def db():
         Base.metadata.drop_all(bind=engine)
 
 
+async def override_get_async_db():
+    async with TestingAsyncSessionLocal() as session:
+        yield session
+
+
 @pytest.fixture(scope="function")
 def client(db):
     """Client de test FastAPI"""
@@ -43,6 +89,9 @@ def client(db):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[get_async_db] = override_get_async_db
+    app.dependency_overrides[get_async_sessionmaker] = lambda: TestingAsyncSessionLocal
+    app.dependency_overrides[get_sessionmaker] = lambda: TestingSessionLocal
     # Désactiver le rate limiting pour les tests
     app.state.limiter.enabled = False
     
@@ -53,6 +102,11 @@ def client(db):
     app.dependency_overrides.clear()
 
 
+def pytest_sessionfinish(session, exitstatus):
+    engine.dispose()
+    asyncio.run(async_engine.dispose())
+
+
 @pytest.fixture
 def test_user_data():
     """Données utilisateur pour les tests"""
@@ -0,0 +1,88 @@
+"""
+Tests pour la fabrique d'application et le démarrage paresseux
+"""
+import gc
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.config import Settings, WorkerPlan, plan_workers
+from app.database import get_db
+from app.fallback import FallbackEngine
+from app.main import preload
+from tests.conftest import create_test_app
+
+
+def test_import_has_no_heavy_side_effects():
+    """Importer app.main ne charge ni Mistral ni ReportLab et n'exige aucune clé"""
+    env = {key: value for key, value in os.environ.items() if key != "MISTRAL_API_KEY"}
+    code = (
+        "import sys, app.main; "
+        "print('mistralai' in sys.modules, 'reportlab' in sys.modules)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=Path(__file__).resolve().parent.parent,
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    assert output.split() == ["False", "False"]
+
+
+def test_missing_api_key_fails_at_startup():
+    with pytest.raises(ValueError, match="MISTRAL_API_KEY"):
+        Settings(llm_backend="mistral", mistral_api_key=None).validate()
+
+
+def test_create_app_with_settings(db):
+    app = create_test_app(llm_backend="fake", metrics_token="s3cret")
+    app.dependency_overrides[get_db] = lambda: db
+    assert app.state.ai_engine is None
+
+    with TestClient(app) as client:
+        health = client.get("/health").json()
+        assert health["status"] == "healthy"
+        assert health["cases_count"] > 0
+        assert health["llm_circuit"] == "closed"
+        assert app.state.ai_engine.snapshot is app.state.knowledge_base_manager.snapshot
+        assert client.get("/metrics").status_code == 401
+
+    # Un second démarrage réutilise l'instantané déjà chargé
+    with TestClient(app) as client:
+        assert client.get("/health").json()["cases_count"] == health["cases_count"]
+        assert len(app.state.ai_engine.snapshot) == health["cases_count"]
+
+
+def test_plan_workers():
+    # Un worker par cœur, budget LLM réparti entre eux
+    assert plan_workers(cpu_count=4, llm_budget=8) == WorkerPlan(
+        workers=4, llm_concurrency=2, pdf_workers=1, db_pool_size=5
+    )
+    # Pas plus de workers que d'appels LLM autorisés
+    assert plan_workers(cpu_count=16, llm_budget=4).workers == 4
+    # WEB_CONCURRENCY impose le nombre de workers ; au moins un créneau chacun
+    assert plan_workers(cpu_count=2, llm_budget=4, workers=8, db_budget=40) == WorkerPlan(
+        workers=8, llm_concurrency=1, pdf_workers=1, db_pool_size=5
+    )
+    assert plan_workers(cpu_count=1, llm_budget=8) == WorkerPlan(
+        workers=1, llm_concurrency=8, pdf_workers=1, db_pool_size=20
+    )
+
+
+def test_preload_shares_snapshot_with_workers(db):
+    """Le lifespan d'un worker réutilise l'instantané et l'index préchargés"""
+    app = create_test_app(llm_backend="fake")
+    app.dependency_overrides[get_db] = lambda: db
+    try:
+        preload(app)
+    finally:
+        gc.unfreeze()
+    snapshot = app.state.knowledge_base_manager.snapshot
+    assert len(snapshot) > 0
+
+    with TestClient(app):
+        engine = app.state.ai_engine
+        assert engine.snapshot is snapshot
+        assert engine.fallback is FallbackEngine.for_snapshot(snapshot)
@@ -0,0 +1,166 @@
+"""
+Tests pour l'archivage des conversations inactives
+"""
+import io
+import json
+import zipfile
+import zlib
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.archive import ARCHIVE_JOB, archive_inactive_conversations, pack_messages, unpack_messages
+from app.auth import create_access_token, get_password_hash
+from app.export_cache import export_cache
+from app.jobs import JobRunner, job_runner
+from app.models import Conversation, ConversationArchive, Job, Message, User
+from app.pdf_export import render_pool
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def user(db):
+    user = User(email="archive@syflai.com", username="archive", hashed_password=get_password_hash("Test123456"))
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.fixture
+def headers(user):
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+
+
+def _conversation(db, user, age_days: int, messages: int = 4) -> int:
+    start = datetime.utcnow() - timedelta(days=age_days)
+    conversation = Conversation(user_id=user.id, title="Salaire impayé", case_type="salaire_impaye", created_at=start)
+    db.add(conversation)
+    db.commit()
+    db.add_all([
+        Message(
+            conversation_id=conversation.id,
+            role="user" if i % 2 == 0 else "assistant",
+            content=f"Message {i} : mon employeur ne m'a pas payé " * 5,
+            extra_data={"note": i} if i % 2 else None,
+            source="knowledge_base" if i % 2 else None,
+            created_at=start + timedelta(minutes=i)
+        )
+        for i in range(messages)
+    ])
+    db.commit()
+    return conversation.id
+
+
+@pytest.fixture
+def archived(db, user):
+    """Une conversation archivée (vieille de 400 jours) et une conversation récente"""
+    old_id = _conversation(db, user, age_days=400)
+    recent_id = _conversation(db, user, age_days=1)
+    result = archive_inactive_conversations(db, days=180)
+    assert result["conversations"] == 1
+    return old_id, recent_id
+
+
+@pytest.fixture(autouse=True)
+def thread_render_pool(monkeypatch, tmp_path):
+    monkeypatch.setattr(render_pool, "workers", 0)
+    monkeypatch.setattr(export_cache, "directory", tmp_path / "exports")
+    monkeypatch.setattr("app.bulk_export.EXPORT_JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(job_runner, "workers", 0)
+    yield
+    render_pool.shutdown()
+
+
+def test_pack_roundtrip():
+    created = datetime(2024, 1, 1, 12, 30)
+    messages = [
+        (1, "user", "Bonjour é" * 50, None, created, {}),
+        (2, "assistant", "Réponse", {"note": 1}, created, {"source": "llm", "model": "mistral-small-latest"}),
+    ]
+    payload, raw_size = pack_messages(messages, "zlib")
+    assert len(payload) < raw_size
+    archive = ConversationArchive(codec="zlib", payload=payload)
+    assert unpack_messages(archive) == messages
+
+
+def test_unpack_archive_without_metadata():
+    """Archives écrites avant les colonnes de métadonnées (5 champs par message)"""
+    raw = json.dumps([[1, "assistant", "Réponse", {"source": "llm"}, "2024-01-01T12:30:00"]]).encode("utf-8")
+    archive = ConversationArchive(codec="zlib", payload=zlib.compress(raw))
+    assert unpack_messages(archive) == [(1, "assistant", "Réponse", {"source": "llm"}, datetime(2024, 1, 1, 12, 30), {})]
+
+
+def test_archive_moves_inactive_conversations(db, archived):
+    old_id, recent_id = archived
+    assert db.query(Message).filter(Message.conversation_id == old_id).count() == 0
+    assert db.query(Message).filter(Message.conversation_id == recent_id).count() == 4
+
+    archive = db.get(ConversationArchive, old_id)
+    assert archive.message_count == 4
+    assert archive.role_counts == {"user": 2, "assistant": 2}
+    assert len(archive.payload) < archive.raw_size
+    # Déjà archivée : plus rien à faire
+    assert archive_inactive_conversations(db, days=180)["conversations"] == 0
+
+
+def test_archived_conversation_detail(client, headers, archived):
+    old_id, _ = archived
+    response = client.get(f"/api/chat/conversations/{old_id}", headers=headers)
+    assert response.status_code == 200
+    detail = response.json()
+    assert detail["title"] == "Salaire impayé"
+    assert [m["role"] for m in detail["messages"]] == ["user", "assistant", "user", "assistant"]
+    assert detail["messages"][0]["content"].startswith("Message 0")
+
+
+def test_archived_conversation_exports_and_stats(client, headers, archived):
+    old_id, _ = archived
+    pdf = client.get(f"/api/export/conversation/{old_id}/pdf", headers=headers)
+    assert pdf.status_code == 200
+    assert pdf.content.startswith(b"%PDF")
+
+    jsonl = client.get(f"/api/export/conversation/{old_id}/jsonl", headers=headers)
+    lines = [json.loads(line) for line in jsonl.text.splitlines()]
+    assert len(lines) == 5
+
+    stats = client.get("/api/stats", headers=headers).json()
+    assert stats["messages"] == {"total": 8, "user_messages": 4, "assistant_messages": 4}
+
+
+def test_new_message_restores_archived_conversation(client, headers, db, archived):
+    old_id, _ = archived
+    response = client.post(
+        "/api/chat/send",
+        json={"message": "Et maintenant ?", "conversation_id": old_id, "fast_mode": True},
+        headers=headers
+    )
+    assert response.status_code == 200
+
+    db.expire_all()
+    assert db.get(ConversationArchive, old_id) is None
+    messages = db.query(Message).filter(Message.conversation_id == old_id).order_by(Message.id).all()
+    assert len(messages) == 6
+    assert messages[1].extra_data == {"note": 1}
+    assert messages[1].source == "knowledge_base"
+
+
+def test_bulk_export_includes_archived_conversations(client, headers, archived, monkeypatch):
+    monkeypatch.setattr(job_runner, "session_factory", TestingSessionLocal)
+    job = client.post("/api/export/all", headers=headers).json()
+    assert job_runner.run_next()
+
+    download = client.get(f"/api/export/jobs/{job['id']}/download", headers=headers)
+    assert len(zipfile.ZipFile(io.BytesIO(download.content)).namelist()) == 2
+
+
+def test_archive_job(db, user):
+    _conversation(db, user, age_days=40)
+    runner = JobRunner(workers=0, session_factory=TestingSessionLocal)
+    job = runner.enqueue(db, ARCHIVE_JOB, payload={"days": 30})
+    assert runner.run_next()
+
+    db.expire_all()
+    job = db.get(Job, job.id)
+    assert job.status == "completed"
+    assert job.result["conversations"] == 1
+    assert job.progress_current == job.progress_total == 1
@@ -0,0 +1,58 @@
+"""
+Tests pour les benchmarks (exécutés en mémoire, sans serveur)
+"""
+import asyncio
+
+import httpx
+
+from benchmarks.load import LoadTest, percentile
+from benchmarks.micro import Result, compare, run_benchmarks
+from tests.conftest import app
+
+
+def test_percentile_interpolation():
+    values = [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert percentile(values, 0.5) == 0.3
+    assert abs(percentile(values, 0.95) - 0.48) < 1e-9
+    assert percentile([], 0.99) == 0.0
+
+
+def test_load_test_smoke(client):
+    """Un court trafic mixte produit un rapport sans erreur
+
+    Un seul client virtuel : la session de test est partagée entre les requêtes.
+    """
+    mix = {"chat_new": 1, "chat_followup": 2, "list_conversations": 1, "stats": 1, "cases": 1}
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+            test = LoadTest(http, mix, fast_mode=True)
+            await test.setup(users=2, concurrency=1)
+            await test.run_concurrency(concurrency=1, duration=0.5)
+            return test.recorder.summary(0.5)
+
+    report = asyncio.run(scenario())
+    assert report["overall"]["requests"] > 0
+    assert report["overall"]["errors"] == 0
+    assert {"register", "login", "chat_new"} <= set(report["operations"])
+    assert report["operations"]["chat_new"]["latency_ms"]["p99"] > 0
+
+
+def test_micro_benchmarks_quick_run():
+    """Les micro-benchmarks tournent hors ligne et produisent des mesures"""
+    results = run_benchmarks("conversation_detail[messages=10]", min_time=0.001, repeat=2)
+    assert list(results) == ["schemas.conversation_detail[messages=10]"]
+    assert results["schemas.conversation_detail[messages=10]"].median > 0
+
+
+def test_micro_benchmarks_regression_threshold():
+    results = {
+        "fast": Result("fast", median=110e-6, minimum=100e-6, stdev=0, calls=10),
+        "slow": Result("slow", median=150e-6, minimum=140e-6, stdev=0, calls=10),
+        "new": Result("new", median=1.0, minimum=1.0, stdev=0, calls=1),
+    }
+    baseline = {"results": {"fast": {"median_us": 100.0}, "slow": {"median_us": 100.0}}}
+    regressions = compare(results, baseline, threshold=0.2)
+    assert [r["name"] for r in regressions] == ["slow"]
+    assert regressions[0]["change_pct"] == 50.0
@@ -2,6 +2,11 @@
 Tests pour les routes de chat
 """
 import pytest
+from sqlalchemy import event
+
+from app.auth import create_access_token, get_password_hash
+from app.models import Conversation, Message, User
+from tests.conftest import async_engine
 
 
 def test_send_message_success(client, auth_headers):
@@ -142,6 +147,21 @@ def test_get_stats(client, auth_headers):
     assert data["conversations"]["total"] > 0
 
 
+def test_stats_merge_legacy_case_ids(client, db):
+    """Ancien nom de fichier et identifiant canonique comptent pour un seul cas"""
+    user, headers = _user_with_conversations(db, "legacycases", conversations=0)
+    db.add_all([
+        Conversation(user_id=user.id, case_type="heuresSup_nonPayees"),
+        Conversation(user_id=user.id, case_type="heures_supplementaires_non_payees"),
+        Conversation(user_id=user.id, case_type="salaire_impaye"),
+    ])
+    db.commit()
+
+    cases = client.get("/api/stats", headers=headers).json()["cases"]
+    assert cases["distribution"] == {"heures_supplementaires_non_payees": 2, "salaire_impaye": 1}
+    assert cases["total_cases_consulted"] == 2
+
+
 def test_get_cases(client):
     """Test de récupération de la liste des cas juridiques"""
     response = client.get("/api/chat/cases")
@@ -157,3 +177,115 @@ def test_get_cases(client):
     assert "id" in first_case
     assert "titre" in first_case
     assert "description" in first_case
+    assert first_case["description"]
+    assert first_case["articles_reference"]
+    assert "actions" in first_case
+    assert "questions_clarification" in first_case
+
+
+def test_get_cases_etag(client):
+    """La liste des cas est servie compressée avec un ETag revalidable"""
+    response = client.get("/api/chat/cases", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    etag = response.headers["etag"]
+
+    response = client.get("/api/chat/cases", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["etag"] == etag
+
+    # Corps non compressé : autre représentation, autre ETag
+    response = client.get("/api/chat/cases", headers={"Accept-Encoding": "identity", "If-None-Match": etag})
+    assert response.status_code == 200
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] != etag
+
+
+def test_get_cases_gzip_refused_with_zero_quality(client):
+    for accept_encoding in ("gzip;q=0, identity", "br, *;q=0.5, gzip; q=0"):
+        response = client.get("/api/chat/cases", headers={"Accept-Encoding": accept_encoding})
+        assert "content-encoding" not in response.headers
+    response = client.get("/api/chat/cases", headers={"Accept-Encoding": "br, *;q=0.5"})
+    assert response.headers["content-encoding"] == "gzip"
+
+
+def _user_with_conversations(db, name: str, conversations: int, messages: int = 3):
+    user = User(email=f"{name}@syflai.com", username=name, hashed_password=get_password_hash("Test123456"))
+    db.add(user)
+    db.commit()
+    for _ in range(conversations):
+        conversation = Conversation(user_id=user.id)
+        db.add(conversation)
+        db.commit()
+        db.add_all([
+            Message(conversation_id=conversation.id, role="user", content=f"Message {i}")
+            for i in range(messages)
+        ])
+    db.commit()
+    return user, {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+
+
+@pytest.fixture
+def sql_statements():
+    """Requêtes SQL émises par les sessions async pendant le test"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield statements
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+
+def test_delete_conversation_cascades_in_database(client, db, sql_statements):
+    """Les messages sont supprimés par la base, sans être chargés"""
+    user, headers = _user_with_conversations(db, "cascade", conversations=2)
+    conversation_id = db.query(Conversation.id).filter(Conversation.user_id == user.id).first()[0]
+
+    response = client.delete(f"/api/chat/conversations/{conversation_id}", headers=headers)
+    assert response.status_code == 204
+    assert db.query(Message).filter(Message.conversation_id == conversation_id).count() == 0
+    assert db.query(Message).count() == 3
+    assert not [s for s in sql_statements if "FROM messages" in s or "DELETE FROM messages" in s]
+
+    response = client.delete(f"/api/chat/conversations/{conversation_id}", headers=headers)
+    assert response.status_code == 404
+
+
+def test_delete_all_conversations(client, db, sql_statements):
+    """Toutes les conversations de l'utilisateur en une requête, celles des autres intactes"""
+    _, headers = _user_with_conversations(db, "bulkdelete", conversations=3)
+    other, _ = _user_with_conversations(db, "otheruser", conversations=1)
+
+    response = client.delete("/api/chat/conversations", headers=headers)
+    assert response.status_code == 200
+    assert response.json() == {"deleted": 3}
+    deletes = [s for s in sql_statements if s.startswith("DELETE")]
+    assert len(deletes) == 1 and deletes[0].startswith("DELETE FROM conversations")
+
+    assert db.query(Conversation).count() == 1
+    assert db.query(Message).count() == 3
+    assert client.get("/api/chat/conversations", headers=headers).json() == []
+    assert client.delete("/api/chat/conversations", headers=headers).json() == {"deleted": 0}
+
+
+def test_reply_metadata_columns(client, db):
+    """Cas détecté, confiance et origine de la réponse sont stockés dans leurs colonnes"""
+    _, headers = _user_with_conversations(db, "metadata", conversations=0)
+    response = client.post(
+        "/api/chat/send",
+        json={"message": "Mon employeur ne m'a pas payé mon salaire", "fast_mode": True},
+        headers=headers
+    )
+    assert response.status_code == 200
+    data = response.json()
+
+    reply = db.query(Message).filter(Message.role == "assistant").one()
+    assert reply.case_id == data["case_detected"]
+    assert reply.source == data["source"] == "knowledge_base"
+    assert reply.extra_data is None
+    assert reply.model is None and reply.latency_ms is None
+
+    stats = client.get("/api/stats", headers=headers).json()
+    assert stats["replies"]["knowledge_base"]["count"] == 1
@@ -0,0 +1,128 @@
+"""
+Tests pour le cache du contexte des conversations
+"""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+
+from app.auth import create_access_token, get_password_hash
+from app.context_cache import ConversationContextCache, context_cache
+from app.models import Conversation, Message, User
+from app.routes import chat
+from tests.conftest import async_engine
+
+T0 = datetime(2024, 1, 1, 12, 0, 0)
+T1 = T0 + timedelta(seconds=1)
+
+
+def test_evicts_least_recently_used_by_size():
+    cache = ConversationContextCache(max_bytes=3200, window=10)
+    for conversation_id in (1, 2, 3):
+        cache.put(conversation_id, T0, [("user", "x" * 700)])
+    assert cache.status()["entries"] == 3
+    assert cache.get(1, T0) is not None
+
+    cache.put(4, T0, [("user", "x" * 700)])
+    # La conversation 2 est la moins récemment utilisée
+    assert cache.get(2, T0) is None
+    assert cache.get(1, T0) is not None
+    assert cache.status()["bytes"] <= 3200
+
+    cache.put(5, T0, [("user", "x" * 5000)])
+    assert cache.get(5, T0) is None
+
+
+def test_window_and_stale_entries():
+    cache = ConversationContextCache(window=2)
+    cache.put(1, T0, [("user", "a"), ("assistant", "b"), ("user", "c")])
+    assert [m["content"] for m in cache.get(1, T0)] == ["b", "c"]
+
+    cache.append(1, T0, "assistant", "d", updated_at=T1)
+    assert [m["content"] for m in cache.get(1, T1)] == ["c", "d"]
+
+    # Écrit ailleurs depuis : marque différente, entrée abandonnée
+    cache.append(1, T0, "user", "e")
+    assert cache.get(1, T1) is None
+    cache.put(2, T0, [("user", "a")])
+    assert cache.get(2, T1) is None
+    assert cache.status()["entries"] == 0
+
+
+@pytest.fixture
+def headers(db):
+    user = User(email="context@syflai.com", username="context", hashed_password=get_password_hash("Test123456"))
+    db.add(user)
+    db.commit()
+    context_cache.clear()
+    yield {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+    context_cache.clear()
+
+
+@pytest.fixture
+def histories(client, monkeypatch):
+    """Historiques transmis au moteur IA, un par échange"""
+    seen = []
+    generate_reply = chat.ai_engine.generate_reply
+
+    def record(**kwargs):
+        seen.append([m["content"] for m in kwargs["conversation_history"]])
+        return generate_reply(**kwargs)
+
+    monkeypatch.setattr(chat.ai_engine, "generate_reply", record)
+    return seen
+
+
+def _send(client, headers, message, conversation_id=None):
+    payload = {"message": message, "fast_mode": True, "conversation_id": conversation_id}
+    response = client.post("/api/chat/send", json=payload, headers=headers)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_multi_turn_skips_history_query(client, headers, histories):
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        upper = statement.lstrip().upper()
+        # Historique ou archive lus à part (la conversation porte son état d'archivage)
+        if upper.startswith("SELECT") and ("FROM MESSAGES" in upper or "FROM CONVERSATION_ARCHIVES" in upper):
+            statements.append(statement)
+
+    first = _send(client, headers, "Mon employeur ne me paie plus")
+    conversation_id = first["conversation_id"]
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        second = _send(client, headers, "Depuis trois mois", conversation_id)
+        _send(client, headers, "Que faire ?", conversation_id)
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+    assert statements == []
+    assert histories[1] == ["Mon employeur ne me paie plus", first["message"]]
+    assert histories[2] == histories[1] + ["Depuis trois mois", second["message"]]
+
+
+def test_write_from_another_worker_reloads_history(client, db, headers, histories):
+    conversation_id = _send(client, headers, "Licencié sans préavis")["conversation_id"]
+
+    # Autre worker : message enregistré, updated_at de la conversation modifié
+    conversation = db.get(Conversation, conversation_id)
+    conversation.updated_at = datetime.utcnow()
+    db.add(Message(conversation_id=conversation_id, role="user", content="Message d'un autre worker"))
+    db.commit()
+
+    _send(client, headers, "Et mes congés ?", conversation_id)
+    assert "Message d'un autre worker" in histories[-1]
+
+
+def test_delete_invalidates_context(client, headers):
+    conversation_id = _send(client, headers, "Harcèlement au travail")["conversation_id"]
+    assert context_cache.status()["entries"] == 1
+
+    assert client.delete(f"/api/chat/conversations/{conversation_id}", headers=headers).status_code == 204
+    assert context_cache.status()["entries"] == 0
+
+    _send(client, headers, "Salaire impayé")
+    assert client.delete("/api/chat/conversations", headers=headers).json()["deleted"] == 1
+    assert context_cache.status()["entries"] == 0
@@ -0,0 +1,77 @@
+"""
+Tests pour les profils de moteur de base de données
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+
+from app.database import (
+    async_database_url,
+    create_configured_async_engine,
+    create_configured_engine,
+    engine_profile,
+    normalize_database_url,
+    pool_status,
+)
+
+
+def test_sqlite_file_profile_enables_wal(tmp_path):
+    engine = create_configured_engine(f"sqlite:///{tmp_path / 'wal.db'}")
+    try:
+        with engine.connect() as connection:
+            assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+            assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+            assert connection.execute(text("PRAGMA busy_timeout")).scalar() > 0
+            assert connection.execute(text("PRAGMA foreign_keys")).scalar() == 1
+        status = pool_status(engine)
+        assert status["profile"] == "sqlite"
+        assert status["pool"] == "QueuePool"
+        assert {"size", "checkedout", "overflow", "checkedin"} <= set(status)
+    finally:
+        engine.dispose()
+
+
+def test_sqlite_memory_profile_shares_one_connection():
+    profile = engine_profile("sqlite://")
+    assert profile.name == "sqlite_memory"
+    assert profile.pragmas == ["PRAGMA foreign_keys=ON"]
+    assert engine_profile("sqlite:///:memory:").name == "sqlite_memory"
+
+
+def test_postgres_profile():
+    assert normalize_database_url("postgres://u:p@db:5432/syfl") == "postgresql://u:p@db:5432/syfl"
+    profile = engine_profile("postgresql://u:p@db:5432/syfl")
+    assert profile.name == "postgresql"
+    assert profile.options["pool_pre_ping"] is True
+    assert profile.options["pool_recycle"] > 0
+    assert "statement_timeout" in profile.options["connect_args"]["options"]
+
+
+def test_async_database_url():
+    assert async_database_url("sqlite:///./syfl_ai.db") == "sqlite+aiosqlite:///./syfl_ai.db"
+    assert async_database_url("postgres://u:p@db:5432/syfl") == "postgresql+asyncpg://u:p@db:5432/syfl"
+    with pytest.raises(ValueError, match="ASYNC_DATABASE_URL"):
+        async_database_url("mysql://u:p@db/syfl")
+
+
+def test_async_sqlite_profile_enables_wal(tmp_path):
+    async def check():
+        engine = create_configured_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'wal.db'}")
+        try:
+            async with engine.connect() as connection:
+                assert (await connection.execute(text("PRAGMA journal_mode"))).scalar() == "wal"
+                assert (await connection.execute(text("PRAGMA busy_timeout"))).scalar() > 0
+            return pool_status(engine)
+        finally:
+            await engine.dispose()
+
+    status = asyncio.run(check())
+    assert status["profile"] == "sqlite"
+    assert status["pool"] == "AsyncAdaptedQueuePool"
+
+
+def test_asyncpg_profile():
+    profile = engine_profile("postgresql+asyncpg://u:p@db:5432/syfl")
+    assert profile.options["pool_pre_ping"] is True
+    assert profile.options["connect_args"]["server_settings"]["statement_timeout"] == "15000"
@@ -0,0 +1,395 @@
+"""
+Tests pour l'export PDF des conversations
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.auth import create_access_token, get_password_hash
+from app.database import get_sessionmaker
+from app.jobs import job_runner
+from app.export_cache import ExportCache, export_cache
+from app.models import User, Conversation, Message
+from app import pdf_export
+from app.pdf_export import PDFExportBusy, PDFRenderPool, render_conversation_pdf, render_pool
+from tests.conftest import engine
+
+
+@pytest.fixture
+def export_user(db):
+    """Utilisateur créé directement en base"""
+    user = User(
+        email="export@example.com",
+        username="exportuser",
+        hashed_password=get_password_hash("Test123456")
+    )
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+    return user
+
+
+@pytest.fixture
+def export_headers(export_user):
+    """Headers d'authentification de l'utilisateur d'export"""
+    token = create_access_token(data={"sub": export_user.email})
+    return {"Authorization": f"Bearer {token}"}
+
+
+@pytest.fixture
+def conversation(db, export_user):
+    """Conversation avec deux messages"""
+    conversation = Conversation(user_id=export_user.id, case_type="salaire_impaye")
+    db.add(conversation)
+    db.commit()
+    db.add_all([
+        Message(conversation_id=conversation.id, role="user", content="Mon salaire n'est pas payé"),
+        Message(conversation_id=conversation.id, role="assistant", content="Voici vos recours\nétape 1"),
+    ])
+    db.commit()
+    return conversation
+
+
+@pytest.fixture(autouse=True)
+def thread_render_pool(monkeypatch, tmp_path):
+    """Rendu dans un thread et cache temporaire pendant les tests"""
+    monkeypatch.setattr(render_pool, "workers", 0)
+    monkeypatch.setattr(export_cache, "directory", tmp_path / "exports")
+    monkeypatch.setattr("app.bulk_export.EXPORT_JOBS_DIR", str(tmp_path / "jobs"))
+    monkeypatch.setattr(job_runner, "workers", 0)
+    yield
+    render_pool.shutdown()
+
+
+def test_render_conversation_pdf():
+    """Le rendu fonctionne à partir de données simples"""
+    from datetime import datetime
+    meta = {"case_type": None, "created_at": datetime(2025, 1, 1), "username": "bob"}
+    pdf = render_conversation_pdf(meta, [("user", "Bonjour", datetime(2025, 1, 1, 10, 0))])
+    assert pdf.startswith(b"%PDF")
+
+
+def test_export_pdf_success(client, export_headers, conversation):
+    """Export PDF d'une conversation"""
+    response = client.get(
+        f"/api/export/conversation/{conversation.id}/pdf",
+        headers=export_headers
+    )
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    assert response.content.startswith(b"%PDF")
+
+
+def test_export_pdf_not_found(client, export_headers):
+    """Export d'une conversation inexistante"""
+    response = client.get("/api/export/conversation/99999/pdf", headers=export_headers)
+    assert response.status_code == 404
+
+
+def test_export_pdf_busy(client, export_headers, conversation, monkeypatch):
+    """Export refusé quand toutes les places de rendu sont prises"""
+    monkeypatch.setattr(render_pool, "max_concurrency", 0)
+    monkeypatch.setattr(render_pool, "queue_timeout", 0.01)
+    render_pool.shutdown()
+    response = client.get(
+        f"/api/export/conversation/{conversation.id}/pdf",
+        headers=export_headers
+    )
+    assert response.status_code == 503
+
+
+def test_timed_out_render_keeps_its_slot():
+    """Un rendu abandonné au timeout garde sa place jusqu'à sa fin effective"""
+    pool = PDFRenderPool(workers=0, max_concurrency=1, timeout=0.05, queue_timeout=0.05)
+    finished = threading.Event()
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await pool.render_streaming(finished.wait, 5)
+        with pytest.raises(PDFExportBusy):
+            await pool.render_streaming(lambda: "pdf")
+
+        finished.set()
+        await asyncio.sleep(0.05)
+        return await pool.render_streaming(lambda: "pdf")
+
+    assert asyncio.run(scenario()) == "pdf"
+
+
+@pytest.fixture
+def fake_process_pool(monkeypatch):
+    """Pool "à processus" servi par des threads, rendu remplacé par meta["render"]"""
+    monkeypatch.setattr(pdf_export, "render_conversation_pdf", lambda meta, messages: meta["render"]())
+    pools = []
+
+    def make(workers, **kwargs):
+        pool = PDFRenderPool(workers=workers, **kwargs)
+        pool._executor = ThreadPoolExecutor(max_workers=workers)
+        pools.append(pool)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def test_queue_wait_not_counted_in_render_timeout(fake_process_pool):
+    """Un rendu qui attend un processus libre n'est pas compté en retard"""
+    pool = fake_process_pool(1, max_concurrency=2, timeout=0.25, queue_timeout=2)
+
+    def render():
+        time.sleep(0.15)
+        return b"pdf"
+
+    async def scenario():
+        return await asyncio.gather(*(pool.render({"render": render}, []) for _ in range(2)))
+
+    assert asyncio.run(scenario()) == [b"pdf", b"pdf"]
+
+
+def test_jobs_leave_a_process_to_interactive_exports(fake_process_pool):
+    """Les rendus des jobs n'occupent que job_concurrency processus"""
+    pool = fake_process_pool(2, job_concurrency=1, timeout=1, queue_timeout=0.5)
+    release = threading.Event()
+    job_render = {"render": lambda: release.wait(5) and b"job"}
+
+    first = pool.submit(job_render, [])
+    second = []
+    blocked = threading.Thread(target=lambda: second.append(pool.submit(job_render, [])))
+    blocked.start()
+    blocked.join(0.1)
+    # Deuxième rendu du job en attente d'une place des jobs
+    assert blocked.is_alive()
+
+    assert asyncio.run(pool.render({"render": lambda: b"interactive"}, [])) == b"interactive"
+
+    release.set()
+    blocked.join(5)
+    assert first.result(5) == second[0].result(5) == b"job"
+
+
+def test_export_pdf_served_from_cache(client, export_headers, conversation, monkeypatch):
+    """Le second export est servi depuis le cache disque"""
+    url = f"/api/export/conversation/{conversation.id}/pdf"
+    first = client.get(url, headers=export_headers)
+    assert first.status_code == 200
+
+    async def fail_render(meta, messages):
+        raise AssertionError("rendu inattendu")
+
+    monkeypatch.setattr(render_pool, "render", fail_render)
+    second = client.get(url, headers=export_headers)
+    assert second.status_code == 200
+    assert second.content == first.content
+    assert second.headers["etag"] == first.headers["etag"]
+
+
+def test_export_pdf_not_modified(client, export_headers, conversation):
+    """If-None-Match avec l'ETag courant renvoie 304"""
+    url = f"/api/export/conversation/{conversation.id}/pdf"
+    etag = client.get(url, headers=export_headers).headers["etag"]
+    response = client.get(url, headers={**export_headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_export_pdf_new_message_changes_etag(client, export_headers, conversation, db):
+    """Un nouveau message produit un nouvel export"""
+    url = f"/api/export/conversation/{conversation.id}/pdf"
+    etag = client.get(url, headers=export_headers).headers["etag"]
+
+    db.add(Message(conversation_id=conversation.id, role="user", content="Et ensuite ?"))
+    db.commit()
+    export_cache.invalidate(conversation.id)
+
+    response = client.get(url, headers={**export_headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_export_cache_lru_eviction(tmp_path):
+    """Les exports les moins récemment servis sont évincés en premier"""
+    import os
+    cache = ExportCache(directory=str(tmp_path), max_bytes=250)
+    cache.put("conversation_1_1_v1", b"a" * 100)
+    cache.put("conversation_2_1_v1", b"b" * 100)
+    os.utime(cache.get("conversation_1_1_v1"), (0, 0))
+    cache.get("conversation_2_1_v1")
+    cache.put("conversation_3_1_v1", b"c" * 100)
+
+    assert cache.get("conversation_1_1_v1") is None
+    assert cache.get("conversation_2_1_v1") is not None
+    assert cache.get("conversation_3_1_v1") is not None
+
+
+def test_export_pdf_streaming_path(client, export_headers, conversation, monkeypatch):
+    """Les longues conversations sont rendues depuis le curseur, sans pool de processus"""
+    import app.routes.export as export_routes
+    monkeypatch.setattr(export_routes, "PDF_STREAMING_THRESHOLD", 0)
+
+    async def fail_render(meta, messages):
+        raise AssertionError("rendu en mémoire inattendu")
+
+    monkeypatch.setattr(render_pool, "render", fail_render)
+
+    # Session propre au thread de rendu, fermée par lui
+    sessions = []
+
+    class RecordingSession(Session):
+        def close(self):
+            sessions.append(threading.get_ident())
+            super().close()
+
+    client.app.dependency_overrides[get_sessionmaker] = lambda: sessionmaker(bind=engine, class_=RecordingSession)
+    response = client.get(
+        f"/api/export/conversation/{conversation.id}/pdf",
+        headers=export_headers
+    )
+    assert response.status_code == 200
+    assert response.content.startswith(b"%PDF")
+    assert len(sessions) == 1 and sessions[0] != threading.get_ident()
+
+
+def test_export_jsonl(client, export_headers, conversation):
+    """Export JSONL : une ligne d'en-tête puis une ligne par message"""
+    import json
+    response = client.get(
+        f"/api/export/conversation/{conversation.id}/jsonl",
+        headers=export_headers
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert lines[0]["type"] == "conversation"
+    assert [line["role"] for line in lines[1:]] == ["user", "assistant"]
+
+
+def test_export_jsonl_read_in_batches(client, export_headers, conversation, monkeypatch):
+    """Lecture par lots depuis la session async : même contenu, même ordre"""
+    import json
+    monkeypatch.setattr("app.export_formats.EXPORT_BATCH_SIZE", 1)
+    response = client.get(
+        f"/api/export/conversation/{conversation.id}/jsonl",
+        headers=export_headers
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["content"] for line in lines[1:]] == ["Mon salaire n'est pas payé", "Voici vos recours\nétape 1"]
+
+
+def test_export_markdown_and_html(client, export_headers, conversation):
+    """Exports Markdown et HTML"""
+    markdown = client.get(
+        f"/api/export/conversation/{conversation.id}/md",
+        headers=export_headers
+    )
+    assert markdown.status_code == 200
+    assert "Mon salaire n'est pas payé" in markdown.text
+
+    page = client.get(
+        f"/api/export/conversation/{conversation.id}/html",
+        headers=export_headers
+    )
+    assert page.status_code == 200
+    assert "Mon salaire n&#x27;est pas payé" in page.text
+
+
+def test_export_unknown_format(client, export_headers, conversation):
+    """Format d'export inconnu"""
+    response = client.get(
+        f"/api/export/conversation/{conversation.id}/docx",
+        headers=export_headers
+    )
+    assert response.status_code == 400
+
+
+def test_bulk_export_job(client, export_headers, conversation, monkeypatch, db):
+    """Export groupé : création du job, progression puis téléchargement du ZIP"""
+    import io
+    import zipfile
+    from tests.conftest import TestingSessionLocal
+
+    monkeypatch.setattr(job_runner, "session_factory", TestingSessionLocal)
+
+    response = client.post("/api/export/all", headers=export_headers)
+    assert response.status_code == 202
+    job = response.json()
+    assert job["status"] == "pending"
+
+    # Un second appel renvoie le job déjà en cours
+    again = client.post("/api/export/all", headers=export_headers)
+    assert again.json()["id"] == job["id"]
+
+    not_ready = client.get(f"/api/export/jobs/{job['id']}/download", headers=export_headers)
+    assert not_ready.status_code == 409
+
+    assert job_runner.run_next()
+    db.expire_all()
+
+    status = client.get(f"/api/export/jobs/{job['id']}", headers=export_headers).json()
+    assert status["status"] == "completed"
+    assert status["total"] == status["completed"] == 1
+
+    download = client.get(f"/api/export/jobs/{job['id']}/download", headers=export_headers)
+    assert download.status_code == 200
+    with zipfile.ZipFile(io.BytesIO(download.content)) as archive:
+        names = archive.namelist()
+        assert len(names) == 1
+        assert archive.read(names[0]).startswith(b"%PDF")
+
+
+def test_bulk_export_expires(client, export_headers, conversation, monkeypatch, db):
+    """Le ZIP est supprimé après la durée de conservation, le téléchargement répond 410"""
+    from pathlib import Path
+    from app.bulk_export import PURGE_EXPORTS_JOB
+    from app.jobs import JobRunner
+    from app.models import Job
+    from tests.conftest import TestingSessionLocal
+
+    monkeypatch.setattr(job_runner, "session_factory", TestingSessionLocal)
+    job_id = client.post("/api/export/all", headers=export_headers).json()["id"]
+    assert job_runner.run_next()
+    download = f"/api/export/jobs/{job_id}/download"
+    assert client.get(download, headers=export_headers).status_code == 200
+
+    # Purge périodique enregistrée au démarrage : l'export est encore récent
+    runner = JobRunner(workers=0, session_factory=TestingSessionLocal)
+    runner.schedule_recurring()
+    assert runner.run_next()
+    assert client.get(download, headers=export_headers).status_code == 200
+
+    db.expire_all()
+    job = db.get(Job, job_id)
+    path = Path(job.result["file_path"])
+    job.finished_at -= timedelta(hours=48)
+    db.commit()
+    purge = db.query(Job).filter(Job.kind == PURGE_EXPORTS_JOB, Job.status == "pending").one()
+    # Prochaine purge déjà planifiée, avancée pour le test
+    assert purge.run_after > datetime.utcnow()
+    purge.run_after = datetime.utcnow()
+    db.commit()
+    assert runner.run_next()
+
+    db.expire_all()
+    assert db.get(Job, job_id).status == "expired"
+    assert not path.exists()
+    assert client.get(download, headers=export_headers).status_code == 410
+
+
+def test_bulk_export_missing_file_is_gone(client, export_headers, conversation, monkeypatch):
+    """ZIP disparu du disque (autre hôte, nettoyage manuel) : 410 plutôt qu'une erreur"""
+    from pathlib import Path
+    from tests.conftest import TestingSessionLocal
+
+    monkeypatch.setattr(job_runner, "session_factory", TestingSessionLocal)
+    job_id = client.post("/api/export/all", headers=export_headers).json()["id"]
+    assert job_runner.run_next()
+    import app.bulk_export as bulk_export
+
+    for zip_path in Path(bulk_export.EXPORT_JOBS_DIR).glob("*.zip"):
+        zip_path.unlink()
+    assert client.get(f"/api/export/jobs/{job_id}/download", headers=export_headers).status_code == 410
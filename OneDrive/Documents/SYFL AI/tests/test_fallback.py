@@ -0,0 +1,122 @@
+"""
+Tests pour les réponses de secours depuis la base de connaissances
+"""
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from app.ai_engine import SOURCE_KNOWLEDGE_BASE, SOURCE_LLM, AIEngine, CircuitBreaker
+from app.fake_llm import FakeMistral
+from app.fallback import FallbackEngine
+from app.kb_build import compile_knowledge_base
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+class FakeCompletions:
+    """Remplace client.chat : réponse fixe ou exception"""
+
+    def __init__(self, content="Réponse du LLM", error=None):
+        self.content = content
+        self.error = error
+        self.calls = 0
+
+    def complete(self, **kwargs):
+        self.calls += 1
+        if self.error:
+            raise self.error
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))])
+
+
+@pytest.fixture(scope="module")
+def snapshot():
+    return compile_knowledge_base(PROJECT_DIR / "bases_connaissances", None, None)
+
+
+@pytest.fixture
+def engine(snapshot):
+    engine = AIEngine(api_key="test")
+    engine.use_snapshot(snapshot)
+    engine.circuit = CircuitBreaker(failure_threshold=2, reset_timeout=60)
+    return engine
+
+
+def test_keyword_detection(snapshot):
+    """Les cas courants sont reconnus sans LLM"""
+    fallback = FallbackEngine(snapshot)
+    assert fallback.detect_case("J'ai été licencié sans préavis")[0] == "licenciement_sans_preavis"
+    assert fallback.detect_case("Ma période d'essai a été renouvelée")[0] == "periode_essai_abusive"
+    assert fallback.detect_case("bonjour")[0] is None
+
+
+def test_case_answer_uses_case_fields(snapshot):
+    """La réponse gabarit reprend articles, questions et actions du cas"""
+    answer = FallbackEngine(snapshot).answer("", "salaire_impaye")
+    case = snapshot.cases["salaire_impaye"]
+    assert case["titre"] in answer
+    assert case["articles_reference"][0] in answer
+    assert case["actions"][0] in answer
+
+
+def test_fast_mode_skips_llm(engine):
+    """Le mode rapide ne fait aucun appel au LLM"""
+    engine.client = SimpleNamespace(chat=FakeCompletions())
+    reply = engine.generate_reply("Mon salaire n'est pas payé", fast_mode=True)
+    assert reply.source == SOURCE_KNOWLEDGE_BASE
+    assert engine.client.chat.calls == 0
+
+
+def test_circuit_opens_after_failures(engine):
+    """Après les échecs, le LLM n'est plus appelé et la réponse vient de la base"""
+    engine.client = SimpleNamespace(chat=FakeCompletions(error=RuntimeError("503")))
+    for _ in range(2):
+        assert engine.generate_reply("salaire impayé").source == SOURCE_KNOWLEDGE_BASE
+    assert engine.circuit.state == "open"
+
+    reply = engine.generate_reply("salaire impayé", case_id="salaire_impaye")
+    assert reply.source == SOURCE_KNOWLEDGE_BASE
+    assert "Salaire impayé" in reply.content
+    assert engine.client.chat.calls == 2
+
+
+def test_half_open_trial_closes_circuit(engine):
+    """Un appel d'essai réussi referme le circuit"""
+    engine.client = SimpleNamespace(chat=FakeCompletions(error=RuntimeError("503")))
+    engine.generate_reply("a")
+    engine.generate_reply("b")
+    engine.circuit.reset_timeout = 0
+
+    engine.client.chat.error = None
+    reply = engine.generate_reply("c")
+    assert reply[:2] == ("Réponse du LLM", SOURCE_LLM)
+    assert engine.circuit.state == "closed"
+
+
+def test_saturated_queue_falls_back(engine, monkeypatch):
+    """Sans créneau libre, la réponse vient de la base sans attendre le LLM"""
+    monkeypatch.setattr("app.ai_engine.LLM_QUEUE_TIMEOUT", 0.01)
+    engine.client = SimpleNamespace(chat=FakeCompletions())
+    while engine._slots.acquire(blocking=False):
+        pass
+    assert engine.generate_reply("salaire impayé").source == SOURCE_KNOWLEDGE_BASE
+    assert engine.circuit.state == "closed"
+
+
+def test_llm_reply_metadata(engine):
+    """Les réponses du LLM portent le modèle, les tokens et la latence"""
+    engine.client = FakeMistral(latency_ms=0)
+    reply = engine.generate_reply("Mon salaire n'est pas payé")
+    assert reply.source == SOURCE_LLM
+    assert reply.model == engine.model
+    assert reply.prompt_tokens > 0 and reply.completion_tokens > 0
+    assert reply.latency_ms >= 0
+
+    reply = engine.generate_reply("Mon salaire n'est pas payé", fast_mode=True)
+    assert (reply.model, reply.prompt_tokens, reply.latency_ms) == (None, None, None)
+
+
+@pytest.mark.parametrize("content", ["Licenciement_sans_preavis", "LICENCIEMENT_SANS_PREAVIS."])
+def test_llm_detection_ignores_case(engine, content):
+    engine.client = SimpleNamespace(chat=FakeCompletions(content))
+    assert engine.detect_case("J'ai été renvoyé") == "licenciement_sans_preavis"
@@ -0,0 +1,132 @@
+"""
+Tests pour les jobs d'arrière-plan
+"""
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.jobs import JobRunner, job_handler
+from app.models import Job
+from tests.conftest import TestingSessionLocal
+
+calls = []
+
+
+@job_handler("test_ok")
+def run_ok(ctx):
+    calls.append(ctx.payload["name"])
+    ctx.progress(1, 1)
+    return {"name": ctx.payload["name"]}
+
+
+@job_handler("test_fail")
+def run_fail(ctx):
+    raise RuntimeError("boom")
+
+
+@job_handler("test_slow")
+def run_slow(ctx):
+    """Job long sans appel à progress : seul le thread de bail le garde vivant"""
+    started = ctx.job.heartbeat_at
+    time.sleep(0.3)
+    with TestingSessionLocal() as other:
+        return {"renewed": other.get(Job, ctx.job.id).heartbeat_at > started}
+
+
+@pytest.fixture
+def runner(db):
+    calls.clear()
+    return JobRunner(workers=0, session_factory=TestingSessionLocal)
+
+
+def test_job_completed(runner, db):
+    """Un job exécuté passe en completed avec son résultat"""
+    job = runner.enqueue(db, "test_ok", payload={"name": "a"})
+    assert runner.run_next()
+    assert not runner.run_next()
+
+    db.expire_all()
+    job = db.get(Job, job.id)
+    assert job.status == "completed"
+    assert job.result == {"name": "a"}
+    assert job.attempts == 1
+    assert job.progress_current == job.progress_total == 1
+
+
+def test_jobs_run_by_priority(runner, db):
+    """Les jobs de plus haute priorité passent en premier"""
+    runner.enqueue(db, "test_ok", payload={"name": "low"})
+    runner.enqueue(db, "test_ok", payload={"name": "high"}, priority=10)
+    while runner.run_next():
+        pass
+    assert calls == ["high", "low"]
+
+
+def test_job_retry_with_backoff(runner, db):
+    """Un job en échec est replanifié puis abandonné après max_attempts"""
+    job = runner.enqueue(db, "test_fail", max_attempts=2)
+    assert runner.run_next()
+
+    db.expire_all()
+    job = db.get(Job, job.id)
+    assert job.status == "pending"
+    assert job.run_after > datetime.utcnow()
+    assert "boom" in job.last_error
+
+    # Pas encore exécutable (backoff)
+    assert not runner.run_next()
+
+    job.run_after = datetime.utcnow()
+    db.commit()
+    assert runner.run_next()
+
+    db.expire_all()
+    job = db.get(Job, job.id)
+    assert job.status == "failed"
+    assert job.attempts == 2
+
+
+def test_enqueue_unknown_kind(runner, db):
+    """Un type de job sans handler est refusé"""
+    with pytest.raises(ValueError):
+        runner.enqueue(db, "inconnu")
+
+
+def test_lease_renewed_while_job_runs(db):
+    runner = JobRunner(workers=0, session_factory=TestingSessionLocal, heartbeat_interval=0.05)
+    job = runner.enqueue(db, "test_slow")
+    assert runner.run_next()
+
+    db.expire_all()
+    assert db.get(Job, job.id).result == {"renewed": True}
+
+
+def test_running_workers_recover_abandoned_jobs(db):
+    """Un job abandonné après le démarrage des workers est repris sans redémarrage"""
+    calls.clear()
+    runner = JobRunner(
+        workers=1, poll_interval=0.01, session_factory=TestingSessionLocal,
+        lease_seconds=60, heartbeat_interval=0.05
+    )
+    runner.start()
+    try:
+        stale = datetime.utcnow() - timedelta(seconds=120)
+        job = Job(
+            kind="test_ok", payload={"name": "repris"}, status="running", attempts=1,
+            locked_by="autre-hote:1", run_after=stale, started_at=stale, heartbeat_at=stale
+        )
+        db.add(job)
+        db.commit()
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            db.expire_all()
+            if db.get(Job, job.id).status == "completed":
+                break
+            time.sleep(0.02)
+    finally:
+        runner.shutdown(timeout=5)
+
+    assert db.get(Job, job.id).status == "completed"
+    assert calls == ["repris"]
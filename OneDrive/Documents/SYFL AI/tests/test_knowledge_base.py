@@ -0,0 +1,178 @@
+"""
+Tests pour la base de connaissances rechargeable à chaud
+"""
+import json
+import os
+from pathlib import Path
+
+import pytest
+from loguru import logger
+
+from app.kb_build import compile_knowledge_base
+from app.knowledge_base import (
+    KnowledgeBaseError,
+    KnowledgeBaseManager,
+    dump_compiled_snapshot,
+    load_compiled_snapshot,
+)
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+def write_case(directory, name, titre, mtime=None):
+    path = directory / f"{name}.json"
+    path.write_text(json.dumps({"id": name, "titre": titre, "actions": []}), encoding="utf-8")
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+    return path
+
+
+@pytest.fixture
+def manager(tmp_path):
+    write_case(tmp_path, "salaire_impaye", "Salaire impayé", mtime=1_000_000_000)
+    manager = KnowledgeBaseManager(directory=str(tmp_path), poll_interval=0)
+    assert manager.reload()
+    return manager
+
+
+def test_initial_load(manager):
+    """Le premier chargement publie la version 1 et ses dérivés"""
+    snapshot = manager.snapshot
+    assert snapshot.version == 1
+    assert "salaire_impaye" in snapshot.cases
+    assert "- salaire_impaye: Salaire impayé" in snapshot.cases_prompt
+    assert "Salaire impayé" in snapshot.case_contexts["salaire_impaye"]
+
+
+def test_reload_changed_file(manager, tmp_path):
+    """Un fichier modifié produit un nouvel instantané, l'ancien reste intact"""
+    old = manager.snapshot
+    published = []
+    manager.subscribe(published.append)
+
+    assert not manager.reload()
+    write_case(tmp_path, "salaire_impaye", "Salaire non versé", mtime=2_000_000_000)
+    assert manager.reload()
+
+    assert manager.snapshot.version == 2
+    assert manager.snapshot.cases["salaire_impaye"]["titre"] == "Salaire non versé"
+    assert old.cases["salaire_impaye"]["titre"] == "Salaire impayé"
+    assert published == [manager.snapshot]
+
+
+def test_invalid_file_keeps_previous_version(manager, tmp_path):
+    """Un fichier invalide est ignoré, la version précédente du cas est conservée"""
+    path = tmp_path / "salaire_impaye.json"
+    path.write_text("{ invalide", encoding="utf-8")
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    write_case(tmp_path, "travail_force", "Travail forcé")
+
+    assert manager.reload()
+    assert manager.snapshot.cases["salaire_impaye"]["titre"] == "Salaire impayé"
+    assert "travail_force" in manager.snapshot.cases
+
+
+@pytest.fixture
+def errors():
+    """Erreurs journalisées pendant le test"""
+    messages = []
+    sink = logger.add(messages.append, level="ERROR", format="{message}")
+    yield messages
+    logger.remove(sink)
+
+
+def test_rejected_version_reported_once(manager, tmp_path, errors):
+    """Une version invalide n'est relue et signalée qu'une fois, jusqu'à sa correction"""
+    path = tmp_path / "salaire_impaye.json"
+    path.write_text("{ invalide", encoding="utf-8")
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+
+    for _ in range(3):
+        assert not manager.reload()
+    assert len(errors) == 1
+
+    write_case(tmp_path, "salaire_impaye", "Salaire non versé", mtime=3_000_000_000)
+    assert manager.reload()
+    assert manager.snapshot.cases["salaire_impaye"]["titre"] == "Salaire non versé"
+
+    compiled = tmp_path / "kb.snapshot"
+    compiled.write_bytes(b"corrompu")
+    compiled_manager = KnowledgeBaseManager(directory=str(tmp_path), poll_interval=0, snapshot_path=str(compiled))
+    for _ in range(3):
+        assert not compiled_manager.reload()
+    assert len(errors) == 2
+    compiled.write_bytes(dump_compiled_snapshot(manager.snapshot))
+    assert compiled_manager.reload()
+
+
+def test_removed_file(manager, tmp_path):
+    """Un fichier supprimé disparaît de l'instantané suivant"""
+    (tmp_path / "salaire_impaye.json").unlink()
+    assert manager.reload()
+    assert len(manager.snapshot) == 0
+
+
+def test_snapshot_is_read_only(manager):
+    """Les cas d'un instantané ne sont pas modifiables"""
+    with pytest.raises(TypeError):
+        manager.snapshot.cases["salaire_impaye"]["titre"] = "x"
+
+
+def test_legacy_file_name_is_an_alias(tmp_path):
+    """L'identifiant déclaré fait foi, l'ancien nom de fichier reste résolu"""
+    path = tmp_path / "heuresSup_nonPayees.json"
+    path.write_text(json.dumps({
+        "id": "heures_supplementaires_non_payees",
+        "titre": "Heures supplémentaires non payées"
+    }), encoding="utf-8")
+    manager = KnowledgeBaseManager(directory=str(tmp_path), poll_interval=0)
+    manager.reload()
+
+    snapshot = manager.snapshot
+    assert list(snapshot.cases) == ["heures_supplementaires_non_payees"]
+    assert snapshot.resolve("heuresSup_nonPayees") == "heures_supplementaires_non_payees"
+    assert snapshot.resolve("heuressup_nonpayees") == "heures_supplementaires_non_payees"
+    assert snapshot.resolve("inconnu") is None
+
+
+def test_compiled_snapshot_round_trip(manager, tmp_path):
+    """L'instantané compilé restitue les cas et les index sans recalcul"""
+    compiled = tmp_path / "kb.snapshot"
+    compiled.write_bytes(dump_compiled_snapshot(manager.snapshot))
+
+    loaded = load_compiled_snapshot(compiled)
+    assert loaded.checksum == manager.snapshot.checksum
+    assert loaded.cases_prompt == manager.snapshot.cases_prompt
+    assert dict(loaded.case_contexts) == dict(manager.snapshot.case_contexts)
+
+    corrupted = bytearray(compiled.read_bytes())
+    corrupted[-1] ^= 0xFF
+    compiled.write_bytes(bytes(corrupted))
+    with pytest.raises(KnowledgeBaseError):
+        load_compiled_snapshot(compiled)
+
+
+def test_manager_loads_compiled_snapshot(tmp_path):
+    """Avec snapshot_path, le gestionnaire sert l'instantané compilé"""
+    output = tmp_path / "kb.snapshot"
+    compile_knowledge_base(PROJECT_DIR / "bases_connaissances", None, output)
+
+    manager = KnowledgeBaseManager(directory=str(tmp_path / "absent"), poll_interval=0, snapshot_path=str(output))
+    assert manager.reload()
+    assert not manager.reload()
+    assert len(manager.snapshot) == 10
+    assert manager.snapshot.resolve("licenciement_sansPreavis") == "licenciement_sans_preavis"
+
+
+def test_xlsx_rows_are_merged(tmp_path):
+    """Les lignes du classeur complètent les cas existants ou en ajoutent"""
+    snapshot = compile_knowledge_base(
+        PROJECT_DIR / "bases_connaissances",
+        PROJECT_DIR / "cas_injustice_droit_travail_togo.xlsx",
+        None
+    )
+    assert "chomage_technique_abusif" in snapshot.cases
+    assert snapshot.cases["travail_force"]["titre"] == "Travail forcé"
+    assert snapshot.resolve("licenciement_sans_motif") == "licenciement_abusif"
+    questions = snapshot.cases["discrimination_a_l_embauche"]["questions_clarification"]
+    assert all(question.endswith("?") for question in questions)
@@ -0,0 +1,110 @@
+"""
+Tests pour les métriques /metrics et la vérification de santé
+"""
+import pytest
+from sqlalchemy import create_engine, text
+
+from app.metrics import (
+    DB_CONNECTION_HOLD,
+    DB_POOL_CHECKOUT,
+    DB_QUERY_LATENCY,
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    Registry,
+    instrument_engine,
+)
+
+
+def test_histogram_exposition():
+    """Les intervalles sont cumulés et suivis de _sum et _count"""
+    registry = Registry()
+    latency = registry.register(Histogram("test_latency_seconds", "Test", ["route"], buckets=(0.1, 1.0)))
+    latency.labels("/a").observe(0.05)
+    latency.labels("/a").observe(0.5)
+    latency.labels("/a").observe(5)
+
+    output = registry.render()
+    assert "# TYPE test_latency_seconds histogram" in output
+    assert 'test_latency_seconds_bucket{route="/a",le="0.1"} 1' in output
+    assert 'test_latency_seconds_bucket{route="/a",le="1"} 2' in output
+    assert 'test_latency_seconds_bucket{route="/a",le="+Inf"} 3' in output
+    assert 'test_latency_seconds_count{route="/a"} 3' in output
+
+
+def test_register_rejects_name_collision():
+    """Deux métriques du même nom mélangeraient leurs séries : refusé"""
+    registry = Registry()
+    registry.register(Counter("test_total", "Test", ["route"]))
+    with pytest.raises(ValueError):
+        registry.register(Counter("test_total", "Test", ["route"]))
+    with pytest.raises(ValueError):
+        registry.register(Gauge("test_total", "Autre"))
+
+
+def test_engine_queries_are_measured():
+    """Les requêtes d'un moteur instrumenté alimentent l'histogramme SQL"""
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, "test-queries")
+    series = DB_QUERY_LATENCY.labels("test-queries", "SELECT")
+    before = sum(series.counts)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert sum(series.counts) == before + 1
+
+
+def test_pool_metrics_survive_dispose(tmp_path):
+    """engine.dispose() remplace le pool (gunicorn post_fork) : les mesures continuent"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.db'}")
+    instrument_engine(engine, "test-dispose")
+    engine.dispose()
+    checkout, hold = DB_POOL_CHECKOUT.labels("test-dispose"), DB_CONNECTION_HOLD.labels("test-dispose")
+    before = sum(checkout.counts), sum(hold.counts)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert (sum(checkout.counts), sum(hold.counts)) == (before[0] + 1, before[1] + 1)
+    engine.dispose()
+
+
+def test_engines_have_separate_series(tmp_path):
+    """Chaque moteur (principal, réplica) a ses propres séries SQL et de pool"""
+    primary = create_engine(f"sqlite:///{tmp_path / 'primary.db'}")
+    replica = create_engine(f"sqlite:///{tmp_path / 'replica.db'}")
+    instrument_engine(primary, "test-primary")
+    instrument_engine(replica, "replica.test:5432")
+    primary_series = DB_QUERY_LATENCY.labels("test-primary", "SELECT")
+    replica_series = DB_QUERY_LATENCY.labels("replica.test:5432", "SELECT")
+    before = sum(primary_series.counts), sum(replica_series.counts)
+
+    with replica.connect() as conn:
+        conn.execute(text("SELECT 1"))
+    assert (sum(primary_series.counts), sum(replica_series.counts)) == (before[0], before[1] + 1)
+
+    body = REGISTRY.render()
+    assert 'syfl_db_pool_connections{engine="test-primary",state="checkedin"}' in body
+    assert 'syfl_db_pool_connections{engine="replica.test:5432",state="checkedin"}' in body
+    primary.dispose()
+    replica.dispose()
+
+
+def test_metrics_endpoint_uses_route_templates(client):
+    """Les requêtes sont étiquetées par route déclarée, pas par URL"""
+    client.get("/api/chat/cases")
+    client.get("/api/export/conversation/12345/pdf")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'syfl_http_requests_total{method="GET",route="/api/chat/cases",status="200"}' in body
+    assert 'route="/api/export/conversation/{conversation_id}/pdf"' in body
+    assert "12345" not in body
+    assert 'syfl_cache_requests_total{cache="cases"' in body
+
+
+def test_health_checks_database(client):
+    """/health exécute une vraie requête sur la base"""
+    response = client.get("/health")
+    assert response.status_code == 200
+    assert response.json()["database"] == "connected"
@@ -0,0 +1,140 @@
+"""
+Tests pour les migrations alembic
+"""
+import json
+from pathlib import Path
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import create_engine, inspect, text
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+
+@pytest.fixture
+def legacy_db(tmp_path, monkeypatch):
+    """Base au schéma initial : métadonnées des réponses dans extra_data"""
+    url = f"sqlite:///{tmp_path / 'legacy.db'}"
+    engine = create_engine(url)
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY, conversation_id INTEGER NOT NULL, "
+            "role VARCHAR NOT NULL, content TEXT NOT NULL, extra_data JSON, created_at DATETIME)"
+        ))
+        connection.execute(
+            text("INSERT INTO messages (id, conversation_id, role, content, extra_data) VALUES (:id, 1, :role, 'x', :extra)"),
+            [
+                {"id": 1, "role": "user", "extra": None},
+                {"id": 2, "role": "assistant", "extra": json.dumps(
+                    {"case_detected": "salaire_impaye", "confidence": 0.85, "source": "llm"}
+                )},
+                {"id": 3, "role": "assistant", "extra": json.dumps({"source": "knowledge_base", "note": "gardée"})},
+                {"id": 4, "role": "assistant", "extra": "null"},
+            ]
+        )
+    # Lots de 2 : la reprise traverse plusieurs lots
+    monkeypatch.setenv("MIGRATION_BATCH_SIZE", "2")
+    monkeypatch.setenv("DATABASE_URL", url)
+    config = Config()
+    config.set_main_option("script_location", str(PROJECT_DIR / "alembic"))
+    yield engine, config
+    engine.dispose()
+
+
+def _rows(engine):
+    with engine.connect() as connection:
+        return connection.execute(text(
+            "SELECT id, case_id, confidence, source, extra_data FROM messages ORDER BY id"
+        )).all()
+
+
+def test_message_metadata_backfill(legacy_db):
+    engine, config = legacy_db
+    command.upgrade(config, "head")
+
+    assert {"ix_messages_case_id", "ix_messages_source", "ix_messages_model"} <= {
+        index["name"] for index in inspect(engine).get_indexes("messages")
+    }
+    rows = _rows(engine)
+    assert [tuple(row[:4]) for row in rows] == [
+        (1, None, None, None),
+        (2, "salaire_impaye", 0.85, "llm"),
+        (3, None, None, "knowledge_base"),
+        (4, None, None, None),
+    ]
+    assert rows[1].extra_data is None
+    assert json.loads(rows[2].extra_data) == {"note": "gardée"}
+
+    command.downgrade(config, "5b79a3bf50e5")
+    assert "source" not in {column["name"] for column in inspect(engine).get_columns("messages")}
+    with engine.connect() as connection:
+        extra_data = connection.execute(text("SELECT extra_data FROM messages WHERE id = 2")).scalar()
+    assert json.loads(extra_data) == {"case_detected": "salaire_impaye", "confidence": 0.85, "source": "llm"}
+
+
+def test_search_index_built_for_existing_messages(legacy_db):
+    engine, config = legacy_db
+    command.upgrade(config, "head")
+    with engine.begin() as connection:
+        assert connection.execute(text("SELECT count(*) FROM messages_fts WHERE messages_fts MATCH 'x'")).scalar() == 4
+        # Tenu à jour par les triggers
+        connection.execute(text(
+            "INSERT INTO messages (id, conversation_id, role, content) VALUES (5, 1, 'user', 'Préavis non respecté')"
+        ))
+        assert connection.execute(text("SELECT rowid FROM messages_fts WHERE messages_fts MATCH 'preavis'")).scalar() == 5
+
+    command.downgrade(config, "c3e91f0a7d24")
+    assert "messages_fts" not in inspect(engine).get_table_names()
+
+
+def test_orphan_export_jobs_table_dropped(legacy_db):
+    engine, config = legacy_db
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE export_jobs (id INTEGER PRIMARY KEY, user_id INTEGER, status VARCHAR)"))
+        connection.execute(text("CREATE INDEX ix_export_jobs_status ON export_jobs (status)"))
+
+    command.upgrade(config, "head")
+    assert "export_jobs" not in inspect(engine).get_table_names()
+
+    command.downgrade(config, "b2f4e8a91c63")
+    assert "export_jobs" in inspect(engine).get_table_names()
+
+
+def test_background_tables_created(legacy_db):
+    engine, config = legacy_db
+    command.upgrade(config, "head")
+    tables = set(inspect(engine).get_table_names())
+    assert {"jobs", "conversation_archives", "write_behind_checkpoints"} <= tables
+    assert {"ix_jobs_kind", "ix_jobs_status", "ix_jobs_run_after"} <= {
+        index["name"] for index in inspect(engine).get_indexes("jobs")
+    }
+    assert inspect(engine).get_foreign_keys("conversation_archives")[0]["referred_table"] == "conversations"
+
+    command.downgrade(config, "e7a2b94c1f05")
+    assert not {"jobs", "conversation_archives", "write_behind_checkpoints"} & set(inspect(engine).get_table_names())
+
+
+def test_schema_matches_models(tmp_path, monkeypatch):
+    """Chaque table des modèles est créée par les migrations, pas seulement par create_all"""
+    from alembic.autogenerate import compare_metadata
+    from alembic.migration import MigrationContext
+
+    from app.database import Base
+
+    url = f"sqlite:///{tmp_path / 'migrated.db'}"
+    engine = create_engine(url)
+    # Tables de départ du schéma initial
+    Base.metadata.create_all(engine, tables=[
+        Base.metadata.tables[name] for name in ("users", "conversations", "messages", "cases")
+    ])
+    monkeypatch.setenv("DATABASE_URL", url)
+    config = Config()
+    config.set_main_option("script_location", str(PROJECT_DIR / "alembic"))
+    command.upgrade(config, "head")
+
+    with engine.connect() as connection:
+        diff = compare_metadata(MigrationContext.configure(connection), Base.metadata)
+    engine.dispose()
+    # Aucune table des modèles absente de la base migrée (les tables FTS ne sont pas des modèles)
+    assert [op for op in diff if op[0] == "add_table"] == []
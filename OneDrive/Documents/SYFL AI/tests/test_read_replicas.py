@@ -0,0 +1,204 @@
+"""
+Tests pour le routage des lectures vers les réplicas
+"""
+import asyncio
+import itertools
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+from app.auth import create_access_token, get_password_hash
+from app.database import Base, EngineProfile, create_configured_async_engine
+from app.models import User
+from app.read_replicas import READ_STICKY_COOKIE, ReadRouter, Replica, read_router
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_replica(url: str, name: str) -> Replica:
+    # Sans pool : chaque TestClient a sa propre boucle d'événements
+    engine = create_configured_async_engine(url, EngineProfile(name="sqlite", options={"poolclass": NullPool}))
+    return Replica(name=name, engine=engine, sessionmaker=async_sessionmaker(engine, expire_on_commit=False))
+
+
+@pytest.fixture
+def replica(tmp_path):
+    """Réplica SQLite avec le schéma mais sans données (réplication en retard)"""
+    path = tmp_path / "replica.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=sync_engine)
+    sync_engine.dispose()
+    replica = make_replica(f"sqlite+aiosqlite:///{path}", "replica")
+    yield replica
+    asyncio.run(replica.engine.dispose())
+
+
+@pytest.fixture
+def routed(monkeypatch, replica):
+    """Routeur de l'application branché sur le réplica, avec une horloge contrôlée"""
+    clock = FakeClock()
+    monkeypatch.setattr(read_router, "replicas", [replica])
+    monkeypatch.setattr(read_router, "clock", clock)
+    monkeypatch.setattr(read_router, "wall_clock", clock)
+    monkeypatch.setattr(read_router, "_sticky", {})
+    # Tour de rôle repris au premier réplica
+    monkeypatch.setattr(read_router, "_turn", itertools.count())
+    return clock
+
+
+@pytest.fixture
+def user_headers(db):
+    user = User(email="replica@syflai.com", username="replica", hashed_password=get_password_hash("Test123456"))
+    db.add(user)
+    db.commit()
+    return {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+
+
+def test_round_robin_skips_unhealthy_replicas():
+    clock = FakeClock()
+    replicas = [Replica(name=name, engine=None, sessionmaker=None) for name in ("a", "b", "c")]
+    router = ReadRouter(replicas, retry_seconds=30, clock=clock)
+
+    assert [router.choose().name for _ in range(6)] == ["a", "b", "c", "a", "b", "c"]
+
+    router.mark_down(replicas[1], ConnectionError("refused"))
+    assert {router.choose().name for _ in range(4)} == {"a", "c"}
+    assert replicas[1].last_error == "ConnectionError: refused"
+
+    # Retenté après l'éviction
+    clock.now += 31
+    assert "b" in {router.choose().name for _ in range(3)}
+
+    for replica in replicas:
+        router.mark_down(replica, ConnectionError("refused"))
+    assert router.choose() is None
+
+
+def test_read_your_writes_window():
+    clock = FakeClock()
+    router = ReadRouter([Replica(name="a", engine=None, sessionmaker=None)], sticky_seconds=5, clock=clock)
+    router.record_write(42)
+    assert router.is_sticky(42)
+    assert not router.is_sticky(7)
+    assert router.choose(42) is None
+    assert router.choose(7).name == "a"
+
+    clock.now += 6
+    assert not router.is_sticky(42)
+    assert router.choose(42).name == "a"
+
+
+def test_sticky_token_is_signed_and_expires():
+    clock = FakeClock()
+    router = ReadRouter([Replica(name="a", engine=None, sessionmaker=None)], sticky_seconds=5, clock=clock, wall_clock=clock)
+    token = router.sticky_token(42)
+
+    # Autre worker : même clé, aucune écriture en mémoire
+    other = ReadRouter(router.replicas, sticky_seconds=5, clock=clock, wall_clock=clock, secret=router._secret.decode())
+    assert other.is_sticky(42, token)
+    assert not other.is_sticky(7, token)
+    assert not other.is_sticky(42, token.replace("42.", "7.", 1))
+    assert not ReadRouter(router.replicas, clock=clock, wall_clock=clock, secret="autre").is_sticky(42, token)
+    assert not other.is_sticky(42, "pas-un-jeton")
+
+    clock.now += 6
+    assert not other.is_sticky(42, token)
+
+
+def test_disabled_router_ignores_writes():
+    router = ReadRouter([])
+    router.record_write(42)
+    assert not router.enabled
+    assert router.choose() is None
+
+
+def test_reads_go_to_replica_until_own_write(client, routed, user_headers):
+    """Les lectures vont au réplica, sauf juste après une écriture de l'utilisateur"""
+    response = client.post(
+        "/api/chat/send",
+        json={"message": "Mon employeur ne me paie plus", "fast_mode": True},
+        headers=user_headers
+    )
+    assert response.status_code == 200
+
+    # Fenêtre d'adhérence : la conversation est relue sur la base principale
+    assert len(client.get("/api/chat/conversations", headers=user_headers).json()) == 1
+
+    # Ensuite le réplica (vide ici) sert les lectures
+    routed.now += 10
+    assert client.get("/api/chat/conversations", headers=user_headers).json() == []
+    assert client.get("/api/stats", headers=user_headers).json()["conversations"]["total"] == 0
+
+
+def test_sticky_window_follows_the_client_across_workers(client, routed, user_headers):
+    """Lecture servie par un autre worker : le jeton de la réponse garde l'adhérence"""
+    response = client.post(
+        "/api/chat/send",
+        json={"message": "Mon employeur ne me paie plus", "fast_mode": True},
+        headers=user_headers
+    )
+    token = response.headers[f"x-{READ_STICKY_COOKIE}"]
+    assert response.cookies[READ_STICKY_COOKIE] == token
+    # Le worker qui lit n'a pas vu l'écriture
+    read_router._sticky.clear()
+
+    assert len(client.get("/api/chat/conversations", headers=user_headers).json()) == 1
+    client.cookies.clear()
+    assert client.get("/api/chat/conversations", headers=user_headers).json() == []
+    # Client sans cookies : le jeton est renvoyé dans l'en-tête
+    sticky_headers = {**user_headers, f"X-{READ_STICKY_COOKIE}": token}
+    assert len(client.get("/api/chat/conversations", headers=sticky_headers).json()) == 1
+
+
+def test_streamed_pdf_header_read_from_primary(client, db, routed, replica, user_headers, monkeypatch, tmp_path):
+    """Rendu depuis la base principale : la clé du cache (ETag) est lue sur la même base"""
+    from app.export_cache import export_cache
+    from app.models import Conversation, Message
+    from app.pdf_export import TEMPLATE_VERSION, render_pool
+
+    monkeypatch.setattr("app.routes.export.PDF_STREAMING_THRESHOLD", 0)
+    monkeypatch.setattr(render_pool, "workers", 0)
+    monkeypatch.setattr(export_cache, "directory", tmp_path / "exports")
+
+    user = db.query(User).one()
+    conversation = Conversation(user_id=user.id, case_type="salaire_impaye")
+    db.add(conversation)
+    db.commit()
+    db.add_all([Message(conversation_id=conversation.id, role="user", content=f"Message {i}") for i in range(3)])
+    db.commit()
+    message_ids = [m.id for m in db.query(Message).order_by(Message.id)]
+
+    # Réplica en retard : un seul message répliqué
+    sync_replica = create_engine(str(replica.engine.url).replace("+aiosqlite", ""))
+    with sync_replica.begin() as connection:
+        connection.execute(User.__table__.insert(), [{"id": user.id, "email": user.email, "username": user.username, "hashed_password": "x"}])
+        connection.execute(Conversation.__table__.insert(), [{"id": conversation.id, "user_id": user.id, "case_type": "salaire_impaye"}])
+        connection.execute(Message.__table__.insert(), [{"id": message_ids[0], "conversation_id": conversation.id, "role": "user", "content": "Message 0"}])
+    sync_replica.dispose()
+
+    response = client.get(f"/api/export/conversation/{conversation.id}/pdf", headers=user_headers)
+    render_pool.shutdown()
+    assert response.status_code == 200
+    expected_key = export_cache.make_key(conversation.id, message_ids[-1], TEMPLATE_VERSION)
+    assert response.headers["etag"] == export_cache.make_etag(expected_key)
+
+
+def test_unreachable_replica_falls_back_to_primary(client, routed, user_headers, tmp_path):
+    broken = make_replica(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}", "broken")
+    read_router.replicas.insert(0, broken)
+    try:
+        response = client.get("/api/chat/conversations", headers=user_headers)
+        assert response.status_code == 200
+        assert not broken.healthy
+        health = client.get("/health").json()["read_replicas"]
+        assert [(r["name"], r["healthy"]) for r in health] == [("broken", False), ("replica", True)]
+    finally:
+        asyncio.run(broken.engine.dispose())
@@ -0,0 +1,111 @@
+"""
+Tests pour la recherche plein texte dans l'historique
+"""
+import pytest
+from sqlalchemy import event
+
+from app.auth import create_access_token, get_password_hash
+from app.models import Conversation, Message, User
+from app.search import fts5_query, search_terms
+from tests.conftest import async_engine
+
+
+def _user(db, name: str):
+    user = User(email=f"{name}@syflai.com", username=name, hashed_password=get_password_hash("Test123456"))
+    db.add(user)
+    db.commit()
+    return user, {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+
+
+def _conversation(db, user, title: str, contents):
+    conversation = Conversation(user_id=user.id, title=title)
+    db.add(conversation)
+    db.commit()
+    db.add_all([
+        Message(conversation_id=conversation.id, role="user" if i % 2 == 0 else "assistant", content=content)
+        for i, content in enumerate(contents)
+    ])
+    db.commit()
+    return conversation.id
+
+
+@pytest.fixture
+def history(db):
+    user, headers = _user(db, "search")
+    other, _ = _user(db, "intrus")
+    fired = _conversation(db, user, "Licenciement Abusif", [
+        "J'ai été licencié sans préavis après cinq ans",
+        "Un licenciement sans préavis ouvre droit à une indemnité compensatrice",
+    ])
+    salary = _conversation(db, user, "Salaire Impaye", [
+        "Mon employeur ne m'a pas payé mon salaire depuis trois mois <b>urgent</b>",
+    ])
+    _conversation(db, other, "Licenciement", ["Moi aussi j'ai été licencié"])
+    return headers, fired, salary
+
+
+def test_search_terms():
+    assert search_terms("Licenciée sans préavis !") == ["licenc", "preavi"]
+    assert search_terms("le la de") == []
+    assert fts5_query(["licenc", "preavi"]) == '"licenc"* "preavi"*'
+
+
+def test_search_ranked_with_highlighted_snippets(client, history):
+    headers, fired, salary = history
+    response = client.get("/api/chat/search", params={"q": "licenciement préavis"}, headers=headers)
+    assert response.status_code == 200
+    results = response.json()["results"]
+    # Les messages de l'autre utilisateur ne sortent pas
+    assert {r["conversation_id"] for r in results} == {fired}
+    assert len(results) == 2
+    assert results[0]["conversation_title"] == "Licenciement Abusif"
+    assert "<mark>" in results[0]["snippet"]
+    assert response.json()["next_cursor"] is None
+
+
+def test_search_folds_accents_and_escapes_html(client, history):
+    headers, _, salary = history
+    results = client.get("/api/chat/search", params={"q": "PAYE salaires"}, headers=headers).json()["results"]
+    assert [r["conversation_id"] for r in results] == [salary]
+    assert "&lt;b&gt;urgent&lt;/b&gt;" in results[0]["snippet"]
+    assert "<mark>payé</mark>" in results[0]["snippet"]
+
+
+def test_search_keyset_pagination(client, db):
+    user, headers = _user(db, "pages")
+    _conversation(db, user, "Heures", [f"Heures supplémentaires non payées, semaine {i}" for i in range(7)])
+
+    seen, cursor = [], None
+    while True:
+        params = {"q": "heures supplementaires", "limit": 3}
+        if cursor:
+            params["cursor"] = cursor
+        page = client.get("/api/chat/search", params=params, headers=headers).json()
+        seen += [r["message_id"] for r in page["results"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert len(seen) == len(set(seen)) == 7
+
+    response = client.get("/api/chat/search", params={"q": "heures", "cursor": "pas-un-curseur"}, headers=headers)
+    assert response.status_code == 400
+
+
+def test_index_follows_inserts_and_deletes(client, history):
+    """Index tenu à jour par la base, requêtes sans LIKE"""
+    headers, fired, _ = history
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    try:
+        client.post("/api/chat/send", json={"message": "Harcèlement de mon chef", "fast_mode": True}, headers=headers)
+        assert len(client.get("/api/chat/search", params={"q": "harcelement"}, headers=headers).json()["results"]) >= 1
+
+        assert client.delete(f"/api/chat/conversations/{fired}", headers=headers).status_code == 204
+        assert client.get("/api/chat/search", params={"q": "licencie"}, headers=headers).json()["results"] == []
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+    assert not [s for s in statements if " LIKE " in s.upper()]
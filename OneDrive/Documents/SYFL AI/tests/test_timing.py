@@ -0,0 +1,140 @@
+"""
+Tests pour la décomposition Server-Timing et le profileur échantillonné
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from app import timing
+from app.timing import RequestTimings, StackSampler, span
+
+
+@contextmanager
+def timing_context(timings):
+    token = timing._current.set(timings)
+    try:
+        yield
+    finally:
+        timing._current.reset(token)
+
+
+def test_server_timing_header(client):
+    """Chaque réponse annonce sa durée totale"""
+    response = client.get("/api/chat/cases")
+    header = response.headers["server-timing"]
+    assert "total;dur=" in header
+
+
+def test_span_outside_request_is_noop():
+    """Hors requête, span() ne mesure rien et n'échoue pas"""
+    with span("detect"):
+        pass
+    assert timing.current_timings() is None
+
+
+def test_span_accumulates():
+    """Les phases de même nom sont cumulées"""
+    timings = RequestTimings()
+    token = timing._current.set(timings)
+    try:
+        with span("db"):
+            time.sleep(0.01)
+        with span("db"):
+            time.sleep(0.01)
+    finally:
+        timing._current.reset(token)
+    assert timings.spans["db"] >= 0.02
+    assert "db;dur=" in timings.header()
+
+
+def test_span_thread_released_at_end():
+    """Un thread du pool n'est échantillonné que pendant ses spans"""
+    timings = RequestTimings()
+    seen = []
+
+    def pooled():
+        token = timing._current.set(timings)
+        try:
+            with span("generate"):
+                with span("llm"):
+                    seen.append(threading.get_ident() in timings.threads())
+                seen.append(threading.get_ident() in timings.threads())
+            seen.append(threading.get_ident() in timings.threads())
+        finally:
+            timing._current.reset(token)
+
+    worker = threading.Thread(target=pooled)
+    worker.start()
+    worker.join()
+    assert seen == [True, True, False]
+    assert timings.threads() == {threading.get_ident()}
+
+
+def test_stack_sampler_writes_collapsed_stacks(tmp_path, monkeypatch):
+    """Le profil contient les piles du thread de la requête au format collapsed"""
+    monkeypatch.setattr(timing, "PROFILE_DIR", str(tmp_path))
+    timings = RequestTimings()
+    done = threading.Event()
+
+    def slow_handler():
+        timings.thread_ids.add(threading.get_ident())
+        done.wait(0.2)
+
+    worker = threading.Thread(target=slow_handler)
+    sampler = StackSampler(interval=0.002)
+    profile = sampler.register(timings)
+    worker.start()
+    worker.join()
+    sampler.unregister(profile)
+
+    path = profile.write("POST_api_chat_send")
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert any("slow_handler" in line for line in lines)
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+
+
+def test_one_sampler_thread_for_concurrent_requests():
+    """Les requêtes profilées en parallèle partagent le même thread d'échantillonnage"""
+    def profiler_threads():
+        return sum(thread.name == "request-profiler" for thread in threading.enumerate())
+
+    before = profiler_threads()
+    sampler = StackSampler(interval=0.002)
+    release = threading.Event()
+    profiles = []
+
+    def handler():
+        timings = RequestTimings()
+        profiles.append(sampler.register(timings))
+        with timing_context(timings):
+            with span("work"):
+                release.wait(5)
+
+    workers = [threading.Thread(target=handler) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    time.sleep(0.1)
+    during = profiler_threads()
+    release.set()
+    for worker in workers:
+        worker.join()
+    for profile in profiles:
+        sampler.unregister(profile)
+
+    assert during == before + 1
+    assert all(sum(profile.samples.values()) > 0 for profile in profiles)
+    # Sans requête profilée, le thread n'échantillonne plus
+    assert not sampler._active.is_set()
+
+
+def test_profiled_request(client, tmp_path, monkeypatch):
+    """Le profil d'une requête est retiré de l'échantillonneur et écrit hors de la boucle d'événements"""
+    monkeypatch.setattr(timing, "PROFILE_SAMPLE_RATE", 1)
+    monkeypatch.setattr(timing, "PROFILE_DIR", str(tmp_path))
+    sampler = StackSampler(interval=0.001)
+    monkeypatch.setattr(timing, "profiler", sampler)
+
+    assert client.get("/api/chat/cases").status_code == 200
+    assert sampler._profiles == {}
+    assert not sampler._active.is_set()
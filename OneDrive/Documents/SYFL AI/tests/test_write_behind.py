@@ -0,0 +1,163 @@
+"""
+Tests pour les écritures différées (journal local et insertion par lots)
+"""
+import json
+from datetime import datetime
+
+import pytest
+
+from app.auth import create_access_token, get_password_hash
+from app.models import Conversation, Message, User, WriteBehindCheckpoint
+from app.write_behind import WriteBehindQueue
+from tests.conftest import TestingSessionLocal
+
+
+@pytest.fixture
+def conversation(db):
+    user = User(email="behind@syflai.com", username="behind", hashed_password=get_password_hash("Test123456"))
+    db.add(user)
+    db.commit()
+    conversation = Conversation(user_id=user.id)
+    db.add(conversation)
+    db.commit()
+    return conversation
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    queues = []
+
+    def make(**kwargs):
+        options = {"directory": str(tmp_path / "write_behind"), "enabled": True, "session_factory": TestingSessionLocal}
+        options.update(kwargs)
+        queue = WriteBehindQueue(**options)
+        queues.append(queue)
+        return queue
+
+    yield make
+    for queue in queues:
+        queue.shutdown(timeout=5)
+
+
+def _reply(conversation_id: int, i: int = 0) -> dict:
+    return {
+        "conversation_id": conversation_id,
+        "role": "assistant",
+        "content": f"Réponse {i}",
+        "source": "llm",
+        "latency_ms": 120 + i,
+        "created_at": datetime(2024, 1, 1, 12, 0, i),
+    }
+
+
+def _crash(queue: WriteBehindQueue):
+    """Arrêt brutal : rien n'est inséré, l'emplacement est libéré comme à la mort du processus"""
+    queue.flush_batch = lambda batch: (_ for _ in ()).throw(ConnectionError("base injoignable"))
+    queue._stopping = True
+    with queue._cond:
+        queue._cond.notify_all()
+    queue._thread.join(timeout=5)
+    queue._thread = None
+    queue._lock_file.close()
+    queue._segment.close()
+
+
+def test_batched_insert_and_checkpoint(db, conversation, make_queue):
+    queue = make_queue(batch_size=3)
+    queue.start()
+    for i in range(5):
+        assert queue.enqueue("messages", _reply(conversation.id, i), key=conversation.id)
+    assert queue.wait_flushed(conversation.id, timeout=5)
+
+    messages = db.query(Message).filter(Message.conversation_id == conversation.id).order_by(Message.id).all()
+    assert [m.content for m in messages] == [f"Réponse {i}" for i in range(5)]
+    assert messages[0].created_at == datetime(2024, 1, 1, 12, 0, 0)
+    assert db.get(WriteBehindCheckpoint, queue.slot).seq == 5
+    assert queue.status()["pending"] == 0
+
+
+def test_crash_recovery_replays_log(db, conversation, make_queue):
+    queue = make_queue(flush_interval=60)
+    queue.start()
+    for i in range(3):
+        assert queue.enqueue("messages", _reply(conversation.id, i), key=conversation.id)
+    segment = queue._segment_path
+    _crash(queue)
+    # Dernière écriture coupée en plein ajout : jamais acquittée
+    with open(segment, "a", encoding="utf-8") as log:
+        log.write('{"seq":4,"table":"mess')
+
+    recovered = make_queue()
+    recovered.start()
+    assert recovered.slot == queue.slot
+    assert recovered.wait_flushed(conversation.id, timeout=5)
+    assert db.query(Message).filter(Message.conversation_id == conversation.id).count() == 3
+    assert not segment.exists()
+
+
+def test_recovery_skips_checkpointed_writes(db, conversation, make_queue, tmp_path):
+    """Écritures déjà insérées avant l'arrêt (point de reprise en base) : pas de doublon"""
+    slot_dir = tmp_path / "write_behind" / "slot-0"
+    slot_dir.mkdir(parents=True)
+    (slot_dir / "slot-id").write_text("slot-test", encoding="utf-8")
+    with open(slot_dir / "segment-000001.log", "w", encoding="utf-8") as log:
+        for seq in (1, 2, 3):
+            row = {**_reply(conversation.id, seq), "created_at": f"2024-01-01T12:00:0{seq}"}
+            log.write(json.dumps({"seq": seq, "table": "messages", "key": conversation.id, "row": row}) + "\n")
+    db.add(WriteBehindCheckpoint(slot="slot-test", seq=2))
+    db.commit()
+
+    queue = make_queue()
+    queue.start()
+    assert queue.wait_flushed(conversation.id, timeout=5)
+    assert [m.content for m in db.query(Message).all()] == ["Réponse 3"]
+    # La numérotation reprend après le journal
+    assert queue.enqueue("messages", _reply(conversation.id, 4), key=conversation.id)
+    assert queue.wait_flushed(conversation.id, timeout=5)
+    db.expire_all()
+    assert db.get(WriteBehindCheckpoint, "slot-test").seq == 4
+
+
+def test_backpressure_falls_back_to_direct_write(conversation, make_queue):
+    queue = make_queue(max_pending=2, enqueue_timeout=0.05, flush_interval=60)
+    queue.start()
+    assert queue.enqueue("messages", _reply(conversation.id, 0))
+    assert queue.enqueue("messages", _reply(conversation.id, 1))
+    assert not queue.enqueue("messages", _reply(conversation.id, 2))
+    assert queue.pending == 2
+
+
+def test_rejected_row_is_dropped(db, conversation, make_queue):
+    """Une ligne refusée (conversation supprimée) n'empêche pas l'insertion du reste du lot"""
+    queue = make_queue(flush_interval=60)
+    queue.start()
+    queue.enqueue("messages", _reply(999_999, 0), key="lot")
+    queue.enqueue("messages", _reply(conversation.id, 1), key="lot")
+    queue.flush_batch(list(queue._pending))
+
+    assert [m.content for m in db.query(Message).all()] == ["Réponse 1"]
+    assert queue.pending == 0
+    assert db.get(WriteBehindCheckpoint, queue.slot).seq == 2
+
+
+def test_send_message_with_write_behind(client, db, make_queue, monkeypatch):
+    user = User(email="chatbehind@syflai.com", username="chatbehind", hashed_password=get_password_hash("Test123456"))
+    db.add(user)
+    db.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(data={'sub': user.email})}"}
+    queue = make_queue()
+    queue.start()
+    monkeypatch.setattr("app.routes.chat.write_behind", queue)
+
+    response = client.post(
+        "/api/chat/send",
+        json={"message": "Mon employeur ne me paie plus", "fast_mode": True},
+        headers=headers
+    )
+    assert response.status_code == 200
+    conversation_id = response.json()["conversation_id"]
+
+    # Le détail attend l'insertion de la réponse journalisée
+    detail = client.get(f"/api/chat/conversations/{conversation_id}", headers=headers).json()
+    assert [m["role"] for m in detail["messages"]] == ["user", "assistant"]
+    assert db.get(WriteBehindCheckpoint, queue.slot).seq == 1
@@ -0,0 +1,116 @@
+"""
+Tests pour le chat en temps réel (WebSocket)
+"""
+import pytest
+from starlette.websockets import WebSocketDisconnect
+
+from app.ai_engine import LLM_MAX_CONCURRENCY, AIEngine
+from app.auth import create_access_token, get_password_hash
+from app.fake_llm import FAKE_ANSWER, FakeMistral
+from app.models import Message, User
+
+
+@pytest.fixture
+def token(db):
+    user = User(email="ws@syflai.com", username="ws", hashed_password=get_password_hash("Test123456"))
+    db.add(user)
+    db.commit()
+    return create_access_token(data={"sub": user.email})
+
+
+def _engine(monkeypatch, token_ms: float) -> AIEngine:
+    engine = AIEngine(api_key="", model="fake-model", client=FakeMistral(latency_ms=0, jitter=0, token_ms=token_ms))
+    monkeypatch.setattr("app.routes.chat.ai_engine", engine)
+    return engine
+
+
+def _until_done(ws, request_ids):
+    """Trames reçues jusqu'à la fin de toutes les demandes, par identifiant"""
+    frames = {request_id: [] for request_id in request_ids}
+    pending = set(request_ids)
+    while pending:
+        frame = ws.receive_json()
+        frames[frame["id"]].append(frame)
+        if frame["type"] in ("done", "error"):
+            pending.discard(frame["id"])
+    return frames
+
+
+def _text(frames) -> str:
+    return "".join(frame["delta"] for frame in frames if frame["type"] == "token")
+
+
+def test_invalid_token_closes_connection(client):
+    with pytest.raises(WebSocketDisconnect) as exc_info:
+        with client.websocket_connect("/ws/chat") as ws:
+            ws.send_json({"type": "auth", "token": "pas-un-token"})
+            ws.receive_json()
+    assert exc_info.value.code == 1008
+
+
+def test_fast_mode_reply_is_streamed_and_saved(client, db, token):
+    with client.websocket_connect(f"/ws/chat?token={token}") as ws:
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"type": "send", "id": "r1", "message": "Mon employeur ne me paie plus", "fast_mode": True})
+        frames = _until_done(ws, ["r1"])["r1"]
+
+    assert [frames[0]["type"], frames[-1]["type"]] == ["start", "done"]
+    assert frames[-1]["source"] == "knowledge_base"
+    assert frames[-1]["cancelled"] is False
+    conversation_id = frames[0]["conversation_id"]
+    messages = db.query(Message).filter(Message.conversation_id == conversation_id).order_by(Message.id).all()
+    assert [m.role for m in messages] == ["user", "assistant"]
+    assert messages[1].content == _text(frames)
+
+
+def test_conversations_multiplexed_on_one_connection(client, db, token, monkeypatch):
+    _engine(monkeypatch, token_ms=1)
+    # Authentification par la première trame
+    with client.websocket_connect("/ws/chat") as ws:
+        ws.send_json({"type": "auth", "token": token})
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"type": "send", "id": "a", "message": "Je n'ai pas reçu mon salaire"})
+        ws.send_json({"type": "send", "id": "b", "message": "J'ai été licencié sans préavis"})
+        ws.send_json({"type": "ping"})
+        frames = {}
+        pending = {"a", "b"}
+        while pending:
+            frame = ws.receive_json()
+            if frame["type"] == "pong":
+                continue
+            frames.setdefault(frame["id"], []).append(frame)
+            if frame["type"] == "done":
+                pending.discard(frame["id"])
+
+    conversation_ids = {frames[request_id][0]["conversation_id"] for request_id in "ab"}
+    assert len(conversation_ids) == 2
+    for request_id in "ab":
+        assert _text(frames[request_id]) == FAKE_ANSWER
+        assert frames[request_id][-1]["source"] == "llm"
+    replies = db.query(Message).filter(Message.role == "assistant").all()
+    assert sorted(m.conversation_id for m in replies) == sorted(conversation_ids)
+    assert {m.model for m in replies} == {"fake-model"}
+
+
+def test_cancel_frees_llm_slot(client, db, token, monkeypatch):
+    engine = _engine(monkeypatch, token_ms=50)
+    monkeypatch.setattr("app.routes.ws.WS_MAX_GENERATIONS", 1)
+    with client.websocket_connect("/ws/chat", headers={"Authorization": f"Bearer {token}"}) as ws:
+        assert ws.receive_json()["type"] == "ready"
+        ws.send_json({"type": "send", "id": "long", "message": "Heures supplémentaires non payées"})
+        assert ws.receive_json()["type"] == "start"
+        assert ws.receive_json()["type"] == "token"
+
+        # Une seule génération par connexion ici
+        ws.send_json({"type": "send", "id": "second", "message": "Autre question", "fast_mode": True})
+        busy = ws.receive_json()
+        assert (busy["id"], busy["code"]) == ("second", "busy")
+
+        ws.send_json({"type": "cancel", "id": "long"})
+        frames = _until_done(ws, ["long"])["long"]
+        assert frames[-1]["cancelled"] is True
+
+    assert engine._slots._value == LLM_MAX_CONCURRENCY
+    reply = db.query(Message).filter(Message.role == "assistant").one()
+    assert reply.extra_data == {"cancelled": True}
+    assert 0 < len(reply.content) < len(FAKE_ANSWER)